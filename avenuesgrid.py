@@ -1,12 +1,33 @@
+import bisect
+from collections import deque
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from enum import IntEnum
 import math
 import random
 
+import numpy as np
+
 from heatmap import HeatMap
-from utils import Vec2, Vec2Direction
+from instrumentation import EventLog, Instrumentation
+from utils import DIRECTION_OFFSETS, LEFT_OF, RIGHT_OF, Vec2, Vec2Direction
 from worldsettings import WorldSettings
 
 
+# Bits of a vertex in AvenuesGrid.junctions
+JUNCTION_UP = 1
+JUNCTION_RIGHT = 2
+JUNCTION_BOTTOM = 4
+JUNCTION_LEFT = 8
+INTERSECTION = 16
+
+# Junction set on the intersection reached by moving in a direction (indexed by Vec2Direction)
+FROM_DIRECTION_JUNCTION = (JUNCTION_BOTTOM, JUNCTION_RIGHT, JUNCTION_UP, JUNCTION_LEFT)
+# Junction set on the intersection left in a direction (indexed by Vec2Direction)
+TO_DIRECTION_JUNCTION = (JUNCTION_UP, JUNCTION_LEFT, JUNCTION_BOTTOM, JUNCTION_RIGHT)
+
+
 class AvenuesGrid:
     """
     AvenuesGrid
@@ -16,169 +37,587 @@ class AvenuesGrid:
     Each vertex of the grid has an id and can be an avenue intersection.
     Id starts at 0 for the top left vertex and is assigned following the left-right, top-bottom order.
 
-    The intersections are stored in the intersections property, which is a dict of Id->AvenueIntersection.
-    If the dict has a key for the id of a given vertex, there is an intersection at this vertex.
-    The AvenueIntersection describe the junctions with the next intersection in the 4 directions.
+    The intersections are stored in the junctions property, a matrix of uint8 of one element per vertex (junctions[y][x]).
+    The INTERSECTION bit is set if there is an intersection at this vertex, and the JUNCTION_* bits
+    describe the junctions with the next intersection in the 4 directions.
+
+    The intersections property is a dict like view of Id->AvenueIntersection over the junctions matrix.
+    If the view has a key for the id of a given vertex, there is an intersection at this vertex.
+    The AvenueIntersection values read and write the junctions matrix (see JunctionsIntersection).
     """
+    class Engine(IntEnum):
+        QUEUE = 0
+        FRONTIER = 1
+
     @dataclass
     class AvenueBuildOrder:
         intersection_coord: Vec2
         from_direction: Vec2Direction
 
-    def __init__(self, world_settings: WorldSettings, heatmap: HeatMap) -> None:
+    def __init__(self, world_settings: WorldSettings, heatmap: HeatMap, rng: random.Random = None) -> None:
         self.world_settings = world_settings
         self.heatmap = heatmap
+        self.rng = rng if rng is not None else random
         self.heat_factor = 1.3
-        self.intersections: dict[int, AvenueIntersection] = dict()
+        self.junctions = np.zeros((world_settings.grid_settings.height + 1, world_settings.grid_settings.width + 1), dtype=np.uint8)
+        self._obstacle_index: ObstacleIndex = None
+        self._region: "tuple[int, int, int, int]" = None
+        # Vertices seen by the cold vertices of the region when they look for obstacles (the region by default)
+        self._search_bounds: "tuple[int, int, int, int]" = None
+
+    @property
+    def intersections(self) -> "IntersectionsView":
+        return IntersectionsView(self.junctions)
+
+    def mask(self, bits: int) -> np.ndarray:
+        """Returns a matrix of booleans, True for the vertices having one of the given bits"""
+        return (self.junctions & bits) != 0
+
+    def vertex_heats(self, bounds: "tuple[int, int, int, int]" = None) -> np.ndarray:
+        """
+        Returns the heat of each vertex of the grid as a matrix (vertex_heats[y][x]),
+        or only of the vertices of bounds (min x, min y, max x, max y included) as a matrix vertex_heats[y - min y][x - min x].
+        """
+        grid_settings = self.world_settings.grid_settings
+        min_x, min_y, max_x, max_y = bounds if bounds is not None else self._grid_bounds()
+        xs = np.arange(min_x, max_x + 1) * grid_settings.cellsize + grid_settings.offset.x
+        ys = np.arange(min_y, max_y + 1) * grid_settings.cellsize + grid_settings.offset.y
+        return self.heatmap.sample(xs[np.newaxis, :], ys[:, np.newaxis])
 
     def from_grid_to_index(self, position: Vec2) -> int:
-        """Returns the index in self.intersections for the given position of a vertex in the grid"""
+        """Returns the index in self.intersections (junctions.flat) for the given position of a vertex in the grid"""
         vertices_x_count = self.world_settings.grid_settings.width + 1
         vertices_y_count = self.world_settings.grid_settings.height + 1
         if position.x < 0 or position.x >= vertices_x_count or position.y < 0 or position.y >= vertices_y_count:
             raise ValueError(f"Vertex in grid out of bound {position.x}:{position.y}")
         return position.y * vertices_x_count + position.x
 
-    def generate(self) -> None:
+    def generate(self, engine: Engine = Engine.QUEUE) -> None:
         """
-        Generates the avenues and fillup the intersections dict.
+        Generates the avenues and fillup the junctions matrix.
 
         See the avenues generation process in the README for more details.
+
+        engine selects how the build orders following the main avenues are processed:
+        QUEUE handles them one by one, FRONTIER handles each level of the growth as a batch of arrays.
+        """
+        with self.world_settings.instrumentation.stage("avenues"):
+            av_build_orders = self._generate_main_avenues()
+            self._grow(av_build_orders, engine)
+
+    def generate_parallel(self, workers: int = None, engine: Engine = Engine.QUEUE) -> None:
+        """
+        Same as generate, but the avenues of the 4 quadrants around the main avenues grow in a pool of
+        worker processes (up to 4, one per core by default).
+
+        Growing avenues stop on the intersections of the main avenues, so each quadrant grows on its own,
+        bounded by the main avenues, with a random generator seeded from self.rng (4 seeds drawn after the main avenues).
+        The junctions of the quadrants are merged with a bitwise or: the only shared vertices are on the main avenues,
+        where each quadrant only adds its junctions. The result only depends on self.rng, not on the number of workers,
+        but it differs from generate, whose single random generator is shared by the quadrants.
+        """
+        instrumentation = self.world_settings.instrumentation
+        with instrumentation.stage("avenues"):
+            av_build_orders = self._generate_main_avenues()
+            center_x = math.floor(self.world_settings.grid_settings.width / 2)
+            center_y = math.floor(self.world_settings.grid_settings.height / 2)
+            _, _, max_x, max_y = self._grid_bounds()
+            # Quadrants bounds include the main avenues, so the growing avenues can join them
+            quadrants = [
+                (0, 0, center_x, center_y), (center_x, 0, max_x, center_y),
+                (0, center_y, center_x, max_y), (center_x, center_y, max_x, max_y)
+            ]
+            quadrants_orders: "list[list[tuple[int, int, int]]]" = [[] for _ in quadrants]
+            for order in av_build_orders:
+                position = order.intersection_coord
+                quadrant = (position.x >= center_x) + 2 * (position.y >= center_y)
+                quadrants_orders[quadrant].append((position.x, position.y, int(order.from_direction)))
+            tasks = [(region, orders, self.rng.getrandbits(64)) for region, orders in zip(quadrants, quadrants_orders)]
+
+            grid_settings = self.world_settings.grid_settings
+            sources = (self.world_settings.width, self.world_settings.height, grid_settings, self.heatmap.grid,
+                       self.junctions, self.heat_factor, engine, instrumentation.enabled)
+            max_workers = min(workers, len(tasks)) if workers is not None else None
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_growth_worker, initargs=(sources,)) as executor:
+                for (x0, y0, x1, y1), (block, counters) in zip(quadrants, executor.map(_grow_quadrant, tasks)):
+                    self.junctions[y0:y1 + 1, x0:x1 + 1] |= block
+                    for name, value in counters.items():
+                        instrumentation.count(name, value)
+            self._obstacle_index = None
+
+    def _grow(self, av_build_orders: "list[AvenueBuildOrder]", engine: Engine) -> None:
+        if engine == AvenuesGrid.Engine.FRONTIER:
+            self._generate_avenues_frontier(av_build_orders)
+        else:
+            self._generate_avenues(av_build_orders)
+
+    def regenerate_region(self, x0: int, y0: int, x1: int, y1: int, engine: Engine = Engine.QUEUE) -> "tuple[int, int, int, int]":
+        """
+        Generates again the avenues of the vertices from x0:y0 to x1:y1 (included, clipped to the grid),
+        ex: after an edit of the heat map. Returns the clipped region.
+
+        The avenues entering the region from the vertices around it (ports) and the main avenues crossing it are kept,
+        the main avenues branch again and the avenues grow again from the ports and the branches with the usual rules,
+        but only inside the region:
+            - the cold vertices look for their obstacles over the whole grid, including the intersections outside of the region,
+            - an avenue only leaves the region to join the intersection of the vertex outside, which gets the junction back,
+              so the vertices outside of the region only get the junctions of these avenues.
+        """
+        min_x, min_y, max_x, max_y = self._grid_bounds()
+        x0, y0, x1, y1 = max(x0, min_x), max(y0, min_y), min(x1, max_x), min(y1, max_y)
+        if x0 > x1 or y0 > y1:
+            return x0, y0, x1, y1
+        region = self.junctions[y0:y1 + 1, x0:x1 + 1]
+        av_build_orders: "list[AvenuesGrid.AvenueBuildOrder]" = []
+        # Ports: junctions of the vertices around the region going into it
+        sides = []
+        if x0 > min_x:
+            sides.append((self.junctions[y0:y1 + 1, x0 - 1], JUNCTION_RIGHT, lambda k: Vec2(x0, y0 + k), Vec2Direction.RIGHT))
+        if x1 < max_x:
+            sides.append((self.junctions[y0:y1 + 1, x1 + 1], JUNCTION_LEFT, lambda k: Vec2(x1, y0 + k), Vec2Direction.LEFT))
+        if y0 > min_y:
+            sides.append((self.junctions[y0 - 1, x0:x1 + 1], JUNCTION_BOTTOM, lambda k: Vec2(x0 + k, y0), Vec2Direction.DOWN))
+        if y1 < max_y:
+            sides.append((self.junctions[y1 + 1, x0:x1 + 1], JUNCTION_UP, lambda k: Vec2(x0 + k, y1), Vec2Direction.UP))
+        for neighbours, junction, position_of, direction in sides:
+            for k in np.flatnonzero(neighbours & junction).tolist():
+                av_build_orders.append(AvenuesGrid.AvenueBuildOrder(position_of(k), direction))
+
+        region[:] = 0
+        self._obstacle_index = None
+        self._region = (x0, y0, x1, y1)
+        self._search_bounds = (min_x, min_y, max_x, max_y)
+        try:
+            av_build_orders += self._regenerate_main_avenues()
+            self._grow(av_build_orders, engine)
+            self._connect_region()
+        finally:
+            self._region = None
+            self._search_bounds = None
+            self._obstacle_index = None
+        return x0, y0, x1, y1
+
+    def _connect_region(self) -> None:
+        """
+        Joins the avenues of the regenerated region which are not connected to each other around the region:
+        avenues growing from different ports may not meet, while the ports may only be connected through the region.
+        The vertices of the region and the ports (the vertices around it) are labelled by connected component,
+        then the shortest path between the first component and another one through the vertices of the region
+        is built as an avenue, until all the components are joined.
+        """
+        x0, y0, x1, y1 = self._region
+        min_x, min_y, max_x, max_y = self._grid_bounds()
+        # Window of the region and the vertices around it, in window coords
+        wx0, wy0 = max(x0 - 1, min_x), max(y0 - 1, min_y)
+        window = self.junctions[wy0:min(y1 + 1, max_y) + 1, wx0:min(x1 + 1, max_x) + 1]
+        region = (x0 - wx0, y0 - wy0, x1 - wx0, y1 - wy0)
+        while True:
+            labels = self._label_components(window)
+            region_labels = labels[region[1]:region[3] + 1, region[0]:region[2] + 1]
+            components = np.unique(region_labels[region_labels >= 0])
+            if components.size <= 1:
+                return
+            path = self._shortest_path(labels, region, int(components[0]))
+            for (x, y), (next_x, next_y) in zip(path, path[1:]):
+                direction = DIRECTION_OFFSETS.index((next_x - x, next_y - y))
+                window[y, x] |= INTERSECTION | TO_DIRECTION_JUNCTION[direction]
+                window[next_y, next_x] |= INTERSECTION | FROM_DIRECTION_JUNCTION[direction]
+
+    @staticmethod
+    def _label_components(window: np.ndarray) -> np.ndarray:
+        """Returns the connected component of each intersection of the junctions of window (-1 if no intersection)"""
+        labels = np.full(window.shape, -1, dtype=np.intp)
+        height, width = window.shape
+        component = 0
+        for y, x in zip(*np.nonzero(window & INTERSECTION)):
+            if labels[y, x] >= 0:
+                continue
+            labels[y, x] = component
+            stack = [(int(x), int(y))]
+            while stack:
+                x, y = stack.pop()
+                for direction in Vec2Direction:
+                    offset_x, offset_y = DIRECTION_OFFSETS[direction]
+                    next_x, next_y = x + offset_x, y + offset_y
+                    if window[y, x] & TO_DIRECTION_JUNCTION[direction] and 0 <= next_x < width and 0 <= next_y < height \
+                            and window[next_y, next_x] & INTERSECTION and labels[next_y, next_x] < 0:
+                        labels[next_y, next_x] = component
+                        stack.append((next_x, next_y))
+            component += 1
+        return labels
+
+    @staticmethod
+    def _shortest_path(labels: np.ndarray, region: "tuple[int, int, int, int]", component: int) -> "list[tuple[int, int]]":
+        """
+        Returns the vertices (x, y) of the shortest path through the vertices of region (window coords)
+        from a vertex of component to a vertex of another component (breadth first search)
         """
-        av_build_orders = self._generate_main_avenues()
-        self._generate_avenues(av_build_orders)
+        min_x, min_y, max_x, max_y = region
+        previous: "dict[tuple[int, int], tuple[int, int]]" = {}
+        queue: "deque[tuple[int, int]]" = deque()
+        for y, x in zip(*np.nonzero(labels[min_y:max_y + 1, min_x:max_x + 1] == component)):
+            position = (int(x) + min_x, int(y) + min_y)
+            previous[position] = None
+            queue.append(position)
+        while queue:
+            x, y = position = queue.popleft()
+            if labels[y, x] >= 0 and labels[y, x] != component:
+                path = []
+                while position is not None:
+                    path.append(position)
+                    position = previous[position]
+                return path[::-1]
+            for offset_x, offset_y in DIRECTION_OFFSETS:
+                next_position = (x + offset_x, y + offset_y)
+                if min_x <= next_position[0] <= max_x and min_y <= next_position[1] <= max_y and next_position not in previous:
+                    previous[next_position] = position
+                    queue.append(next_position)
+        raise ValueError(f"No path from the component {component} in the region")
+
+    def _regenerate_main_avenues(self) -> "list[AvenueBuildOrder]":
+        """Rebuilds the main avenues inside the region, returns the build orders of their branches"""
+        min_x, min_y, max_x, max_y = self._bounds()
+        center = Vec2(math.floor(self.world_settings.grid_settings.width / 2),
+                      math.floor(self.world_settings.grid_settings.height / 2))
+        av_build_orders: "list[AvenuesGrid.AvenueBuildOrder]" = []
+        main_positions: "list[tuple[Vec2, Vec2Direction]]" = []
+        if min_x <= center.x <= max_x:
+            main_positions += [(Vec2(center.x, y), Vec2Direction.UP if y < center.y else Vec2Direction.DOWN) for y in range(min_y, max_y + 1) if y != center.y]
+        if min_y <= center.y <= max_y:
+            main_positions += [(Vec2(x, center.y), Vec2Direction.LEFT if x < center.x else Vec2Direction.RIGHT) for x in range(min_x, max_x + 1) if x != center.x]
+        if not self._is_out(center):
+            self._create_or_update_intersection(center, [Vec2Direction.UP, Vec2Direction.RIGHT, Vec2Direction.DOWN, Vec2Direction.LEFT])
+
+        for position, direction in main_positions:
+            worldpos = self.world_settings.from_grid_to_world(position)
+            current_heat = self.heatmap.heat_at(worldpos.x, worldpos.y)
+            junctions_from_direction = [direction, Vec2.reverse(direction)]
+            for side_dir in (Vec2.left_of(direction), Vec2.right_of(direction)):
+                if self.rng.random() <= current_heat * self.heat_factor and not self._is_blocked(position.x, position.y, side_dir):
+                    junctions_from_direction.append(Vec2.reverse(side_dir))
+                    av_build_orders.append(AvenuesGrid.AvenueBuildOrder(position + Vec2.from_direction(side_dir), side_dir))
+            self._create_or_update_intersection(position, junctions_from_direction)
+        return av_build_orders
 
     def _create_or_update_intersection(self, position: Vec2, from_directions: "list[Vec2Direction]") -> None:
         index = self.from_grid_to_index(position)
-        intersection = self.intersections[index] if index in self.intersections else AvenueIntersection()
-
+        bits = INTERSECTION
         for from_direction in from_directions:
-            if from_direction == Vec2Direction.UP:
-                intersection.bottomjunction = True
-            elif from_direction == Vec2Direction.RIGHT:
-                intersection.leftjunction = True
-            elif from_direction == Vec2Direction.DOWN:
-                intersection.upjunction = True
-            elif from_direction == Vec2Direction.LEFT:
-                intersection.rightjunction = True
+            bits |= FROM_DIRECTION_JUNCTION[from_direction]
+        self._set_bits(index, position.x, position.y, bits)
+
+    def _set_bits(self, index: int, x: int, y: int, bits: int) -> None:
+        """Sets the bits (including INTERSECTION) of the vertex x:y at index in junctions.flat"""
+        flat_junctions = self.junctions.reshape(-1)
+        if self._obstacle_index is not None and not flat_junctions[index] & INTERSECTION:
+            self._obstacle_index.add_intersection(x, y)
+        flat_junctions[index] |= bits
 
-        self.intersections[index] = intersection
+    def _has_intersection(self, index: int) -> bool:
+        return self.junctions.flat[index] & INTERSECTION != 0
 
     def _generate_main_avenues(self) -> "list[AvenueBuildOrder]":
-        center = Vec2(math.floor(self.world_settings.grid_settings.width / 2),
-                      math.floor(self.world_settings.grid_settings.height / 2))
-        print(f"Grid center: {center.x}:{center.y}")
+        grid_settings = self.world_settings.grid_settings
+        center = Vec2(math.floor(grid_settings.width / 2), math.floor(grid_settings.height / 2))
+        instrumentation = self.world_settings.instrumentation
+        instrumentation.info("avenues", f"Grid center: {center.x}:{center.y}", center_x=center.x, center_y=center.y)
         self._create_or_update_intersection(center, [Vec2Direction.UP, Vec2Direction.RIGHT, Vec2Direction.DOWN, Vec2Direction.LEFT])
 
-        main_av_build_orders: "list[AvenuesGrid.AvenueBuildOrder]" = []
-        main_av_build_orders.append(AvenuesGrid.AvenueBuildOrder(center + Vec2.from_direction(Vec2Direction.UP), Vec2Direction.UP))
-        main_av_build_orders.append(AvenuesGrid.AvenueBuildOrder(center + Vec2.from_direction(Vec2Direction.DOWN), Vec2Direction.DOWN))
-        main_av_build_orders.append(AvenuesGrid.AvenueBuildOrder(center + Vec2.from_direction(Vec2Direction.LEFT), Vec2Direction.LEFT))
-        main_av_build_orders.append(AvenuesGrid.AvenueBuildOrder(center + Vec2.from_direction(Vec2Direction.RIGHT), Vec2Direction.RIGHT))
+        vertices_x_count = grid_settings.width + 1
+        heats = self.vertex_heats().reshape(-1)
+        main_av_build_orders: "deque[tuple[int, int, Vec2Direction]]" = deque()
+        for direction in (Vec2Direction.UP, Vec2Direction.DOWN, Vec2Direction.LEFT, Vec2Direction.RIGHT):
+            offset_x, offset_y = DIRECTION_OFFSETS[direction]
+            main_av_build_orders.append((center.x + offset_x, center.y + offset_y, direction))
 
         av_build_orders: "list[AvenuesGrid.AvenueBuildOrder]" = []
 
-        while len(main_av_build_orders) > 0:
-            build_order = main_av_build_orders.pop(0)
-            position = build_order.intersection_coord
-            direction = build_order.from_direction
+        main_build_orders_count = 0
+        while main_av_build_orders:
+            main_build_orders_count += 1
+            x, y, direction = main_av_build_orders.popleft()
+            if x < 0 or x > grid_settings.width or y < 0 or y > grid_settings.height:
+                raise ValueError(f"Vertex in grid out of bound {x}:{y}")
+            index = y * vertices_x_count + x
 
             # Branch left and right decision
-            worldpos = self.world_settings.from_grid_to_world(position)
-            current_heat = self.heatmap.heatmap[worldpos.y][worldpos.x]
-            have_left = random.random() <= current_heat * self.heat_factor
-            have_right = random.random() <= current_heat * self.heat_factor
-
-            junctions_from_direction = [direction, Vec2.reverse(direction)]
+            current_heat = float(heats[index]) * self.heat_factor
+            have_left = self.rng.random() <= current_heat
+            have_right = self.rng.random() <= current_heat
 
+            bits = INTERSECTION | FROM_DIRECTION_JUNCTION[direction] | TO_DIRECTION_JUNCTION[direction]
             if have_left:
-                left_dir = Vec2.left_of(direction)
-                junctions_from_direction.append(Vec2.reverse(left_dir))
-                av_build_orders.append(AvenuesGrid.AvenueBuildOrder(position + Vec2.from_direction(left_dir), left_dir))
+                left_dir = LEFT_OF[direction]
+                bits |= TO_DIRECTION_JUNCTION[left_dir]
+                offset_x, offset_y = DIRECTION_OFFSETS[left_dir]
+                av_build_orders.append(AvenuesGrid.AvenueBuildOrder(Vec2(x + offset_x, y + offset_y), left_dir))
             if have_right:
-                right_dir = Vec2.right_of(direction)
-                junctions_from_direction.append(Vec2.reverse(right_dir))
-                av_build_orders.append(AvenuesGrid.AvenueBuildOrder(position + Vec2.from_direction(right_dir), right_dir))
+                right_dir = RIGHT_OF[direction]
+                bits |= TO_DIRECTION_JUNCTION[right_dir]
+                offset_x, offset_y = DIRECTION_OFFSETS[right_dir]
+                av_build_orders.append(AvenuesGrid.AvenueBuildOrder(Vec2(x + offset_x, y + offset_y), right_dir))
 
-            self._create_or_update_intersection(position, junctions_from_direction)
+            self._set_bits(index, x, y, bits)
 
-            if not (position.x == 0 or position.x == self.world_settings.grid_settings.width or position.y == 0 or position.y == self.world_settings.grid_settings.height):
+            if not (x == 0 or x == grid_settings.width or y == 0 or y == grid_settings.height):
                 # if not on edge, continue the build process
-                main_av_build_orders.append(AvenuesGrid.AvenueBuildOrder(position + Vec2.from_direction(direction), direction))
+                offset_x, offset_y = DIRECTION_OFFSETS[direction]
+                main_av_build_orders.append((x + offset_x, y + offset_y, direction))
 
+        instrumentation.count("main_build_orders", main_build_orders_count)
         return av_build_orders
 
+    def _bounds(self) -> "tuple[int, int, int, int]":
+        """Returns the vertices where avenues can be built: min x, min y, max x, max y (included)"""
+        return self._region if self._region is not None else self._grid_bounds()
+
+    def _grid_bounds(self) -> "tuple[int, int, int, int]":
+        return 0, 0, self.world_settings.grid_settings.width, self.world_settings.grid_settings.height
+
     def _is_out(self, position: Vec2) -> bool:
-        return position.x < 0 or position.x > self.world_settings.grid_settings.width or position.y < 0 or position.y > self.world_settings.grid_settings.height
+        min_x, min_y, max_x, max_y = self._bounds()
+        return position.x < min_x or position.x > max_x or position.y < min_y or position.y > max_y
 
-    def _get_best_build_direction(self, build_directions: "list[Vec2Direction]", position: Vec2) -> Vec2Direction:
+    def _is_blocked(self, x: int, y: int, direction: Vec2Direction) -> bool:
+        """
+        Returns True if an avenue can't be built from the vertex x:y in direction: the next vertex is out of the bounds,
+        in the grid and without intersection (avenues only leave the region of regenerate_region to join an intersection)
+        """
+        offset_x, offset_y = DIRECTION_OFFSETS[direction]
+        next_x, next_y = x + offset_x, y + offset_y
+        min_x, min_y, max_x, max_y = self._bounds()
+        if min_x <= next_x <= max_x and min_y <= next_y <= max_y:
+            return False
+        grid_min_x, grid_min_y, grid_max_x, grid_max_y = self._grid_bounds()
+        if next_x < grid_min_x or next_x > grid_max_x or next_y < grid_min_y or next_y > grid_max_y:
+            return False
+        return not self.junctions[next_y, next_x] & INTERSECTION
+
+    def _get_best_build_direction(self, build_directions: "list[Vec2Direction]", x: int, y: int) -> Vec2Direction:
         # In case of same distance: priority
         #   - high heat
         #   - another avenue
         #   - map edge
-        best_distances = [[build_direction, None, None] for build_direction in build_directions]
-        for best_distance in best_distances:
-            build_dir = Vec2.from_direction(best_distance[0])
-            current_dist = 1
-            current_pos = position + build_dir
-            while not self._is_out(current_pos):
-                world_pos = self.world_settings.from_grid_to_world(current_pos)
-                index = self.from_grid_to_index(current_pos)
-                if self.heatmap.heatmap[world_pos.y][world_pos.x] > 0:
-                    best_distance[1] = 1
-                    best_distance[2] = current_dist
-                    break
-                if index in self.intersections:
-                    best_distance[1] = 2
-                    best_distance[2] = current_dist
-                    break
-                current_dist += 1
-                current_pos += build_dir
-            if best_distance[2] is None:
-                best_distance[1] = 3
-                best_distance[2] = current_dist
-
-        return sorted(best_distances, key=lambda dist: (dist[2], dist[1]))[0][0]
+        if self._obstacle_index is None:
+            self._obstacle_index = self._create_obstacle_index()
+        best_distances = [
+            self._obstacle_index.distance(x, y, build_direction) + (order,)
+            for order, build_direction in enumerate(build_directions)
+        ]
+        return build_directions[min(best_distances)[2]]
+
+    def _create_obstacle_index(self) -> "ObstacleIndex":
+        min_x, min_y, max_x, max_y = region = self._bounds()
+        if self._search_bounds is None:
+            # Obstacles out of the bounds are farther than the edge, only the vertices of the bounds are indexed
+            intersections = (self.junctions[min_y:max_y + 1, min_x:max_x + 1] & INTERSECTION) != 0
+            return ObstacleIndex(self.vertex_heats(region) > 0, intersections, region)
+        # Only the rows and the columns crossing the region are indexed, over the search bounds
+        search_min_x, search_min_y, search_max_x, search_max_y = self._search_bounds
+        lines = ((search_min_x, min_y, search_max_x, max_y), (min_x, search_min_y, max_x, search_max_y))
+        hot = tuple(self.vertex_heats(bounds) > 0 for bounds in lines)
+        intersections = tuple((self.junctions[y0:y1 + 1, x0:x1 + 1] & INTERSECTION) != 0 for x0, y0, x1, y1 in lines)
+        return ObstacleIndex(hot, intersections, self._search_bounds, region)
 
     def _generate_avenues(self, av_build_orders: "list[AvenueBuildOrder]") -> None:
-        while len(av_build_orders) > 0:
-            build_order = av_build_orders.pop(0)
-            position = build_order.intersection_coord
-            if self._is_out(position):
+        # Build orders are queued as (x, y, direction) tuples and vertices are read by their index in junctions.flat
+        vertices_x_count = self.world_settings.grid_settings.width + 1
+        min_x, min_y, max_x, max_y = bounds = self._bounds()
+        _, _, grid_max_x, grid_max_y = self._grid_bounds()
+        # Vertices of the edges of a region inside the grid, whose avenues may leave the region
+        region_edges = (min_x > 0, min_y > 0, max_x < grid_max_x, max_y < grid_max_y)
+        flat_junctions = self.junctions.reshape(-1)
+        # Heats of the vertices of the bounds only (the region of regenerate_region)
+        heats = self.vertex_heats(bounds).reshape(-1)
+        heats_x_count = max_x - min_x + 1
+        rng_random = self.rng.random
+        heat_factor = self.heat_factor
+        queue: "deque[tuple[int, int, Vec2Direction]]" = deque(
+            (order.intersection_coord.x, order.intersection_coord.y, order.from_direction) for order in av_build_orders
+        )
+        build_orders_count = 0
+        created_count = 0
+        direction_searches_count = 0
+        while queue:
+            x, y, direction = queue.popleft()
+            build_orders_count += 1
+            if x < min_x or x > max_x or y < min_y or y > max_y:
+                if 0 <= x <= grid_max_x and 0 <= y <= grid_max_y and flat_junctions[y * vertices_x_count + x] & INTERSECTION:
+                    # Avenue leaving the region, it joins the intersection outside
+                    flat_junctions[y * vertices_x_count + x] |= FROM_DIRECTION_JUNCTION[direction]
                 continue
-            direction = build_order.from_direction
-            index = self.from_grid_to_index(position)
-            intersection_exists = index in self.intersections
+            index = y * vertices_x_count + x
 
-            if intersection_exists:
+            if flat_junctions[index] & INTERSECTION:
                 # Just update the junction, no need to generate new build order, it was already been done before
-                self._create_or_update_intersection(position, [direction])
+                flat_junctions[index] |= FROM_DIRECTION_JUNCTION[direction]
+                continue
+
+            # Create the new intersection and generate build orders
+            created_count += 1
+            bits = INTERSECTION | FROM_DIRECTION_JUNCTION[direction]
+            current_heat = float(heats[(y - min_y) * heats_x_count + x - min_x])
+            all_build_directions = (direction, LEFT_OF[direction], RIGHT_OF[direction])
+            build_directions = all_build_directions
+            if (x == min_x and region_edges[0]) or (y == min_y and region_edges[1]) or (x == max_x and region_edges[2]) or (y == max_y and region_edges[3]):
+                build_directions = tuple(build_dir for build_dir in all_build_directions if not self._is_blocked(x, y, build_dir))
+
+            if current_heat > 0:
+                build_heat = current_heat * heat_factor
+                selected_build_directions = [build_dir for build_dir in all_build_directions if rng_random() <= build_heat]
+                if build_directions is not all_build_directions:
+                    selected_build_directions = [build_dir for build_dir in selected_build_directions if build_dir in build_directions]
+                if len(selected_build_directions) == 0 and build_directions:
+                    selected_build_directions.append(self.rng.choice(build_directions))
+            elif build_directions:
+                direction_searches_count += 1
+                selected_build_directions = [self._get_best_build_direction(build_directions, x, y)]
             else:
-                # Create the new intersection and generate build orders
-                junctions_directions = [direction]
-                worldpos = self.world_settings.from_grid_to_world(position)
-                current_heat = self.heatmap.heatmap[worldpos.y][worldpos.x]
-                all_build_directions = [direction, Vec2.left_of(direction), Vec2.right_of(direction)]
-
-                if current_heat > 0:
-                    selected_build_directions = [build_dir for build_dir in all_build_directions if random.random() <= current_heat * self.heat_factor]
-                    if len(selected_build_directions) == 0:
-                        selected_build_directions.append(random.choice(all_build_directions))
-                    for build_dir in selected_build_directions:
-                        junctions_directions.append(Vec2.reverse(build_dir))
-                        av_build_orders.append(AvenuesGrid.AvenueBuildOrder(
-                            position + Vec2.from_direction(build_dir),
-                            build_dir
-                        ))
-                else:
-                    build_dir = self._get_best_build_direction(all_build_directions, position)
-                    junctions_directions.append(Vec2.reverse(build_dir))
-                    av_build_orders.append(AvenuesGrid.AvenueBuildOrder(
-                        position + Vec2.from_direction(build_dir),
-                        build_dir
-                    ))
-
-                self._create_or_update_intersection(position, junctions_directions)
+                selected_build_directions = []
+            for build_dir in selected_build_directions:
+                bits |= TO_DIRECTION_JUNCTION[build_dir]
+                offset_x, offset_y = DIRECTION_OFFSETS[build_dir]
+                queue.append((x + offset_x, y + offset_y, build_dir))
+
+            self._set_bits(index, x, y, bits)
+
+        self._count_growth(build_orders_count, created_count, direction_searches_count)
+
+    def _count_growth(self, build_orders_count: int, created_count: int, direction_searches_count: int) -> None:
+        instrumentation = self.world_settings.instrumentation
+        instrumentation.count("build_orders", build_orders_count)
+        instrumentation.count("intersections_created", created_count)
+        instrumentation.count("direction_searches", direction_searches_count)
+        # Queries of the obstacle index since the last growth (the index is created by the first search)
+        obstacle_queries_count = 0
+        if self._obstacle_index is not None:
+            obstacle_queries_count = self._obstacle_index.queries
+            self._obstacle_index.queries = 0
+        instrumentation.count("obstacle_queries", obstacle_queries_count)
+
+    def _generate_avenues_frontier(self, av_build_orders: "list[AvenueBuildOrder]") -> None:
+        """
+        Same generation rules than _generate_avenues, but the build orders of a level of the growth (the frontier)
+        are processed at once as arrays of positions and directions:
+            - orders on existing intersections only update their junction,
+            - the first order on a new vertex creates the intersection, the next ones on the same vertex update it,
+            - the random numbers of the hot new intersections are drawn for the whole frontier,
+            - the cold new intersections see all the intersections created by the frontier when choosing their direction.
+        """
+        vertices_x_count = self.world_settings.grid_settings.width + 1
+        min_x, min_y, max_x, max_y = bounds = self._bounds()
+        _, _, grid_max_x, grid_max_y = self._grid_bounds()
+        in_grid_region = min_x > 0 or min_y > 0 or max_x < grid_max_x or max_y < grid_max_y
+        flat_junctions = self.junctions.reshape(-1)
+        heats = self.vertex_heats(bounds)
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        offsets_x, offsets_y = np.array(DIRECTION_OFFSETS).T
+        left_of = np.array(LEFT_OF)
+        right_of = np.array(RIGHT_OF)
+        from_junction = np.array(FROM_DIRECTION_JUNCTION, dtype=np.uint8)
+        to_junction = np.array(TO_DIRECTION_JUNCTION, dtype=np.uint8)
+
+        xs = np.array([order.intersection_coord.x for order in av_build_orders], dtype=np.intp)
+        ys = np.array([order.intersection_coord.y for order in av_build_orders], dtype=np.intp)
+        directions = np.array([order.from_direction for order in av_build_orders], dtype=np.intp)
+        build_orders_count = 0
+        created_count = 0
+        direction_searches_count = 0
+        while xs.size > 0:
+            build_orders_count += xs.size
+            inside = (xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y)
+            if in_grid_region:
+                # Avenues leaving the region, they join the intersections outside
+                leaving = np.flatnonzero(~inside & (xs >= 0) & (xs <= grid_max_x) & (ys >= 0) & (ys <= grid_max_y))
+                leaving_indices = ys[leaving] * vertices_x_count + xs[leaving]
+                joined = (flat_junctions[leaving_indices] & INTERSECTION) != 0
+                np.bitwise_or.at(flat_junctions, leaving_indices[joined], from_junction[directions[leaving[joined]]])
+            xs, ys, directions = xs[inside], ys[inside], directions[inside]
+            indices = ys * vertices_x_count + xs
+
+            # Orders on existing intersections and the following orders on a new vertex only update the junction
+            is_new = (flat_junctions[indices] & INTERSECTION) == 0
+            _, first_orders = np.unique(indices[is_new], return_index=True)
+            creators = np.flatnonzero(is_new)[np.sort(first_orders)]
+            created_count += creators.size
+            had_obstacle_index = self._obstacle_index is not None
+            flat_junctions[indices[creators]] |= INTERSECTION
+            np.bitwise_or.at(flat_junctions, indices, from_junction[directions])
+            if had_obstacle_index:
+                for x, y in zip(xs[creators].tolist(), ys[creators].tolist()):
+                    self._obstacle_index.add_intersection(x, y)
+
+            # Build directions of the new intersections: straight, left, right
+            creators_directions = directions[creators]
+            build_directions = np.stack((creators_directions, left_of[creators_directions], right_of[creators_directions]), axis=1)
+            creators_heats = heats[ys[creators] - min_y, xs[creators] - min_x]
+            selected = rng.random(build_directions.shape) <= (creators_heats * self.heat_factor)[:, np.newaxis]
+            blocked = np.zeros(build_directions.shape, dtype=bool)
+            if in_grid_region:
+                # Avenues only leave the region to join an intersection (see _is_blocked)
+                next_xs = xs[creators][:, np.newaxis] + offsets_x[build_directions]
+                next_ys = ys[creators][:, np.newaxis] + offsets_y[build_directions]
+                blocked = (next_xs < min_x) | (next_xs > max_x) | (next_ys < min_y) | (next_ys > max_y)
+                blocked &= (next_xs >= 0) & (next_xs <= grid_max_x) & (next_ys >= 0) & (next_ys <= grid_max_y)
+                blocked[blocked] = (flat_junctions[next_ys[blocked] * vertices_x_count + next_xs[blocked]] & INTERSECTION) == 0
+            if blocked.any():
+                selected &= ~blocked
+                no_selection = np.flatnonzero(~selected.any(axis=1) & ~blocked.all(axis=1))
+                # Random choice among the directions which are not blocked
+                choices = np.where(blocked[no_selection], -1.0, rng.random((no_selection.size, 3)))
+                selected[no_selection, choices.argmax(axis=1)] = True
+            else:
+                no_selection = np.flatnonzero(~selected.any(axis=1))
+                selected[no_selection, rng.integers(0, 3, size=no_selection.size)] = True
+            for creator in np.flatnonzero(creators_heats <= 0).tolist():
+                selected[creator] = False
+                build_dirs = [Vec2Direction(build_dir) for build_dir, is_blocked in zip(build_directions[creator].tolist(), blocked[creator].tolist()) if not is_blocked]
+                if not build_dirs:
+                    continue
+                direction_searches_count += 1
+                best_dir = self._get_best_build_direction(build_dirs, int(xs[creators[creator]]), int(ys[creators[creator]]))
+                selected[creator, build_directions[creator].tolist().index(best_dir)] = True
+
+            selected_creators, selected_builds = np.nonzero(selected)
+            next_directions = build_directions[selected_creators, selected_builds]
+            np.bitwise_or.at(flat_junctions, indices[creators[selected_creators]], to_junction[next_directions])
+            xs = xs[creators[selected_creators]] + offsets_x[next_directions]
+            ys = ys[creators[selected_creators]] + offsets_y[next_directions]
+            directions = next_directions
+
+        self._count_growth(build_orders_count, created_count, direction_searches_count)
+
+
+# Grid (with the main avenues) of a worker process of AvenuesGrid.generate_parallel, and its growth engine
+_growth_worker: "tuple[AvenuesGrid, AvenuesGrid.Engine]" = None
+
+
+def _init_growth_worker(sources: tuple) -> None:
+    global _growth_worker
+    width, height, grid_settings, heat_grid, junctions, heat_factor, engine, counted = sources
+    # Counters are kept at the top level of the worker instrumentation and sent back with the junctions
+    world_settings = WorldSettings(width, height, grid_settings, instrumentation=Instrumentation(EventLog()) if counted else None)
+    heat_map = HeatMap.from_grid(world_settings, heat_grid)
+    avenues_grid = AvenuesGrid(world_settings, heat_map)
+    avenues_grid.heat_factor = heat_factor
+    avenues_grid.junctions = junctions
+    _growth_worker = (avenues_grid, engine)
+
+
+def _grow_quadrant(task: tuple) -> "tuple[np.ndarray, dict[str, int]]":
+    """Grows the avenues of a quadrant from a copy of the main avenues, returns its junctions and the counters"""
+    template, engine = _growth_worker
+    region, orders, seed = task
+    avenues_grid = AvenuesGrid(template.world_settings, template.heatmap, random.Random(seed))
+    avenues_grid.heat_factor = template.heat_factor
+    avenues_grid.junctions = template.junctions.copy()
+    avenues_grid._region = region
+    instrumentation = avenues_grid.world_settings.instrumentation
+    counters = dict(instrumentation.counters)
+    avenues_grid._grow([AvenuesGrid.AvenueBuildOrder(Vec2(x, y), Vec2Direction(direction)) for x, y, direction in orders], engine)
+    counters = {name: value - counters.get(name, 0) for name, value in instrumentation.counters.items()}
+    x0, y0, x1, y1 = region
+    return avenues_grid.junctions[y0:y1 + 1, x0:x1 + 1], counters
 
 
 @dataclass
@@ -192,3 +631,160 @@ class AvenueIntersection:
     rightjunction: bool = False
     bottomjunction: bool = False
     leftjunction: bool = False
+
+
+def _junction_property(junction: int) -> property:
+    """Property of a JunctionsIntersection reading and writing the junction bit of its vertex"""
+    def get(self: "JunctionsIntersection") -> bool:
+        return bool(self._junctions.flat[self._index] & junction)
+
+    def set(self: "JunctionsIntersection", value: bool) -> None:
+        if value:
+            self._junctions.flat[self._index] |= INTERSECTION | junction
+        else:
+            self._junctions.flat[self._index] &= ~np.uint8(junction)
+    return property(get, set)
+
+
+class JunctionsIntersection(AvenueIntersection):
+    """
+    JunctionsIntersection
+
+    AvenueIntersection of a vertex of a junctions matrix, returned by IntersectionsView:
+    the junctions are read from the matrix and setting a junction updates the matrix.
+    """
+    upjunction = _junction_property(JUNCTION_UP)
+    rightjunction = _junction_property(JUNCTION_RIGHT)
+    bottomjunction = _junction_property(JUNCTION_BOTTOM)
+    leftjunction = _junction_property(JUNCTION_LEFT)
+
+    def __init__(self, junctions: np.ndarray, index: int) -> None:
+        self._junctions = junctions
+        self._index = index
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, AvenueIntersection):
+            return NotImplemented
+        return ((self.upjunction, self.rightjunction, self.bottomjunction, self.leftjunction)
+                == (other.upjunction, other.rightjunction, other.bottomjunction, other.leftjunction))
+
+
+class ObstacleIndex:
+    """
+    ObstacleIndex
+
+    Finds the nearest obstacle from a vertex in a direction: a vertex with some heat, an intersection or the edge of the bounds.
+    Vertices with some heat and intersections are stored as sorted lists per row and per column,
+    so each query is a binary search.
+    Only the rows and columns crossing the region (the bounds by default) are indexed, over the whole bounds:
+    the vertices of the region can be queried, the obstacles out of the bounds are farther than the edge.
+    Heat is read once at creation, intersections must be added when created.
+    queries counts the calls of distance.
+    """
+    PRIORITY_HEAT = 1
+    PRIORITY_INTERSECTION = 2
+    PRIORITY_EDGE = 3
+
+    def __init__(self, hot: "np.ndarray | tuple[np.ndarray, np.ndarray]", intersections: "np.ndarray | tuple[np.ndarray, np.ndarray]",
+                 bounds: "tuple[int, int, int, int]", region: "tuple[int, int, int, int]" = None) -> None:
+        """
+        bounds and region are min x, min y, max x, max y (included), the region is inside the bounds.
+        Without region, hot and intersections are matrices of booleans of one element per vertex of the bounds (hot[y - min y][x - min x]).
+        With a region, they are pairs of matrices (rows, columns): the vertices of the rows of the region over the bounds
+        (rows[y - region min y][x - min x]) and of the columns of the region over the bounds (columns[y - min y][x - region min x]).
+        Rows and columns are stored relative to the region, with the coords of the vertices.
+        """
+        self.bounds = bounds
+        self.region = region if region is not None else bounds
+        self.queries = 0
+        if region is None:
+            hot, intersections = (hot, hot), (intersections, intersections)
+        min_x, min_y, _, _ = bounds
+        self.hot_rows = [(np.flatnonzero(row) + min_x).tolist() for row in hot[0]]
+        self.hot_columns = [(np.flatnonzero(column) + min_y).tolist() for column in hot[1].T]
+        self.intersections_rows = [(np.flatnonzero(row) + min_x).tolist() for row in intersections[0]]
+        self.intersections_columns = [(np.flatnonzero(column) + min_y).tolist() for column in intersections[1].T]
+
+    def add_intersection(self, x: int, y: int) -> None:
+        min_x, min_y, max_x, max_y = self.region
+        if min_x <= x <= max_x and min_y <= y <= max_y:
+            bisect.insort(self.intersections_rows[y - min_y], x)
+            bisect.insort(self.intersections_columns[x - min_x], y)
+
+    def distance(self, x: int, y: int, direction: Vec2Direction) -> "tuple[int, int]":
+        """
+        Returns the distance (number of vertices) to the nearest obstacle from x:y (a vertex of the region) in direction
+        and the priority of the obstacle (PRIORITY_*).
+        The edge distance is the distance to the first vertex out of the bounds.
+        """
+        self.queries += 1
+        min_x, min_y, max_x, max_y = self.bounds
+        row, column = y - self.region[1], x - self.region[0]
+        if direction == Vec2Direction.RIGHT:
+            edge_distance = max_x + 1 - x
+            heat_distance = self._next_distance(self.hot_rows[row], x)
+            intersection_distance = self._next_distance(self.intersections_rows[row], x)
+        elif direction == Vec2Direction.LEFT:
+            edge_distance = x - min_x + 1
+            heat_distance = self._previous_distance(self.hot_rows[row], x)
+            intersection_distance = self._previous_distance(self.intersections_rows[row], x)
+        elif direction == Vec2Direction.DOWN:
+            edge_distance = max_y + 1 - y
+            heat_distance = self._next_distance(self.hot_columns[column], y)
+            intersection_distance = self._next_distance(self.intersections_columns[column], y)
+        else:
+            edge_distance = y - min_y + 1
+            heat_distance = self._previous_distance(self.hot_columns[column], y)
+            intersection_distance = self._previous_distance(self.intersections_columns[column], y)
+
+        if heat_distance < edge_distance and heat_distance <= intersection_distance:
+            return heat_distance, ObstacleIndex.PRIORITY_HEAT
+        if intersection_distance < edge_distance:
+            return intersection_distance, ObstacleIndex.PRIORITY_INTERSECTION
+        return edge_distance, ObstacleIndex.PRIORITY_EDGE
+
+    def _next_distance(self, line: "list[int]", position: int) -> float:
+        index = bisect.bisect_right(line, position)
+        return line[index] - position if index < len(line) else math.inf
+
+    def _previous_distance(self, line: "list[int]", position: int) -> float:
+        index = bisect.bisect_left(line, position) - 1
+        return position - line[index] if index >= 0 else math.inf
+
+
+class IntersectionsView(MutableMapping):
+    """
+    IntersectionsView
+
+    Dict like access Id->AvenueIntersection to a junctions matrix of an AvenuesGrid.
+    The values are JunctionsIntersection bound to their vertex, so modifying them updates the matrix.
+    """
+    def __init__(self, junctions: np.ndarray) -> None:
+        self.junctions = junctions
+
+    def __contains__(self, index: object) -> bool:
+        return isinstance(index, (int, np.integer)) and 0 <= index < self.junctions.size and self.junctions.flat[index] & INTERSECTION != 0
+
+    def __getitem__(self, index: int) -> AvenueIntersection:
+        if index not in self:
+            raise KeyError(index)
+        return JunctionsIntersection(self.junctions, index)
+
+    def __setitem__(self, index: int, intersection: AvenueIntersection) -> None:
+        bits = INTERSECTION
+        bits |= JUNCTION_UP if intersection.upjunction else 0
+        bits |= JUNCTION_RIGHT if intersection.rightjunction else 0
+        bits |= JUNCTION_BOTTOM if intersection.bottomjunction else 0
+        bits |= JUNCTION_LEFT if intersection.leftjunction else 0
+        self.junctions.flat[index] = bits
+
+    def __delitem__(self, index: int) -> None:
+        if index not in self:
+            raise KeyError(index)
+        self.junctions.flat[index] = 0
+
+    def __iter__(self):
+        yield from np.flatnonzero(self.junctions & INTERSECTION).tolist()
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.junctions & INTERSECTION))
@@ -0,0 +1,120 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from functools import partial
+import json
+import os
+import random
+import time
+
+from avenuesgrid import AvenuesGrid
+from cityfile import save_city
+from heatmap import HeatMap
+from streetsblocks import StreetsBlocks
+from worldsettings import WorldSettings
+from display import Printer
+from export import export_png
+from instrumentation import EventLog, Instrumentation
+from parameters import CityParameters
+
+
+"""
+Batch generation
+
+Generates one city per seed of a range in a process pool and writes the images in an output directory,
+with a manifest.json describing the parameters, the seeds, the timings and the counters of each city.
+Images are rendered and written band by band, so large cities can be exported with a bounded memory.
+
+Each city uses its own random.Random seeded with the city seed, so a city can be generated again
+from its seed and the parameters, whatever the worker or the order it was generated in.
+
+Ex: python batch.py 0:1000 --width 512 --height 512 --output cities
+"""
+
+
+def generate_city(seed: int, parameters: CityParameters, output_dir: str, band_height: int = 256, city_file: bool = False,
+                  overview_levels: int = 0) -> dict:
+    """
+    Generates and renders the city of the given seed, also saved as a city file if city_file
+    (with the overviews of levels 1 to overview_levels), returns its manifest entry
+    """
+    rng = random.Random(seed)
+    event_log = EventLog()
+    instrumentation = Instrumentation(event_log)
+    world_settings = WorldSettings(parameters.width, parameters.height, rng=rng, instrumentation=instrumentation)
+    heat_map = HeatMap(world_settings, rng)
+    heat_map.generate(parameters.scale, parameters.min_heat, parameters.max_heat)
+
+    avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+    avenues_grid.heat_factor = parameters.heat_factor
+    avenues_grid.generate()
+
+    streets_blocks = StreetsBlocks(world_settings, avenues_grid)
+    streets_blocks.generate()
+
+    with instrumentation.stage("render"):
+        printer = Printer(world_settings)
+        printer.addheat(heat_map)
+        printer.addgrid()
+        printer.addavenues(avenues_grid)
+        printer.addstreets(streets_blocks)
+        filename = f"city_{seed}.png"
+        export_png(printer, os.path.join(output_dir, filename), band_height)
+        overviews = printer.pyramid(overview_levels) if city_file else None
+
+    timings = event_log.durations()
+    entry = {"seed": seed, "file": filename, "timings": timings, "total": sum(timings.values()), "counters": instrumentation.counters}
+    if city_file:
+        entry["city_file"] = f"city_{seed}.city"
+        save_city(os.path.join(output_dir, entry["city_file"]), heat_map, avenues_grid, streets_blocks, {"seed": seed, "parameters": asdict(parameters)}, overviews)
+    return entry
+
+
+def parse_seeds(seeds: str) -> range:
+    """Parses a seed range: "start:end" (end excluded) or a single seed"""
+    if ":" in seeds:
+        start, end = seeds.split(":")
+        return range(int(start), int(end))
+    return range(int(seeds), int(seeds) + 1)
+
+
+def main(argv: "list[str]" = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a batch of cities, one per seed")
+    parser.add_argument("seeds", type=parse_seeds, help="seed range start:end (end excluded) or a single seed")
+    parser.add_argument("--width", type=int, default=CityParameters.width)
+    parser.add_argument("--height", type=int, default=CityParameters.height)
+    parser.add_argument("--scale", type=int, default=CityParameters.scale, help="heat map scale, the generated map size is 2^scale+1")
+    parser.add_argument("--min-heat", type=float, default=CityParameters.min_heat)
+    parser.add_argument("--max-heat", type=float, default=CityParameters.max_heat)
+    parser.add_argument("--heat-factor", type=float, default=CityParameters.heat_factor)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--band-height", type=int, default=256, help="number of rows of an image rendered at once")
+    parser.add_argument("--city-files", action="store_true", help="also save each city as a city file (see cityfile.py)")
+    parser.add_argument("--overviews", type=int, default=0, help="number of zoomed out images saved in the city files")
+    parser.add_argument("--output", default="cities", help="output directory")
+    args = parser.parse_args(argv)
+
+    parameters = CityParameters(args.width, args.height, args.scale, args.min_heat, args.max_heat, args.heat_factor)
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    # Several seeds per task to lower the inter process overhead, small enough to balance the workers
+    chunksize = max(1, len(args.seeds) // (args.workers * 8))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        cities = list(executor.map(partial(generate_city, parameters=parameters, output_dir=args.output, band_height=args.band_height, city_file=args.city_files, overview_levels=args.overviews), args.seeds, chunksize=chunksize))
+    total_time = time.perf_counter() - start
+
+    manifest = {
+        "parameters": asdict(parameters),
+        "seeds": {"start": args.seeds.start, "end": args.seeds.stop},
+        "workers": args.workers,
+        "total_time": total_time,
+        "cities": cities
+    }
+    with open(os.path.join(args.output, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    print(f"{len(cities)} cities generated in {total_time:.2f}s ({len(cities) / total_time:.2f} cities/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import random
+import time
+
+from avenuesgrid import INTERSECTION, AvenuesGrid
+from heatmap import HeatMap
+from worldsettings import WorldSettings
+
+
+"""
+Avenues engines benchmark
+
+Compares the QUEUE and FRONTIER engines of AvenuesGrid.generate on the same worlds and heat maps.
+Timings are the mean over the seeds, the intersections count shows both engines follow the same rules.
+
+Ex: python bench_avenues.py --sizes 1024 4096 8192 --seeds 3
+"""
+
+
+def bench(size: int, scale: int, seed: int, engine: AvenuesGrid.Engine) -> "tuple[float, int]":
+    rng = random.Random(seed)
+    world_settings = WorldSettings(size, size, rng=rng)
+    heat_map = HeatMap(world_settings, rng)
+    heat_map.generate(scale, -0.3, 1.3)
+    avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+    start = time.perf_counter()
+    avenues_grid.generate(engine)
+    duration = time.perf_counter() - start
+    return duration, int(avenues_grid.mask(INTERSECTION).sum())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the avenues growth engines")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096, 8192], help="world sizes")
+    parser.add_argument("--scale", type=int, default=8, help="heat map scale")
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeds per size")
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'engine':>9} {'time (s)':>9} {'intersections':>14} {'speedup':>8}")
+    for size in args.sizes:
+        queue_time = None
+        for engine in AvenuesGrid.Engine:
+            results = [bench(size, args.scale, seed, engine) for seed in range(args.seeds)]
+            mean_time = sum(result[0] for result in results) / len(results)
+            mean_intersections = sum(result[1] for result in results) / len(results)
+            if queue_time is None:
+                queue_time = mean_time
+            print(f"{size:>6} {engine.name:>9} {mean_time:>9.3f} {mean_intersections:>14.0f} {queue_time / mean_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import contextlib
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from avenuesgrid import AvenuesGrid
+from display import Printer
+from heatmap import HeatMap
+from streetsblocks import StreetsBlocks
+from worldsettings import WorldSettings
+
+
+"""
+Stages benchmark
+
+Runs each stage of the generation (heat, avenues, streets) and renders each layer of the Printer alone,
+over a matrix of world sizes and heat scales with fixed seeds.
+
+Each case records the wall time of each stage (mean over the seeds) and its peak of memory allocated,
+measured with tracemalloc in a separate run of the first seed so the tracing does not slow down the timings.
+
+Results are written as JSON. With --baseline, the results are compared to a previous results file:
+a stage slower than the baseline by more than --threshold is reported as a regression and the exit code is 1.
+
+Ex: python benchmark.py --sizes 256 1024 --scales 7 9 --output results.json
+    python benchmark.py --sizes 256 1024 --scales 7 9 --baseline results.json
+"""
+
+
+BENCHMARK_SIZES = [256, 1024, 4096, 8192]
+BENCHMARK_SCALES = [7, 8, 9, 10, 11, 12]
+BENCHMARK_STAGES = ["heat", "avenues", "streets", "render_heat", "render_grid", "render_avenues", "render_streets"]
+# Stages faster than this in the baseline are too noisy to be compared
+BENCHMARK_MIN_TIME = 0.005
+
+
+def run_stages(size: int, scale: int, seed: int, memory: bool = False) -> "dict[str, float]":
+    """
+    Runs all the stages of a city, returns the wall time of each stage,
+    or its peak of memory allocated in bytes if memory (tracemalloc must be started).
+    """
+    results = dict()
+    rng = random.Random(seed)
+
+    @contextlib.contextmanager
+    def measure(stage: str):
+        if memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        results[stage] = time.perf_counter() - start
+        if memory:
+            results[stage] = tracemalloc.get_traced_memory()[1] - base
+
+    world_settings = WorldSettings(size, size, rng=rng)
+    with measure("heat"):
+        heat_map = HeatMap(world_settings, rng)
+        heat_map.generate(scale, -0.3, 1.3)
+    with measure("avenues"):
+        avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+        avenues_grid.generate()
+    with measure("streets"):
+        streets_blocks = StreetsBlocks(world_settings, avenues_grid)
+        streets_blocks.generate()
+    layers = {
+        "heat": lambda printer: printer.addheat(heat_map),
+        "grid": lambda printer: printer.addgrid(),
+        "avenues": lambda printer: printer.addavenues(avenues_grid),
+        "streets": lambda printer: printer.addstreets(streets_blocks)
+    }
+    for name, add_layer in layers.items():
+        printer = Printer(world_settings)
+        add_layer(printer)
+        with measure(f"render_{name}"):
+            printer.render()
+    return results
+
+
+def run_case(size: int, scale: int, seeds: int, memory: bool = True) -> dict:
+    """Returns the results of a size and a scale: mean time and peak memory of each stage"""
+    timings = [run_stages(size, scale, seed) for seed in range(seeds)]
+    stages = {stage: {"time": sum(timing[stage] for timing in timings) / seeds} for stage in BENCHMARK_STAGES}
+    if memory:
+        tracemalloc.start()
+        try:
+            peaks = run_stages(size, scale, 0, memory=True)
+        finally:
+            tracemalloc.stop()
+        for stage in BENCHMARK_STAGES:
+            stages[stage]["peak_bytes"] = peaks[stage]
+    return {"size": size, "scale": scale, "seeds": seeds, "stages": stages}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> "list[str]":
+    """Returns a message for each stage of results slower than the same stage of baseline by more than threshold"""
+    regressions = []
+    baseline_cases = {(case["size"], case["scale"]): case for case in baseline["cases"]}
+    for case in results["cases"]:
+        baseline_case = baseline_cases.get((case["size"], case["scale"]))
+        if baseline_case is None:
+            continue
+        for stage, result in case["stages"].items():
+            baseline_time = baseline_case["stages"].get(stage, dict()).get("time")
+            if baseline_time is None or baseline_time < BENCHMARK_MIN_TIME:
+                continue
+            ratio = result["time"] / baseline_time
+            if ratio > 1 + threshold:
+                regressions.append(f"size {case['size']} scale {case['scale']} {stage}: {baseline_time:.3f}s -> {result['time']:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv: "list[str]" = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the generation stages and the layers rendering")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCHMARK_SIZES, help="world sizes")
+    parser.add_argument("--scales", type=int, nargs="+", default=BENCHMARK_SCALES, help="heat map scales")
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeds per case")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--output", default="benchmark.json", help="results file")
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    print(f"{'size':>6} {'scale':>5} " + " ".join(f"{stage:>14}" for stage in BENCHMARK_STAGES))
+    cases = []
+    for size in args.sizes:
+        for scale in args.scales:
+            case = run_case(size, scale, args.seeds, not args.no_memory)
+            cases.append(case)
+            print(f"{size:>6} {scale:>5} " + " ".join(f"{case['stages'][stage]['time']:>13.4f}s" for stage in BENCHMARK_STAGES))
+    results = {"python": sys.version.split()[0], "cases": cases}
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+        print("No regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
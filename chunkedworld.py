@@ -0,0 +1,285 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import random
+import struct
+
+import numpy as np
+
+from avenuesgrid import FROM_DIRECTION_JUNCTION, JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP, AvenuesGrid
+from heatmap import HeatMap, HeatNoise, diamond_square, rand_in_80_range
+from streetsblocks import StreetsBlocks
+from utils import Vec2, Vec2Direction
+from worldsettings import GRID_CELL_SIZE, GridSettings, WorldSettings
+
+
+"""
+The chunked world
+
+An unbounded world split in square chunks of CHUNK_CELLS x CHUNK_CELLS grid cells.
+Chunk cx:cy covers the world tiles from cx*chunk_size:cy*chunk_size, coords can be negative.
+
+The grid is global: vertices are every GRID_CELL_SIZE tiles with an offset of half a cell in both axis,
+so a chunk owns the CHUNK_CELLS x CHUNK_CELLS vertices (and the cells at their bottom right) inside its area.
+
+A chunk is generated only when it is first requested, from the world seed and its coords:
+    - Heat: the corners of the chunks and the heat along the chunk edges only depend on the seed and
+      their coords, the inside of the chunk is filled with the diamond-square algorithm.
+      Neighbour chunks share the same edges so the heat is continuous.
+      With the NOISE heat engine, the heat of a chunk is a HeatNoise of the world seed evaluated on the chunk,
+      continuous by construction (without the hot center of a bounded world).
+    - Avenues: the avenues crossing a chunk edge (ports) are drawn from the heat of the edge and only
+      depend on the seed and the edge coords, so both chunks of an edge agree on them.
+      Avenues grow inside the chunk from the ports and never cross an edge elsewhere.
+    - Streets: blocks on the right and bottom edges of a chunk need the avenues of the neighbour chunks,
+      they are copied in a halo of vertices before generating the streets patterns.
+
+Generated chunks are kept in a LRU cache bounded in bytes.
+"""
+
+
+CHUNK_CELLS = 32
+CHUNK_MIN_PORT_PROBABILITY = 0.05
+
+_SEED_CORNER = 0
+_SEED_EDGE_H = 1
+_SEED_EDGE_V = 2
+_SEED_PORTS_H = 3
+_SEED_PORTS_V = 4
+_SEED_HEAT = 5
+_SEED_AVENUES = 6
+_SEED_NOISE = 7
+
+
+def chunk_seed(*values: int) -> int:
+    """Returns a 64 bits seed derived from the given integers, stable between runs and platforms"""
+    digest = hashlib.blake2b(struct.pack(f"<{len(values)}q", *values), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class ChunkedWorld:
+    """
+    ChunkedWorld
+
+    An unbounded world generated chunk by chunk, see the module description for the rules.
+
+    Chunks are read with get_chunk (chunk coords) or chunk_at (world coords),
+    the same seed and settings always give the same chunks whatever the order they are requested.
+    """
+    def __init__(self, seed: int, chunk_cells: int = CHUNK_CELLS, heat_scale: int = 6, min_heat: float = -0.3, max_heat: float = 1.3,
+                 heat_factor: float = 1.3, cache_bytes: int = 256 * 1024 * 1024, heat_engine: HeatMap.Engine = HeatMap.Engine.NUMPY) -> None:
+        self.seed = seed
+        self.chunk_cells = chunk_cells
+        self.chunk_size = chunk_cells * GRID_CELL_SIZE
+        self.heat_scale = heat_scale
+        self.min_heat = min_heat
+        self.max_heat = max_heat
+        self.heat_factor = heat_factor
+        self.cache_bytes = cache_bytes
+        self.noise: HeatNoise = None
+        if heat_engine == HeatMap.Engine.NOISE:
+            self.noise = HeatNoise(chunk_seed(seed, _SEED_NOISE), min_heat, max_heat, wavelength=self.chunk_size)
+        self.chunks: "OrderedDict[tuple[int, int], WorldChunk]" = OrderedDict()
+        self.cached_bytes = 0
+
+    def chunk_coords(self, x: int, y: int) -> "tuple[int, int]":
+        """Returns the coords of the chunk containing the world tile x:y"""
+        return x // self.chunk_size, y // self.chunk_size
+
+    def chunk_at(self, x: int, y: int) -> "WorldChunk":
+        return self.get_chunk(*self.chunk_coords(x, y))
+
+    def heat_at(self, x: int, y: int) -> float:
+        """Returns the heat of the world tile x:y"""
+        chunk = self._get_chunk(*self.chunk_coords(x, y))
+        return chunk.heat_map.heat_at(x - chunk.origin.x, y - chunk.origin.y)
+
+    def get_chunk(self, cx: int, cy: int) -> "WorldChunk":
+        """Returns the fully generated chunk cx:cy (heat, avenues and streets)"""
+        chunk = self._get_chunk(cx, cy)
+        if chunk.streets_blocks is None:
+            self._generate_streets(chunk)
+            self._cache(chunk)
+        return chunk
+
+    def _get_chunk(self, cx: int, cy: int) -> "WorldChunk":
+        """Returns the chunk cx:cy with at least its heat and avenues generated"""
+        key = (cx, cy)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+
+        chunk_settings = GridSettings(GRID_CELL_SIZE, self.chunk_cells, self.chunk_cells, Vec2(GRID_CELL_SIZE // 2, GRID_CELL_SIZE // 2))
+        world_settings = WorldSettings(self.chunk_size, self.chunk_size, chunk_settings)
+        rng = random.Random(chunk_seed(self.seed, _SEED_AVENUES, cx, cy))
+        heat_map = HeatMap.from_grid(world_settings, self._generate_heat(cx, cy))
+        avenues_grid = ChunkAvenuesGrid(world_settings, heat_map, rng, self._get_ports(cx, cy))
+        avenues_grid.heat_factor = self.heat_factor
+        avenues_grid.generate()
+
+        chunk = WorldChunk(cx, cy, Vec2(cx * self.chunk_size, cy * self.chunk_size), world_settings, heat_map, avenues_grid)
+        self._cache(chunk)
+        return chunk
+
+    def _cache(self, chunk: "WorldChunk") -> None:
+        key = (chunk.cx, chunk.cy)
+        if key in self.chunks:
+            self.cached_bytes -= self.chunks.pop(key).nbytes
+        chunk.nbytes = chunk.estimate_nbytes()
+        self.chunks[key] = chunk
+        self.cached_bytes += chunk.nbytes
+        while self.cached_bytes > self.cache_bytes and len(self.chunks) > 1:
+            _, evicted = self.chunks.popitem(last=False)
+            self.cached_bytes -= evicted.nbytes
+
+    def _heat_size(self) -> int:
+        return pow(2, self.heat_scale) + 1
+
+    def _corner_heat(self, gx: int, gy: int) -> float:
+        return random.Random(chunk_seed(self.seed, _SEED_CORNER, gx, gy)).uniform(self.min_heat, self.max_heat)
+
+    def _edge_heat(self, horizontal: bool, cx: int, cy: int) -> np.ndarray:
+        """
+        Returns the heat along the top (horizontal) or left edge of the chunk cx:cy, not clamped.
+        The edge is generated by midpoint displacement with the same 80% range rule than the diamond-square.
+        """
+        size = self._heat_size()
+        if self.noise is not None:
+            along = self._heat_lattice(cx if horizontal else cy)
+            return self.noise.evaluate(along, cy * self.chunk_size) if horizontal else self.noise.evaluate(cx * self.chunk_size, along)
+        end_x, end_y = (cx + 1, cy) if horizontal else (cx, cy + 1)
+        rng = np.random.default_rng(chunk_seed(self.seed, _SEED_EDGE_H if horizontal else _SEED_EDGE_V, cx, cy))
+        edge = np.empty(size, dtype=np.float64)
+        edge[0] = self._corner_heat(cx, cy)
+        edge[-1] = self._corner_heat(end_x, end_y)
+        step = size - 1
+        while step > 1:
+            half_step = step // 2
+            edge[half_step::step] = rand_in_80_range(np.stack((edge[0:size - 1:step], edge[step::step])), rng)
+            step = half_step
+        return edge
+
+    def _heat_lattice(self, chunk: int) -> np.ndarray:
+        """World coords of the lowest tile read for each element of the heat map along an axis of the chunk (see HeatMap._nearest_x)"""
+        size = self._heat_size()
+        return chunk * self.chunk_size + np.ceil(np.arange(size) * self.chunk_size / size)
+
+    def _generate_heat(self, cx: int, cy: int) -> np.ndarray:
+        if self.noise is not None:
+            return self.noise.evaluate_grid(self._heat_lattice(cx), self._heat_lattice(cy)).astype(np.float32)
+        size = self._heat_size()
+        gen_heatmap = np.empty((size, size), dtype=np.float64)
+        gen_heatmap[0] = self._edge_heat(True, cx, cy)
+        gen_heatmap[-1] = self._edge_heat(True, cx, cy + 1)
+        gen_heatmap[:, 0] = self._edge_heat(False, cx, cy)
+        gen_heatmap[:, -1] = self._edge_heat(False, cx + 1, cy)
+        rng = np.random.default_rng(chunk_seed(self.seed, _SEED_HEAT, cx, cy))
+        diamond_square(gen_heatmap, size - 1, self.min_heat, rng, keep_edges=True)
+        return np.clip(gen_heatmap, 0, 1).astype(np.float32)
+
+    def _edge_ports(self, horizontal: bool, cx: int, cy: int) -> "list[int]":
+        """
+        Returns the vertices (x for the top edge, y for the left edge) of the chunk cx:cy
+        where an avenue crosses its top (horizontal) or left edge.
+        """
+        size = self._heat_size()
+        vertices = np.arange(self.chunk_cells)
+        heat_indices = np.floor(((vertices * GRID_CELL_SIZE + GRID_CELL_SIZE // 2) / self.chunk_size) * size).astype(np.intp)
+        heats = np.clip(self._edge_heat(horizontal, cx, cy)[heat_indices], 0, 1)
+        probabilities = np.maximum(heats * self.heat_factor, CHUNK_MIN_PORT_PROBABILITY)
+        rng = np.random.default_rng(chunk_seed(self.seed, _SEED_PORTS_H if horizontal else _SEED_PORTS_V, cx, cy))
+        return np.flatnonzero(rng.random(self.chunk_cells) <= probabilities).tolist()
+
+    def _get_ports(self, cx: int, cy: int) -> "list[tuple[Vec2, Vec2Direction]]":
+        """Returns the ports of the chunk cx:cy as the owned vertex and the direction of the avenue going inside the chunk"""
+        last = self.chunk_cells - 1
+        ports = []
+        ports += [(Vec2(x, 0), Vec2Direction.DOWN) for x in self._edge_ports(True, cx, cy)]
+        ports += [(Vec2(x, last), Vec2Direction.UP) for x in self._edge_ports(True, cx, cy + 1)]
+        ports += [(Vec2(0, y), Vec2Direction.RIGHT) for y in self._edge_ports(False, cx, cy)]
+        ports += [(Vec2(last, y), Vec2Direction.LEFT) for y in self._edge_ports(False, cx + 1, cy)]
+        return ports
+
+    def _generate_streets(self, chunk: "WorldChunk") -> None:
+        # Copy the first column, first row and top left vertex of the right, bottom and bottom right chunks in the halo
+        avenues_grid = chunk.avenues_grid
+        halo = self.chunk_cells
+        right = self._get_chunk(chunk.cx + 1, chunk.cy).avenues_grid
+        bottom = self._get_chunk(chunk.cx, chunk.cy + 1).avenues_grid
+        bottom_right = self._get_chunk(chunk.cx + 1, chunk.cy + 1).avenues_grid
+        for i in range(halo):
+            avenues_grid.copy_intersection(right, Vec2(0, i), Vec2(halo, i))
+            avenues_grid.copy_intersection(bottom, Vec2(i, 0), Vec2(i, halo))
+        avenues_grid.copy_intersection(bottom_right, Vec2(0, 0), Vec2(halo, halo))
+
+        chunk.streets_blocks = StreetsBlocks(chunk.world_settings, avenues_grid)
+        chunk.streets_blocks.generate()
+
+
+class ChunkAvenuesGrid(AvenuesGrid):
+    """
+    ChunkAvenuesGrid
+
+    Avenues of a chunk, the grid has one more column and row of vertices (the halo) than the chunk owns,
+    they belong to the right and bottom neighbour chunks.
+
+    Avenues grow from the ports and stay on the owned vertices,
+    junctions leaving the chunk are only kept for the ports.
+    """
+    def __init__(self, world_settings: WorldSettings, heatmap: HeatMap, rng: random.Random, ports: "list[tuple[Vec2, Vec2Direction]]") -> None:
+        super().__init__(world_settings, heatmap, rng)
+        self.ports = ports
+
+    def generate(self, engine: AvenuesGrid.Engine = AvenuesGrid.Engine.QUEUE) -> None:
+        with self.world_settings.instrumentation.stage("avenues"):
+            av_build_orders = [AvenuesGrid.AvenueBuildOrder(position, direction) for position, direction in self.ports]
+            self._grow(av_build_orders, engine)
+            self._remove_leaving_junctions()
+
+    def copy_intersection(self, other: AvenuesGrid, from_position: Vec2, to_position: Vec2) -> None:
+        """Copy the intersection of another grid at from_position to to_position"""
+        self.junctions[to_position.y, to_position.x] = other.junctions[from_position.y, from_position.x]
+
+    def _regenerate_main_avenues(self) -> "list[AvenuesGrid.AvenueBuildOrder]":
+        # Chunks have no main avenues
+        return []
+
+    def _grid_bounds(self) -> "tuple[int, int, int, int]":
+        return 0, 0, self.world_settings.grid_settings.width - 1, self.world_settings.grid_settings.height - 1
+
+    def _remove_leaving_junctions(self) -> None:
+        last = self.world_settings.grid_settings.width - 1
+        leaving = np.zeros_like(self.junctions)
+        leaving[0, :] |= JUNCTION_UP
+        leaving[last, :] |= JUNCTION_BOTTOM
+        leaving[:, 0] |= JUNCTION_LEFT
+        leaving[:, last] |= JUNCTION_RIGHT
+        for position, direction in self.ports:
+            leaving[position.y, position.x] &= ~np.uint8(FROM_DIRECTION_JUNCTION[direction])
+        self.junctions &= ~leaving
+
+
+@dataclass
+class WorldChunk:
+    """
+    WorldChunk
+
+    A generated chunk, world_settings, heat_map, avenues_grid and streets_blocks use coords local to the chunk,
+    origin is the world coords of the top left tile of the chunk.
+    streets_blocks is None until the chunk is requested with ChunkedWorld.get_chunk.
+    """
+    cx: int
+    cy: int
+    origin: Vec2
+    world_settings: WorldSettings
+    heat_map: HeatMap
+    avenues_grid: ChunkAvenuesGrid
+    streets_blocks: StreetsBlocks = None
+    nbytes: int = 0
+
+    def estimate_nbytes(self) -> int:
+        """Rough memory used by the chunk"""
+        nbytes = self.heat_map.grid.nbytes + self.avenues_grid.junctions.nbytes
+        if self.streets_blocks is not None:
+            nbytes += self.streets_blocks.patterns.nbytes
+        return nbytes
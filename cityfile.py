@@ -0,0 +1,176 @@
+import json
+import struct
+
+import numpy as np
+
+from avenuesgrid import AvenuesGrid
+from heatmap import HeatMap
+from streetsblocks import StreetsBlocks
+from utils import Vec2
+from worldsettings import GridSettings, WorldSettings
+
+
+"""
+City file
+
+A generated city (world and grid settings, heat grid, avenue junctions and streets patterns) saved in one binary file.
+
+The file starts with a fixed header: CITY_FILE_MAGIC, the format version and the size of a JSON description (uint32 little endian).
+The JSON describes the settings and, for each array, its dtype, shape and offset in the file.
+Arrays are stored raw (C order) after the JSON, each one aligned on CITY_FILE_ALIGNMENT bytes,
+so they are loaded with a memory map: opening a city is immediate and only the regions read are loaded from the disk.
+Overviews of the city (zoomed out images, see Printer.pyramid) can be saved with it, to show a large city without rendering it.
+
+Ex:
+save_city("city.city", heat_map, avenues_grid, streets_blocks)
+world_settings, heat_map, avenues_grid, streets_blocks = CityFile("city.city").load()
+"""
+
+
+CITY_FILE_MAGIC = b"PYCITY\x00\x00"
+CITY_FILE_VERSION = 1
+CITY_FILE_ALIGNMENT = 64
+CITY_FILE_HEADER = struct.Struct("<8sII")
+
+
+def _align(offset: int) -> int:
+    return -(-offset // CITY_FILE_ALIGNMENT) * CITY_FILE_ALIGNMENT
+
+
+def save_city(path: str, heat_map: HeatMap, avenues_grid: AvenuesGrid, streets_blocks: StreetsBlocks, metadata: dict = None,
+              overviews: "list[np.ndarray]" = None) -> None:
+    """
+    Writes a generated city in path, metadata is any JSON serializable dict saved with it (seed, parameters...).
+    overviews are RGB images of the city saved with it, the levels 1 to n of Printer.pyramid.
+    """
+    world_settings = heat_map.world_settings
+    grid_settings = world_settings.grid_settings
+    arrays = {
+        "heat": np.ascontiguousarray(heat_map.grid, dtype=np.float32),
+        "junctions": np.ascontiguousarray(avenues_grid.junctions, dtype=np.uint8),
+        "patterns": np.ascontiguousarray(streets_blocks.patterns, dtype=np.uint8)
+    }
+    for level, overview in enumerate(overviews if overviews is not None else [], start=1):
+        arrays[f"overview_{level}"] = np.ascontiguousarray(overview, dtype=np.uint8)
+    description = {
+        "world": {"width": world_settings.width, "height": world_settings.height},
+        "grid": {
+            "cellsize": grid_settings.cellsize,
+            "width": grid_settings.width,
+            "height": grid_settings.height,
+            "offset": [grid_settings.offset.x, grid_settings.offset.y]
+        },
+        "heat_factor": avenues_grid.heat_factor,
+        "metadata": metadata if metadata is not None else dict(),
+        "arrays": dict()
+    }
+
+    # The arrays offsets depend on the JSON size, grow the reserved size until the JSON fits in it
+    reserved = CITY_FILE_ALIGNMENT
+    while True:
+        offset = _align(CITY_FILE_HEADER.size + reserved)
+        for name, array in arrays.items():
+            description["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _align(offset + array.nbytes)
+        encoded = json.dumps(description).encode("utf-8")
+        if len(encoded) <= reserved:
+            break
+        reserved = _align(len(encoded))
+
+    with open(path, "wb") as city_file:
+        city_file.write(CITY_FILE_HEADER.pack(CITY_FILE_MAGIC, CITY_FILE_VERSION, len(encoded)))
+        city_file.write(encoded)
+        for name, array in arrays.items():
+            city_file.seek(description["arrays"][name]["offset"])
+            city_file.write(array.tobytes())
+        city_file.truncate(offset)
+
+
+class CityFile:
+    """
+    CityFile
+
+    A city file opened for reading. The settings are read when opening, the arrays are memory maps
+    of the file (read only by default, mode "c" gives copy on write arrays that can be modified in memory).
+
+    load returns the city as the generation classes, with copy on write memory maps: the city can be edited
+    (ex: CityEditor) without modifying the file, and each load has its own arrays.
+    """
+    def __init__(self, path: str, mode: str = "r") -> None:
+        self.path = path
+        self.mode = mode
+        with open(path, "rb") as city_file:
+            header = city_file.read(CITY_FILE_HEADER.size)
+            if len(header) != CITY_FILE_HEADER.size:
+                raise ValueError(f"{path} is not a city file")
+            magic, version, description_size = CITY_FILE_HEADER.unpack(header)
+            if magic != CITY_FILE_MAGIC:
+                raise ValueError(f"{path} is not a city file")
+            if version != CITY_FILE_VERSION:
+                raise ValueError(f"{path} is a city file version {version}, only version {CITY_FILE_VERSION} is supported")
+            self.version = version
+            self.description = json.loads(city_file.read(description_size).decode("utf-8"))
+        self._arrays: "dict[str, np.ndarray]" = dict()
+
+    @property
+    def metadata(self) -> dict:
+        return self.description["metadata"]
+
+    @property
+    def grid_settings(self) -> GridSettings:
+        grid = self.description["grid"]
+        return GridSettings(grid["cellsize"], grid["width"], grid["height"], Vec2(*grid["offset"]))
+
+    @property
+    def heat(self) -> np.ndarray:
+        return self._array("heat")
+
+    @property
+    def junctions(self) -> np.ndarray:
+        return self._array("junctions")
+
+    @property
+    def patterns(self) -> np.ndarray:
+        return self._array("patterns")
+
+    @property
+    def overview_levels(self) -> int:
+        """Number of overviews saved with the city, see overview"""
+        level = 0
+        while f"overview_{level + 1}" in self.description["arrays"]:
+            level += 1
+        return level
+
+    def overview(self, level: int) -> np.ndarray:
+        """Returns the saved RGB image of the city at level (1 to overview_levels), see Printer.render_level"""
+        if not 1 <= level <= self.overview_levels:
+            raise ValueError(f"No overview of level {level} in {self.path}")
+        return self._array(f"overview_{level}")
+
+    def _array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            self._arrays[name] = self._map(name, self.mode)
+        return self._arrays[name]
+
+    def _map(self, name: str, mode: str) -> np.ndarray:
+        array = self.description["arrays"][name]
+        dtype, shape = np.dtype(array["dtype"]), tuple(array["shape"])
+        # An empty array cannot be memory mapped
+        if 0 in shape:
+            return np.empty(shape, dtype)
+        return np.memmap(self.path, dtype=dtype, mode=mode, offset=array["offset"], shape=shape)
+
+    def world_settings(self) -> WorldSettings:
+        world = self.description["world"]
+        return WorldSettings(world["width"], world["height"], self.grid_settings)
+
+    def load(self) -> "tuple[WorldSettings, HeatMap, AvenuesGrid, StreetsBlocks]":
+        """Returns the saved city, its arrays are copy on write memory maps of the file"""
+        world_settings = self.world_settings()
+        heat_map = HeatMap.from_grid(world_settings, self._map("heat", "c"))
+        avenues_grid = AvenuesGrid(world_settings, heat_map)
+        avenues_grid.heat_factor = self.description["heat_factor"]
+        avenues_grid.junctions = self._map("junctions", "c")
+        streets_blocks = StreetsBlocks(world_settings, avenues_grid)
+        streets_blocks.patterns = self._map("patterns", "c")
+        return world_settings, heat_map, avenues_grid, streets_blocks
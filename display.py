@@ -1,213 +1,367 @@
+from concurrent.futures import ProcessPoolExecutor
+import functools
 import math
+from multiprocessing import shared_memory
+from typing import Callable
 
+import numpy as np
 from PIL import Image
 
-from avenuesgrid import AvenuesGrid
+from avenuesgrid import JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP, AvenuesGrid
 from worldsettings import WorldSettings
 from heatmap import HeatMap
-from streetsblocks import StreetsBlocks, StreetsPattern
+from stamps import AVENUE_INTERSECTION, AVENUE_JUNCTION, STREET, STREET_TEMPLATE_OF_PATTERN, avenue_templates, street_templates
+from streetsblocks import StreetsBlocks
 from utils import Vec2
 
 
+AVENUE_JUNCTION_COLOR = (200, 200, 200)
+
+
 class Printer:
+    """
+    Printer
+
+    Renders a city as an image made of layers (heat, grid, avenues, streets) added with the add* methods.
+
+    Each layer is rendered as a uint8 matrix of RGB pixels (layer[y][x]), black pixels are transparent.
+    Layers are blended in the order they were added: the non black pixels of a layer are mixed
+    with the pixels below (25% below, 75% layer).
+
+    Layers are only rendered when the image property is read, or for a window of the world with render.
+    After a local edit of the sources, refresh renders the modified window again in the image.
+    """
     def __init__(self, world_settings: WorldSettings) -> None:
         self.world_settings = world_settings
-        self.image: Image = None
-
-    def _is_black(self, color: "tuple(int, int, int)") -> bool:
-        return color[0] == 0 and color[1] == 0 and color[2] == 0
-
-    def _mix_color(self, colorA: "tuple(int, int, int)", colorB: "tuple(int, int, int)") -> "tuple(int, int, int)":
-        return tuple(math.floor(chan[0] * 0.25 + chan[1] * 0.75) for chan in zip(colorA, colorB))
-
-    def _blend_to_image(self, new_image: Image) -> None:
-        if self.image is not None:
-            # self.image = Image.blend(self.image, new_image, 0.5)
-            bottom_data = list(self.image.getdata())
-            top_data = list(new_image.getdata())
-            new_data = []
-            for pixels in zip(bottom_data, top_data):
-                new_data.append(pixels[0] if self._is_black(pixels[1]) else self._mix_color(pixels[0], pixels[1]))
-            self.image = Image.new("RGB", (self.world_settings.width, self.world_settings.height))
-            self.image.putdata(new_data)
-        else:
-            self.image = new_image
+        self.layers: "list[tuple[str, object]]" = []
+        self._image: Image = None
 
-    def addheat(self, heatmap: HeatMap) -> None:
-        heat_map_img = Image.new("HSV", (self.world_settings.width, self.world_settings.height))
+    @property
+    def image(self) -> Image:
+        if self._image is None:
+            self._image = Image.fromarray(self.render())
+        return self._image
 
-        heat_map_rgb = []
-        for line in heatmap.heatmap:
-            for pix in line:
-                pix_rgb = math.floor((1.0 - pix) * 170)
-                heat_map_rgb.append((pix_rgb, 255, 255))
-        heat_map_img.putdata(heat_map_rgb)
+    def render(self, x0: int = 0, y0: int = 0, x1: int = None, y1: int = None) -> np.ndarray:
+        """Returns the RGB pixels of the world window from x0:y0 (included) to x1:y1 (excluded), the whole world by default"""
+        x1 = self.world_settings.width if x1 is None else x1
+        y1 = self.world_settings.height if y1 is None else y1
+        pixels = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+        origin = Vec2(x0, y0)
+        return self._composite(pixels, lambda name, source, layer: getattr(self, f"_render_{name}")(source, origin, layer))
 
-        self._blend_to_image(Image.eval(heat_map_img.convert("RGB"), lambda val: math.floor(val * 0.5)))
+    def render_level(self, level: int, x0: int = 0, y0: int = 0, x1: int = None, y1: int = None) -> np.ndarray:
+        """
+        Returns the RGB pixels of the world window from x0:y0 (included) to x1:y1 (excluded) at a level of detail:
+        a pixel of level n covers 2^n x 2^n tiles and shows the top left one, the same pixels as render(...)[::2^n, ::2^n].
+        Levels above 0 are rendered from the sources at the sampled tiles only (heat values, junctions and patterns
+        of the vertices and blocks under the pixels, the patterns are only mapped to their templates there),
+        so their cost depends on their own size and not on the world size.
+        """
+        x1 = self.world_settings.width if x1 is None else x1
+        y1 = self.world_settings.height if y1 is None else y1
+        if level == 0:
+            return self.render(x0, y0, x1, y1)
+        step = 1 << level
+        xs = np.arange(x0, x1, step)
+        ys = np.arange(y0, y1, step)
+        pixels = np.zeros((ys.size, xs.size, 3), dtype=np.uint8)
+        return self._composite(pixels, lambda name, source, layer: getattr(self, f"_sample_{name}")(source, xs, ys, layer))
 
-    def addgrid(self) -> None:
-        grid_img = Image.new("RGB", (self.world_settings.width, self.world_settings.height))
-        grid_rgb = [(0, 0, 0) for i in range(self.world_settings.width * self.world_settings.height)]
-        for j in range(self.world_settings.grid_settings.height + 1):
-            for i in range(self.world_settings.grid_settings.width + 1):
-                index = (j * self.world_settings.grid_settings.cellsize + self.world_settings.grid_settings.offset.y) * self.world_settings.width + (i * self.world_settings.grid_settings.cellsize + self.world_settings.grid_settings.offset.x)
-                grid_rgb[index] = (100, 100, 100)
-        grid_img.putdata(grid_rgb)
+    def pyramid(self, levels: int, band_height: int = 256) -> "list[np.ndarray]":
+        """
+        Returns the whole world at the levels 1 to levels (see render_level), level 0 is render().
+        Each level is rendered by bands of band_height rows of pixels, the layers are only allocated for a band.
+        """
+        width, height = self.world_settings.width, self.world_settings.height
+        images = []
+        for level in range(1, levels + 1):
+            step = 1 << level
+            image = np.empty((-(-height // step), -(-width // step), 3), dtype=np.uint8)
+            for row in range(0, image.shape[0], band_height):
+                image[row:row + band_height] = self.render_level(level, 0, row * step, width, min((row + band_height) * step, height))
+            images.append(image)
+        return images
+
+    def render_parallel(self, workers: int = None, band_height: int = 128) -> np.ndarray:
+        """
+        Returns the RGB pixels of the whole world as render, rendered by horizontal bands of band_height rows in a pool
+        of worker processes (one per core by default). Workers write their bands straight into a shared memory buffer,
+        only the layers sources are sent to them.
+        """
+        width, height = self.world_settings.width, self.world_settings.height
+        shape = (height, width, 3)
+        shared = shared_memory.SharedMemory(create=True, size=max(height * width * 3, 1))
+        try:
+            bands = [(y0, min(y0 + band_height, height)) for y0 in range(0, height, band_height)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_band_worker, initargs=(self._sources(), shared.name, shape)) as executor:
+                for _ in executor.map(_render_band, bands):
+                    pass
+            pixels = np.ndarray(shape, dtype=np.uint8, buffer=shared.buf).copy()
+        finally:
+            shared.close()
+            shared.unlink()
+        return pixels
+
+    def _sources(self) -> tuple:
+        """Returns the world settings and the arrays of the layers, enough to build the same printer in another process"""
+        layers = []
+        for name, source in self.layers:
+            if name == "heat":
+                layers.append((name, source.grid))
+            elif name == "avenues":
+                layers.append((name, source.junctions))
+            elif name == "streets":
+                layers.append((name, source.patterns))
+            else:
+                layers.append((name, None))
+        return self.world_settings.width, self.world_settings.height, self.world_settings.grid_settings, layers
+
+    @classmethod
+    def from_sources(cls, sources: tuple) -> "Printer":
+        width, height, grid_settings, layers = sources
+        world_settings = WorldSettings(width, height, grid_settings)
+        printer = cls(world_settings)
+        heat_map = HeatMap(world_settings)
+        avenues_grid = AvenuesGrid(world_settings, heat_map)
+        for name, array in layers:
+            if name == "heat":
+                heat_map.grid = array
+                printer.addheat(heat_map)
+            elif name == "avenues":
+                avenues_grid.junctions = array
+                printer.addavenues(avenues_grid)
+            elif name == "streets":
+                streets_blocks = StreetsBlocks(world_settings, avenues_grid)
+                streets_blocks.patterns = array
+                printer.addstreets(streets_blocks)
+            else:
+                printer.addgrid()
+        return printer
 
-        self._blend_to_image(grid_img)
+    def refresh(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Renders again the world window from x0:y0 (included) to x1:y1 (excluded) in the image, after its sources were modified"""
+        if self._image is not None:
+            self._image.paste(Image.fromarray(self.render(x0, y0, x1, y1)), (x0, y0))
 
-    def _draw_rectangle(self, topleft: Vec2, bottomright: Vec2, data_rgb: "list[tuple[int, int, int]]", color: "tuple[int, int, int]") -> None:
-        for j in range(topleft.y, bottomright.y + 1):
-            for i in range(topleft.x, bottomright.x + 1):
-                data_rgb[j * self.world_settings.width + i] = color
+    def _add_layer(self, name: str, source: object) -> None:
+        self.layers.append((name, source))
+        self._image = None
+
+    def _composite(self, pixels: np.ndarray, render_layer: "Callable[[str, object, np.ndarray], np.ndarray]") -> np.ndarray:
+        """
+        Renders the layers in place in the black pixels and returns them, render_layer(name, source, layer) draws a layer in layer.
+        The first layer is drawn straight in pixels, the next ones are drawn in a single black layer buffer
+        cleared between them and blended in place into pixels.
+        """
+        height, width = pixels.shape[:2]
+        self.world_settings.instrumentation.count("pixels_rendered", height * width * len(self.layers))
+        layer: np.ndarray = None
+        for index, (name, source) in enumerate(self.layers):
+            if index == 0:
+                render_layer(name, source, pixels)
+                continue
+            if layer is None:
+                # RGB pixels padded to 4 bytes, so the black pixels are found on a uint32 view
+                layer = np.zeros((height, width, 4), dtype=np.uint8)
+            else:
+                layer.fill(0)
+            render_layer(name, source, layer[:, :, :3])
+            self._blend(pixels, layer)
+        return pixels
+
+    def _blend(self, bottom: np.ndarray, top: np.ndarray) -> np.ndarray:
+        """
+        Mix in place the non black pixels of top with bottom, floor(bottom * 0.25 + top * 0.75) computed on integers.
+        top is a layer buffer of _composite (4 bytes per pixel, the 4th is 0).
+        """
+        drawn = np.flatnonzero(top.view(np.uint32))
+        flat_bottom = bottom.reshape(-1, 3)
+        flat_top = top.reshape(-1, 4)[drawn, :3]
+        flat_bottom[drawn] = (flat_bottom[drawn].astype(np.uint16) + flat_top.astype(np.uint16) * 3) >> 2
+        self.world_settings.instrumentation.count("pixels_blended", drawn.size)
+        return bottom
+
+    def addheat(self, heatmap: HeatMap) -> None:
+        self._add_layer("heat", heatmap)
+
+    def addgrid(self) -> None:
+        self._add_layer("grid", None)
 
     def addavenues(self, avenues_grid: AvenuesGrid) -> None:
-        avenues_img = Image.new("RGB", (self.world_settings.width, self.world_settings.height))
-        avenues_rgb = [(0, 0, 0) for i in range(self.world_settings.width * self.world_settings.height)]
-        intersections_color = (255, 255, 255)
-        junctions_color = (200, 200, 200)
-        vertices_x_count = self.world_settings.grid_settings.width + 1  # There is one more vertices than the number of cell in a grid
-        vertices_y_count = self.world_settings.grid_settings.height + 1
-        for j in range(vertices_y_count):
-            for i in range(vertices_x_count):
-                index = j * vertices_x_count + i
-                if index not in avenues_grid.intersections:
-                    continue
-                intersection = avenues_grid.intersections[index]
-                world_coords = self.world_settings.from_grid_to_world(Vec2(i, j))
-                is_top = j == 0
-                is_right = i == vertices_x_count - 1
-                is_bottom = j == vertices_y_count - 1
-                is_left = i == 0
-                # Draw the intersection (4 tiles)
-                avenues_rgb[world_coords.y * self.world_settings.width + world_coords.x] = intersections_color
-                avenues_rgb[(world_coords.y - 1) * self.world_settings.width + world_coords.x] = intersections_color
-                avenues_rgb[world_coords.y * self.world_settings.width + (world_coords.x - 1)] = intersections_color
-                avenues_rgb[(world_coords.y - 1) * self.world_settings.width + (world_coords.x - 1)] = intersections_color
-                # Draw right and bottom junctions if exist
-                if intersection.rightjunction:
-                    if is_right:
-                        self._draw_rectangle(
-                            Vec2(world_coords.x + 1, world_coords.y - 1),
-                            Vec2(self.world_settings.width - 1, world_coords.y),
-                            avenues_rgb, junctions_color)
-                    else:
-                        self._draw_rectangle(
-                            Vec2(world_coords.x + 1, world_coords.y - 1),
-                            Vec2(world_coords.x + self.world_settings.grid_settings.cellsize - 2, world_coords.y),
-                            avenues_rgb, junctions_color)
-                if intersection.bottomjunction:
-                    if is_bottom:
-                        self._draw_rectangle(
-                            Vec2(world_coords.x - 1, world_coords.y + 1),
-                            Vec2(world_coords.x, self.world_settings.height - 1),
-                            avenues_rgb, junctions_color)
-                    else:
-                        self._draw_rectangle(
-                            Vec2(world_coords.x - 1, world_coords.y + 1),
-                            Vec2(world_coords.x, world_coords.y + self.world_settings.grid_settings.cellsize - 2),
-                            avenues_rgb, junctions_color)
-                # Draw up and left junctions only for most left and most upper edges
-                if is_top and intersection.upjunction:
-                    self._draw_rectangle(
-                            Vec2(world_coords.x - 1, 0),
-                            Vec2(world_coords.x, world_coords.y - 2),
-                            avenues_rgb, junctions_color)
-                if is_left and intersection.leftjunction:
-                    self._draw_rectangle(
-                            Vec2(0, world_coords.y - 1),
-                            Vec2(world_coords.x - 2, world_coords.y),
-                            avenues_rgb, junctions_color)
-
-        avenues_img.putdata(avenues_rgb)
-
-        self._blend_to_image(avenues_img)
+        self._add_layer("avenues", avenues_grid)
 
     def addstreets(self, streets_blocks: StreetsBlocks) -> None:
-        streets_img = Image.new("RGB", (self.world_settings.width, self.world_settings.height))
-        streets_rgb = [(0, 0, 0) for i in range(self.world_settings.width * self.world_settings.height)]
-        streets_color = (155, 155, 155)
-        cell_x_count = self.world_settings.grid_settings.width
-        cell_y_count = self.world_settings.grid_settings.height
-        street_count = math.floor((self.world_settings.grid_settings.cellsize - 1) / 3)
-        for j in range(cell_y_count):
-            for i in range(cell_x_count):
-                cell_coord = Vec2(i, j)
-                cell_index = streets_blocks.from_grid_to_index(cell_coord)
-                if cell_index in streets_blocks.streets_patterns:
-                    streets_pattern = streets_blocks.streets_patterns[cell_index]
-                    world_coord = self.world_settings.from_grid_to_world(cell_coord)
-                    if streets_pattern.street_pattern == StreetsPattern.StreetPattern.VERTICAL:
-                        for street_index in range(street_count - 1):
-                            self._draw_rectangle(
-                                world_coord + Vec2((street_index + 1) * 3, 1),
-                                world_coord + Vec2((street_index + 1) * 3, self.world_settings.grid_settings.cellsize - 2),
-                                streets_rgb,
-                                streets_color
-                            )
-                    elif streets_pattern.street_pattern == StreetsPattern.StreetPattern.HORIZONTAL:
-                        for street_index in range(street_count - 1):
-                            self._draw_rectangle(
-                                world_coord + Vec2(1, (street_index + 1) * 3),
-                                world_coord + Vec2(self.world_settings.grid_settings.cellsize - 2, (street_index + 1) * 3),
-                                streets_rgb,
-                                streets_color
-                            )
-                    elif streets_pattern.street_pattern == StreetsPattern.StreetPattern.L_TOP_RIGHT:
-                        for street_index in range(street_count - 1):
-                            self._draw_rectangle(
-                                world_coord + Vec2((street_index + 1) * 3, 1),
-                                world_coord + Vec2((street_index + 1) * 3, (self.world_settings.grid_settings.cellsize - 1) - (street_index + 1) * 3),
-                                streets_rgb,
-                                streets_color
-                            )
-                            self._draw_rectangle(
-                                world_coord + Vec2(self.world_settings.grid_settings.cellsize - (street_index + 1) * 3, (street_index + 1) * 3),
-                                world_coord + Vec2(self.world_settings.grid_settings.cellsize - 2, (street_index + 1) * 3),
-                                streets_rgb,
-                                streets_color
-                            )
-                    elif streets_pattern.street_pattern == StreetsPattern.StreetPattern.L_RIGHT_BOTTOM:
-                        for street_index in range(street_count - 1):
-                            self._draw_rectangle(
-                                world_coord + Vec2((street_index + 1) * 3, (street_index + 1) * 3),
-                                world_coord + Vec2(self.world_settings.grid_settings.cellsize - 2, (street_index + 1) * 3),
-                                streets_rgb,
-                                streets_color
-                            )
-                            self._draw_rectangle(
-                                world_coord + Vec2((street_index + 1) * 3, (street_index + 1) * 3 + 1),
-                                world_coord + Vec2((street_index + 1) * 3, self.world_settings.grid_settings.cellsize - 2),
-                                streets_rgb,
-                                streets_color
-                            )
-                    elif streets_pattern.street_pattern == StreetsPattern.StreetPattern.L_BOTTOM_LEFT:
-                        for street_index in range(street_count - 1):
-                            self._draw_rectangle(
-                                world_coord + Vec2((street_index + 1) * 3, (self.world_settings.grid_settings.cellsize - 1) - (street_index + 1) * 3),
-                                world_coord + Vec2((street_index + 1) * 3, self.world_settings.grid_settings.cellsize - 2),
-                                streets_rgb,
-                                streets_color
-                            )
-                            self._draw_rectangle(
-                                world_coord + Vec2(1, (street_index + 1) * 3),
-                                world_coord + Vec2((self.world_settings.grid_settings.cellsize - 2) - (street_index + 1) * 3, (street_index + 1) * 3),
-                                streets_rgb,
-                                streets_color
-                            )
-                    elif streets_pattern.street_pattern == StreetsPattern.StreetPattern.L_LEFT_TOP:
-                        for street_index in range(street_count - 1):
-                            self._draw_rectangle(
-                                world_coord + Vec2(1, (street_index + 1) * 3),
-                                world_coord + Vec2((street_index + 1) * 3, (street_index + 1) * 3),
-                                streets_rgb,
-                                streets_color
-                            )
-                            self._draw_rectangle(
-                                world_coord + Vec2((street_index + 1) * 3, 1),
-                                world_coord + Vec2((street_index + 1) * 3, (street_index + 1) * 3 - 1),
-                                streets_rgb,
-                                streets_color
-                            )
-        streets_img.putdata(streets_rgb)
-        self._blend_to_image(streets_img)
+        self._add_layer("streets", streets_blocks)
+
+    def _render_heat(self, heatmap: HeatMap, origin: Vec2, layer: np.ndarray) -> np.ndarray:
+        height, width = layer.shape[:2]
+        return _heat_colors(heatmap.region(origin.x, origin.y, origin.x + width, origin.y + height), layer)
+
+    def _sample_heat(self, heatmap: HeatMap, xs: np.ndarray, ys: np.ndarray, layer: np.ndarray) -> np.ndarray:
+        return _heat_colors(heatmap.sample(xs[np.newaxis, :], ys[:, np.newaxis]), layer)
+
+    def _render_grid(self, source: None, origin: Vec2, layer: np.ndarray) -> np.ndarray:
+        grid_settings = self.world_settings.grid_settings
+        height, width = layer.shape[:2]
+        xs = np.arange(grid_settings.width + 1) * grid_settings.cellsize + grid_settings.offset.x - origin.x
+        ys = np.arange(grid_settings.height + 1) * grid_settings.cellsize + grid_settings.offset.y - origin.y
+        xs = xs[(xs >= 0) & (xs < width)]
+        ys = ys[(ys >= 0) & (ys < height)]
+        layer[np.ix_(ys, xs)] = (100, 100, 100)
+        return layer
+
+    def _sample_grid(self, source: None, xs: np.ndarray, ys: np.ndarray, layer: np.ndarray) -> np.ndarray:
+        grid_settings = self.world_settings.grid_settings
+        i, u = np.divmod(xs - grid_settings.offset.x, grid_settings.cellsize)
+        j, v = np.divmod(ys - grid_settings.offset.y, grid_settings.cellsize)
+        columns = (u == 0) & (i >= 0) & (i <= grid_settings.width)
+        rows = (v == 0) & (j >= 0) & (j <= grid_settings.height)
+        layer[np.ix_(rows, columns)] = (100, 100, 100)
+        return layer
+
+    def _draw_rectangle(self, topleft: Vec2, bottomright: Vec2, layer: np.ndarray, origin: Vec2, color: "tuple[int, int, int]") -> None:
+        """Draws the world rectangle (corners included) in the layer of a window starting at origin"""
+        x0 = max(topleft.x - origin.x, 0)
+        y0 = max(topleft.y - origin.y, 0)
+        x1 = min(bottomright.x - origin.x + 1, layer.shape[1])
+        y1 = min(bottomright.y - origin.y + 1, layer.shape[0])
+        if x0 < x1 and y0 < y1:
+            layer[y0:y1, x0:x1] = color
+
+    def _stamp(self, layer: np.ndarray, origin: Vec2, lattice_origin: Vec2, templates: np.ndarray, indices: np.ndarray, colors: np.ndarray,
+               template_of: np.ndarray = None) -> None:
+        """
+        Stamps templates on the layer of a window starting at origin.
+        The templates are laid out on a lattice of cellsize tiles starting at the world coords lattice_origin,
+        indices is the matrix of the template of each element of the lattice, colors the color of each label.
+        template_of maps the values of indices to their template (the values are the templates by default),
+        it is only applied to the elements covering the window.
+        """
+        cellsize = templates.shape[1]
+        height, width = layer.shape[:2]
+        i0 = max((origin.x - lattice_origin.x) // cellsize, 0)
+        j0 = max((origin.y - lattice_origin.y) // cellsize, 0)
+        i1 = min(-((lattice_origin.x - origin.x - width) // cellsize), indices.shape[1])
+        j1 = min(-((lattice_origin.y - origin.y - height) // cellsize), indices.shape[0])
+        if i0 >= i1 or j0 >= j1:
+            return
+        window_indices = indices[j0:j1, i0:i1]
+        if template_of is not None:
+            window_indices = template_of[window_indices]
+        labels = templates[window_indices].transpose(0, 2, 1, 3).reshape((j1 - j0) * cellsize, (i1 - i0) * cellsize)
+        # Crop the labels to the window
+        labels_x = lattice_origin.x + i0 * cellsize - origin.x
+        labels_y = lattice_origin.y + j0 * cellsize - origin.y
+        labels = labels[max(-labels_y, 0):height - labels_y, max(-labels_x, 0):width - labels_x]
+        layer_x = max(labels_x, 0)
+        layer_y = max(labels_y, 0)
+        window = layer[layer_y:layer_y + labels.shape[0], layer_x:layer_x + labels.shape[1]]
+        mask = labels != 0
+        window[mask] = colors[labels[mask]]
+
+    def _sample_stamp(self, layer: np.ndarray, xs: np.ndarray, ys: np.ndarray, lattice_origin: Vec2, templates: np.ndarray,
+                      indices: np.ndarray, colors: np.ndarray, template_of: np.ndarray = None) -> None:
+        """Same as _stamp, for a layer of the world tiles of columns xs and rows ys (1D arrays)"""
+        cellsize = templates.shape[1]
+        i, u = np.divmod(xs - lattice_origin.x, cellsize)
+        j, v = np.divmod(ys - lattice_origin.y, cellsize)
+        columns = np.flatnonzero((i >= 0) & (i < indices.shape[1]))
+        rows = np.flatnonzero((j >= 0) & (j < indices.shape[0]))
+        window_indices = indices[np.ix_(j[rows], i[columns])]
+        if template_of is not None:
+            window_indices = template_of[window_indices]
+        labels = templates[window_indices, v[rows, np.newaxis], u[np.newaxis, columns]]
+        window = layer[rows[:, np.newaxis], columns[np.newaxis, :]]
+        mask = labels != 0
+        window[mask] = colors[labels[mask]]
+        layer[rows[:, np.newaxis], columns[np.newaxis, :]] = window
+
+    def _avenues_colors(self) -> np.ndarray:
+        colors = np.zeros((AVENUE_INTERSECTION + 1, 3), dtype=np.uint8)
+        colors[AVENUE_JUNCTION] = AVENUE_JUNCTION_COLOR
+        colors[AVENUE_INTERSECTION] = (255, 255, 255)
+        return colors
+
+    def _edge_avenues(self, avenues_grid: AvenuesGrid) -> "list[tuple[Vec2, Vec2]]":
+        """Returns the rectangles (corners included) of the junctions leaving the grid, they go up to the world edges"""
+        grid_settings = self.world_settings.grid_settings
+        junctions = avenues_grid.junctions
+        rectangles = []
+        for j in np.flatnonzero(junctions[:, -1] & JUNCTION_RIGHT).tolist():
+            world_coords = self.world_settings.from_grid_to_world(Vec2(grid_settings.width, j))
+            rectangles.append((Vec2(world_coords.x + 1, world_coords.y - 1), Vec2(self.world_settings.width - 1, world_coords.y)))
+        for i in np.flatnonzero(junctions[-1, :] & JUNCTION_BOTTOM).tolist():
+            world_coords = self.world_settings.from_grid_to_world(Vec2(i, grid_settings.height))
+            rectangles.append((Vec2(world_coords.x - 1, world_coords.y + 1), Vec2(world_coords.x, self.world_settings.height - 1)))
+        for i in np.flatnonzero(junctions[0, :] & JUNCTION_UP).tolist():
+            world_coords = self.world_settings.from_grid_to_world(Vec2(i, 0))
+            rectangles.append((Vec2(world_coords.x - 1, 0), Vec2(world_coords.x, world_coords.y - 2)))
+        for j in np.flatnonzero(junctions[:, 0] & JUNCTION_LEFT).tolist():
+            world_coords = self.world_settings.from_grid_to_world(Vec2(0, j))
+            rectangles.append((Vec2(0, world_coords.y - 1), Vec2(world_coords.x - 2, world_coords.y)))
+        return rectangles
+
+    def _render_avenues(self, avenues_grid: AvenuesGrid, origin: Vec2, layer: np.ndarray) -> np.ndarray:
+        grid_settings = self.world_settings.grid_settings
+        lattice_origin = Vec2(grid_settings.offset.x - 1, grid_settings.offset.y - 1)
+        self._stamp(layer, origin, lattice_origin, avenue_templates(grid_settings.cellsize), avenues_grid.junctions, self._avenues_colors())
+        for topleft, bottomright in self._edge_avenues(avenues_grid):
+            self._draw_rectangle(topleft, bottomright, layer, origin, AVENUE_JUNCTION_COLOR)
+        return layer
+
+    def _sample_avenues(self, avenues_grid: AvenuesGrid, xs: np.ndarray, ys: np.ndarray, layer: np.ndarray) -> np.ndarray:
+        grid_settings = self.world_settings.grid_settings
+        lattice_origin = Vec2(grid_settings.offset.x - 1, grid_settings.offset.y - 1)
+        self._sample_stamp(layer, xs, ys, lattice_origin, avenue_templates(grid_settings.cellsize), avenues_grid.junctions, self._avenues_colors())
+        for topleft, bottomright in self._edge_avenues(avenues_grid):
+            columns = (xs >= topleft.x) & (xs <= bottomright.x)
+            rows = (ys >= topleft.y) & (ys <= bottomright.y)
+            layer[np.ix_(rows, columns)] = AVENUE_JUNCTION_COLOR
+        return layer
+
+    def _render_streets(self, streets_blocks: StreetsBlocks, origin: Vec2, layer: np.ndarray) -> np.ndarray:
+        grid_settings = self.world_settings.grid_settings
+        colors = np.zeros((STREET + 1, 3), dtype=np.uint8)
+        colors[STREET] = (155, 155, 155)
+        self._stamp(layer, origin, grid_settings.offset, street_templates(grid_settings.cellsize), streets_blocks.patterns, colors,
+                    STREET_TEMPLATE_OF_PATTERN)
+        return layer
+
+    def _sample_streets(self, streets_blocks: StreetsBlocks, xs: np.ndarray, ys: np.ndarray, layer: np.ndarray) -> np.ndarray:
+        grid_settings = self.world_settings.grid_settings
+        colors = np.zeros((STREET + 1, 3), dtype=np.uint8)
+        colors[STREET] = (155, 155, 155)
+        self._sample_stamp(layer, xs, ys, grid_settings.offset, street_templates(grid_settings.cellsize), streets_blocks.patterns, colors,
+                           STREET_TEMPLATE_OF_PATTERN)
+        return layer
+
+
+# Printer and output buffer of a worker process of Printer.render_parallel
+_band_worker: "tuple[Printer, shared_memory.SharedMemory, np.ndarray]" = None
+
+
+def _init_band_worker(sources: tuple, shared_name: str, shape: "tuple[int, int, int]") -> None:
+    global _band_worker
+    shared = shared_memory.SharedMemory(name=shared_name)
+    _band_worker = (Printer.from_sources(sources), shared, np.ndarray(shape, dtype=np.uint8, buffer=shared.buf))
+
+
+def _render_band(band: "tuple[int, int]") -> None:
+    printer, _, pixels = _band_worker
+    y0, y1 = band
+    pixels[y0:y1] = printer.render(0, y0, printer.world_settings.width, y1)
+
+
+def _heat_colors(heat: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Writes in out the RGB colors of the heat values (0 to 1), from blue to red"""
+    hues = np.floor((1.0 - heat.astype(np.float64)) * 170).astype(np.uint8)
+    # The palette has a color per uint8 hue, clip only avoids the buffered copy of mode="raise"
+    return np.take(_heat_palette(), hues, axis=0, out=out, mode="clip")
+
+
+@functools.lru_cache(maxsize=None)
+def _heat_palette() -> np.ndarray:
+    """RGB colors of the heat layer for each hue (full saturation and value, then darkened by half)"""
+    hues = Image.frombytes("HSV", (256, 1), bytes(channel for hue in range(256) for channel in (hue, 255, 255)))
+    return np.array(Image.eval(hues.convert("RGB"), lambda val: math.floor(val * 0.5)), dtype=np.uint8)[0]
@@ -0,0 +1,82 @@
+from avenuesgrid import AvenuesGrid
+from display import Printer
+from streetsblocks import StreetsBlocks
+
+
+"""
+Local edits
+
+A city is edited in place after its generation: the heat of a world rectangle is modified,
+then only what the edit can change is generated again:
+    - the avenues of the vertices reading the edited heat, plus EDIT_MARGIN vertices around them
+      (AvenuesGrid.regenerate_region keeps the avenues entering the region and joins the avenues leaving it
+      to the intersections of the vertices around it, which only get these junctions),
+    - the streets patterns of the cells around these vertices,
+    - the pixels of the window covering the edited heat, avenues and streets (Printer.refresh).
+So the time from an edit to its preview depends on the size of the edit and not on the size of the world,
+except the obstacles search of the cold vertices which reads the whole rows and columns crossing the edit.
+
+Ex:
+editor = CityEditor(avenues_grid, streets_blocks, printer)
+editor.add_heat(100, 100, 300, 200, 0.4)
+printer.image.show()
+"""
+
+
+# Vertices regenerated around the ones reading the edited heat (cold vertices look for obstacles around them)
+EDIT_MARGIN = 2
+
+
+class CityEditor:
+    """
+    CityEditor
+
+    Edits the heat of a generated city and updates its avenues, streets and image (printer is optional).
+    The edit methods return the modified world window: x0, y0 (included), x1, y1 (excluded).
+    """
+    def __init__(self, avenues_grid: AvenuesGrid, streets_blocks: StreetsBlocks, printer: Printer = None,
+                 margin: int = EDIT_MARGIN, engine: AvenuesGrid.Engine = AvenuesGrid.Engine.QUEUE) -> None:
+        self.avenues_grid = avenues_grid
+        self.streets_blocks = streets_blocks
+        self.printer = printer
+        self.margin = margin
+        self.engine = engine
+
+    def add_heat(self, x0: int, y0: int, x1: int, y1: int, delta: float) -> "tuple[int, int, int, int]":
+        """Adds delta to the heat of the world rectangle from x0:y0 (included) to x1:y1 (excluded)"""
+        return self._update(self.avenues_grid.heatmap.add_heat(x0, y0, x1, y1, delta))
+
+    def set_heat(self, x0: int, y0: int, x1: int, y1: int, heat: float) -> "tuple[int, int, int, int]":
+        """Sets the heat of the world rectangle from x0:y0 (included) to x1:y1 (excluded)"""
+        return self._update(self.avenues_grid.heatmap.set_heat(x0, y0, x1, y1, heat))
+
+    def _update(self, heat_window: "tuple[int, int, int, int]") -> "tuple[int, int, int, int]":
+        world_settings = self.avenues_grid.world_settings
+        grid_settings = world_settings.grid_settings
+        cellsize = grid_settings.cellsize
+        offset = grid_settings.offset
+        x0, y0, x1, y1 = heat_window
+
+        with world_settings.instrumentation.stage("edit"):
+            # Vertices whose world coords read the edited heat
+            vx0 = -(-(x0 - offset.x) // cellsize) - self.margin
+            vy0 = -(-(y0 - offset.y) // cellsize) - self.margin
+            vx1 = (x1 - 1 - offset.x) // cellsize + self.margin
+            vy1 = (y1 - 1 - offset.y) // cellsize + self.margin
+            vx0, vy0, vx1, vy1 = self.avenues_grid.regenerate_region(vx0, vy0, vx1, vy1, self.engine)
+            if vx0 > vx1 or vy0 > vy1:
+                window = heat_window
+            else:
+                # Cells around the regenerated vertices
+                self.streets_blocks.update_region(vx0 - 1, vy0 - 1, vx1, vy1)
+                # Avenues are drawn 1 tile up and left of their vertex, and up to the world edges from the grid edges
+                wx0 = 0 if vx0 == 0 else (vx0 - 1) * cellsize + offset.x - 1
+                wy0 = 0 if vy0 == 0 else (vy0 - 1) * cellsize + offset.y - 1
+                wx1 = world_settings.width if vx1 == grid_settings.width else (vx1 + 1) * cellsize + offset.x + 1
+                wy1 = world_settings.height if vy1 == grid_settings.height else (vy1 + 1) * cellsize + offset.y + 1
+                window = (max(min(x0, wx0), 0), max(min(y0, wy0), 0),
+                          min(max(x1, wx1), world_settings.width), min(max(y1, wy1), world_settings.height))
+
+            if self.printer is not None:
+                self.printer.refresh(*window)
+        return window
@@ -0,0 +1,150 @@
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from display import Printer
+
+
+"""
+Streaming export
+
+Cities are rendered one horizontal band of rows at a time with Printer.render and each band is
+compressed straight into the PNG file, so the peak memory depends on the band size and not on the world size.
+
+batch.py exports its cities this way, ex: python batch.py 42 --width 32768 --height 32768 --workers 1
+
+Cities are also exported as a pyramid of PNG tiles of TILE_SIZE pixels, directory/{z}/{x}/{y}.png (the tile server layout):
+a pixel of the deepest zoom is a world tile, each zoom above covers twice more tiles per pixel, zoom 0 is one tile.
+The zoomed out tiles are rendered from the sources at their pixels only (Printer.render_level), so the overview
+zooms of a large city cost a tiny part of its full render.
+
+Ex: export_tiles(printer, "tiles", max_zoom=tile_max_zoom(printer.world_settings.width, printer.world_settings.height) - 3)
+"""
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IDAT_SIZE = 1 << 20
+PNG_FILTER_SUB = 1
+
+TILE_SIZE = 256
+
+
+class PngStreamWriter:
+    """
+    PngStreamWriter
+
+    Writes a 8 bits RGB PNG file from bands of rows given in order from the top.
+
+    Ex:
+    with PngStreamWriter("city.png", width, height) as writer:
+        writer.write_rows(rows)
+    """
+    def __init__(self, path: str, width: int, height: int, compress_level: int = 6) -> None:
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._file = open(path, "wb")
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = bytearray()
+        self._file.write(PNG_SIGNATURE)
+        # 8 bits per channel, color type 2 (RGB), default compression, filter and no interlace
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def __enter__(self) -> "PngStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Compress a band of rows (uint8 matrix of RGB pixels) at the end of the image"""
+        if rows.shape[1:] != (self.width, 3):
+            raise ValueError(f"Rows of size {rows.shape[1]} in a PNG of width {self.width}")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError(f"More than {self.height} rows written in the PNG")
+        # Sub filter: each byte is stored as the difference with the same channel of the previous pixel
+        pixels = rows.reshape(rows.shape[0], -1)
+        filtered = np.empty((pixels.shape[0], pixels.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = PNG_FILTER_SUB
+        filtered[:, 1:4] = pixels[:, 0:3]
+        np.subtract(pixels[:, 3:], pixels[:, :-3], out=filtered[:, 4:])
+        self._pending += self._compressor.compress(filtered.tobytes())
+        self.rows_written += rows.shape[0]
+        self._flush(PNG_IDAT_SIZE)
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            self._file.close()
+            raise ValueError(f"Only {self.rows_written} rows of {self.height} written in the PNG")
+        self._pending += self._compressor.flush()
+        self._flush(1)
+        self._write_chunk(b"IEND", b"")
+        self._file.close()
+
+    def _flush(self, min_size: int) -> None:
+        while len(self._pending) >= min_size:
+            data = bytes(self._pending[:PNG_IDAT_SIZE])
+            del self._pending[:PNG_IDAT_SIZE]
+            self._write_chunk(b"IDAT", data)
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+def export_png(printer: Printer, path: str, band_height: int = 256) -> None:
+    """Renders the layers of printer band by band into a PNG file"""
+    width = printer.world_settings.width
+    height = printer.world_settings.height
+    with PngStreamWriter(path, width, height) as writer:
+        for y0 in range(0, height, band_height):
+            writer.write_rows(printer.render(0, y0, width, min(y0 + band_height, height)))
+
+
+def tile_max_zoom(width: int, height: int, tile_size: int = TILE_SIZE) -> int:
+    """Returns the deepest zoom of the tiles of a world, where a pixel is a world tile"""
+    return max(math.ceil(math.log2(max(width, height) / tile_size)), 0)
+
+
+def render_tile(printer: Printer, z: int, x: int, y: int, max_zoom: int, tile_size: int = TILE_SIZE) -> np.ndarray:
+    """Returns the RGB pixels of the tile x:y of zoom z (max_zoom is the deepest one), black outside of the world"""
+    level = max_zoom - z
+    world_size = tile_size << level
+    width, height = printer.world_settings.width, printer.world_settings.height
+    x0, y0 = x * world_size, y * world_size
+    x1, y1 = min(x0 + world_size, width), min(y0 + world_size, height)
+    tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+    if x0 < x1 and y0 < y1:
+        pixels = printer.render_level(level, x0, y0, x1, y1)
+        tile[:pixels.shape[0], :pixels.shape[1]] = pixels
+    return tile
+
+
+def export_tiles(printer: Printer, directory: str, min_zoom: int = 0, max_zoom: int = None, tile_size: int = TILE_SIZE,
+                 compress_level: int = 6) -> int:
+    """
+    Writes the tiles of the zooms min_zoom to max_zoom (the deepest zoom of the world by default) of printer
+    in directory/{z}/{x}/{y}.png, tiles out of the world are skipped. Returns the number of tiles written.
+    """
+    width, height = printer.world_settings.width, printer.world_settings.height
+    deepest_zoom = tile_max_zoom(width, height, tile_size)
+    max_zoom = deepest_zoom if max_zoom is None else min(max_zoom, deepest_zoom)
+    tiles_count = 0
+    for z in range(min_zoom, max_zoom + 1):
+        world_size = tile_size << (deepest_zoom - z)
+        for x in range(-(-width // world_size)):
+            os.makedirs(os.path.join(directory, str(z), str(x)), exist_ok=True)
+            for y in range(-(-height // world_size)):
+                tile = Image.fromarray(render_tile(printer, z, x, y, deepest_zoom, tile_size))
+                tile.save(os.path.join(directory, str(z), str(x), f"{y}.png"), compress_level=compress_level)
+                tiles_count += 1
+    return tiles_count
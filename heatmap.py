@@ -1,37 +1,187 @@
+from enum import IntEnum
+import functools
 import math
 import random
+from typing import Callable
+
+import numpy as np
 
 from worldsettings import WorldSettings
 
 
+# Radius of the noise engine falloff relative to half the world size, the mean heat is close to the diamond-square one
+HEAT_NOISE_FALLOFF = 0.85
+# Size of the stacks of maps filled at once by HeatMap.generate_batch
+HEAT_BATCH_BYTES = 1024 * 1024
+
+
 class HeatMap:
     """
     HeatMap
 
     A heat map of the size of the world with float values between 0 and 1.
 
-    Values can be read from the heatmap property: a list of list of floats.
-    Format of the map: list of rows, start at the top left.
+    Only the generated map is stored (grid property, a float32 matrix of size 2^scale+1),
+    world coords are mapped to the nearest value of the generated map when read.
+
+    Values can be read one by one with heat_at, by batch with sample or by rectangle with region.
+    The heatmap property keeps the list of rows access, start at the top left.
 
     Ex: read the heat of the 5th elmt of the 2nd line:
+    value = heatmap.heat_at(5, 2)
     value = heatmap.heatmap[2][5]
     """
-    def __init__(self, world_settings: WorldSettings) -> None:
+    class Engine(IntEnum):
+        NUMPY = 0
+        PYTHON = 1
+        NOISE = 2
+
+    def __init__(self, world_settings: WorldSettings, rng: random.Random = None) -> None:
         self.world_settings = world_settings
-        self.heatmap: list[list[float]] = [[0 for j in range(world_settings.width)] for i in range(world_settings.height)]
+        self.rng = rng if rng is not None else random
+        self.grid: np.ndarray = np.zeros((1, 1), dtype=np.float32)
+        self.noise: HeatNoise = None
+
+    @classmethod
+    def from_grid(cls, world_settings: WorldSettings, grid: np.ndarray) -> "HeatMap":
+        """Returns a heat map reading an already generated map"""
+        heat_map = cls(world_settings)
+        heat_map.grid = grid
+        return heat_map
+
+    @property
+    def heatmap(self) -> "HeatMapRows":
+        return HeatMapRows(self)
+
+    def heat_at(self, x: int, y: int) -> float:
+        """Returns the heat of the world tile x:y"""
+        size_y, size_x = self.grid.shape
+        nearest_x = min(max(math.floor((x / self.world_settings.width) * size_x), 0), size_x - 1)
+        nearest_y = min(max(math.floor((y / self.world_settings.height) * size_y), 0), size_y - 1)
+        return float(self.grid[nearest_y, nearest_x])
+
+    def sample(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns the heats of the world tiles of coords xs:ys (arrays of same shape)"""
+        return self.grid[self._nearest_y(np.asarray(ys)), self._nearest_x(np.asarray(xs))]
 
-    def generate(self, scale: int, min_heat: float, max_heat: float) -> None:
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Returns the heats of the world rectangle from x0:y0 (included) to x1:y1 (excluded) as a matrix"""
+        return self.grid[np.ix_(self._nearest_y(np.arange(y0, y1)), self._nearest_x(np.arange(x0, x1)))]
+
+    def add_heat(self, x0: int, y0: int, x1: int, y1: int, delta: float) -> "tuple[int, int, int, int]":
+        """
+        Adds delta to the heat of the world rectangle from x0:y0 (included) to x1:y1 (excluded), clamped between 0 and 1.
+        Returns the world rectangle whose heat may have changed: the generated map values are edited,
+        so it covers all the tiles reading the edited values.
+        """
+        return self._edit(x0, y0, x1, y1, lambda heats: heats + delta)
+
+    def set_heat(self, x0: int, y0: int, x1: int, y1: int, heat: float) -> "tuple[int, int, int, int]":
+        """Same as add_heat, but sets the heat of the rectangle to heat"""
+        return self._edit(x0, y0, x1, y1, lambda heats: np.full_like(heats, heat))
+
+    def _edit(self, x0: int, y0: int, x1: int, y1: int, edit: "Callable[[np.ndarray], np.ndarray]") -> "tuple[int, int, int, int]":
+        size_y, size_x = self.grid.shape
+        gx0, gx1 = int(self._nearest_x(x0)), int(self._nearest_x(x1 - 1)) + 1
+        gy0, gy1 = int(self._nearest_y(y0)), int(self._nearest_y(y1 - 1)) + 1
+        self.grid[gy0:gy1, gx0:gx1] = np.clip(edit(self.grid[gy0:gy1, gx0:gx1]), 0, 1)
+        # Tiles reading the edited values, one more tile on each side for the rounding of the mapping
+        width, height = self.world_settings.width, self.world_settings.height
+        return (max(-(-gx0 * width // size_x) - 1, 0), max(-(-gy0 * height // size_y) - 1, 0),
+                min(-(-gx1 * width // size_x) + 1, width), min(-(-gy1 * height // size_y) + 1, height))
+
+    def _nearest_x(self, xs: np.ndarray) -> np.ndarray:
+        size_x = self.grid.shape[1]
+        return np.clip(np.floor((xs / self.world_settings.width) * size_x), 0, size_x - 1).astype(np.intp)
+
+    def _nearest_y(self, ys: np.ndarray) -> np.ndarray:
+        size_y = self.grid.shape[0]
+        return np.clip(np.floor((ys / self.world_settings.height) * size_y), 0, size_y - 1).astype(np.intp)
+
+    def generate(self, scale: int, min_heat: float, max_heat: float, engine: Engine = Engine.NUMPY) -> None:
         """
         Generate heat map with the diamond-square algorithm.
         scale is a positive integer that will be used to define the size of the generated map
         with the following formula 2^scale+1.
         min_heat and max_heat can be any float values but in the end of the generation, all values
         are clamped between 0 and 1.
-        Then the map is fitted to the world size with a simple nearest logic.
+        The generated map is then read with a simple nearest logic to fit the world size.
+
+        engine selects the implementation: NUMPY computes each diamond and square step as a whole-array
+        operation, PYTHON is the original cell by cell implementation. Both follow the same rules.
+        NOISE replaces the diamond-square with a HeatNoise (kept in the noise property, it can be evaluated
+        anywhere in the world), the generated map holds its values at the tiles read for each element.
         """
         size: int = pow(2, scale) + 1
-        print(f"Generate a heat map of size {size}")
+        instrumentation = self.world_settings.instrumentation
+        instrumentation.info("heat", f"Generate a heat map of size {size}", size=size)
 
+        with instrumentation.stage("heat"):
+            if engine == HeatMap.Engine.NUMPY:
+                gen_heatmap = self._generate_numpy(size, min_heat, max_heat)
+            elif engine == HeatMap.Engine.NOISE:
+                gen_heatmap = self._generate_noise(size, min_heat, max_heat)
+            else:
+                gen_heatmap = np.array(self._generate_python(size, min_heat, max_heat))
+            self.grid = gen_heatmap.astype(np.float32)
+            instrumentation.count("heat_values", size * size)
+
+    @classmethod
+    def generate_batch(cls, world_settings: WorldSettings, rngs: "list[random.Random]", scale: int,
+                       min_heat: "float | list[float]", max_heat: "float | list[float]") -> np.ndarray:
+        """
+        Generates one heat map per generator of rngs with the NUMPY engine, diamond-square runs on stacks of maps
+        (each diamond and square step is one array operation for all the maps of a stack).
+        min_heat and max_heat are floats or lists of one value per map.
+        Returns the generated maps as a N x size x size array of float32, the map i is the same
+        as the grid of HeatMap(world_settings, rngs[i]).generate(scale, min_heat[i], max_heat[i]).
+
+        Ex: heat maps of a sweep of max heats
+        grids = HeatMap.generate_batch(world_settings, [random.Random(seed) for seed in range(100)], 10, -0.3, np.linspace(1, 2, 100))
+        heat_map = HeatMap.from_grid(world_settings, grids[42])
+        """
+        size: int = pow(2, scale) + 1
+        count = len(rngs)
+        min_heats = np.broadcast_to(np.asarray(min_heat, dtype=np.float64), (count,)).reshape(count, 1, 1)
+        max_heats = np.broadcast_to(np.asarray(max_heat, dtype=np.float64), (count,))
+        instrumentation = world_settings.instrumentation
+        instrumentation.info("heat", f"Generate {count} heat maps of size {size}", size=size, count=count)
+
+        with instrumentation.stage("heat"):
+            generators = [np.random.default_rng(rng.getrandbits(64)) for rng in rngs]
+            grids = np.empty((count, size, size), dtype=np.float32)
+            middle = (size - 1) // 2
+            # Maps are filled by stacks of about HEAT_BATCH_BYTES, larger stacks are slowed down by the memory bandwidth
+            stack_count = max(HEAT_BATCH_BYTES // (size * size * 8), 1)
+            for first in range(0, count, stack_count):
+                members = slice(first, first + stack_count)
+                gen_heatmaps = np.empty((len(generators[members]), size, size), dtype=np.float64)
+                gen_heatmaps[...] = min_heats[members]
+                gen_heatmaps[:, middle, middle] = max_heats[members]
+                diamond_square(gen_heatmaps, (size - 1) // 2, min_heats[members], generators[members])
+                grids[members] = np.clip(gen_heatmaps, 0, 1)
+            instrumentation.count("heat_values", count * size * size)
+        return grids
+
+    def _generate_numpy(self, size: int, min_heat: float, max_heat: float) -> np.ndarray:
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        gen_heatmap = np.full((size, size), min_heat, dtype=np.float64)
+        middle = (size - 1) // 2
+        gen_heatmap[middle, middle] = max_heat
+
+        diamond_square(gen_heatmap, (size - 1) // 2, min_heat, rng)
+        return np.clip(gen_heatmap, 0, 1)
+
+    def _generate_noise(self, size: int, min_heat: float, max_heat: float) -> np.ndarray:
+        width, height = self.world_settings.width, self.world_settings.height
+        self.noise = HeatNoise(self.rng.getrandbits(64), min_heat, max_heat, center=(width / 2, height / 2),
+                               radius=(width / 2 * HEAT_NOISE_FALLOFF, height / 2 * HEAT_NOISE_FALLOFF), wavelength=max(width, height) / 4)
+        # Lowest world tile read for each element of the generated map (see _nearest_x)
+        xs = np.ceil(np.arange(size) * width / size)
+        ys = np.ceil(np.arange(size) * height / size)
+        return self.noise.evaluate_grid(xs, ys)
+
+    def _generate_python(self, size: int, min_heat: float, max_heat: float) -> "list[list[float]]":
         gen_heatmap = [[min_heat for j in range(size)] for i in range(size)]
         middle = int((size - 1) / 2)
         gen_heatmap[middle][middle] = max_heat
@@ -71,12 +221,7 @@ class HeatMap:
             for y in range(size):
                 gen_heatmap[y][x] = self._clamp(gen_heatmap[y][x], 0, 1)
 
-        # Scale to world
-        for y in range(self.world_settings.height):
-            for x in range(self.world_settings.width):
-                nearest_x = math.floor((x / self.world_settings.width) * size)
-                nearest_y = math.floor((y / self.world_settings.height) * size)
-                self.heatmap[y][x] = gen_heatmap[nearest_y][nearest_x]
+        return gen_heatmap
 
     def _clamp(self, val: float, min_val: float, max_val: float) -> float:
         return min(max(val, min_val), max_val)
@@ -88,7 +233,7 @@ class HeatMap:
         if min(heats) == max(heats):
             return heats[0]
         else:
-            return random.uniform(min(heats), max(heats))
+            return self.rng.uniform(min(heats), max(heats))
 
     def _rand_in_80_range(self, heats: "tuple[float]") -> float:
         min_val = min(heats)
@@ -97,7 +242,228 @@ class HeatMap:
             return heats[0]
         else:
             max_val_80 = min_val + 0.8 * (max_val - min_val)
-            return random.uniform(min_val, max_val_80)
+            return self.rng.uniform(min_val, max_val_80)
 
     def _compute_func(self, heats: "tuple[float]") -> float:
         return self._rand_in_80_range(heats)
+
+
+def diamond_square(gen_heatmap: np.ndarray, step: int, min_heat: "float | np.ndarray",
+                   rng: "np.random.Generator | list[np.random.Generator]", keep_edges: bool = False) -> None:
+    """
+    Fills gen_heatmap (a square matrix of size 2^n+1) in place with the diamond-square algorithm,
+    values at the multiples of step must already be set.
+    Each diamond and square step is computed as a whole-array operation.
+    With keep_edges, the values on the edges of the map are also expected to be set and are not modified.
+
+    gen_heatmap can also be a stack of maps (N x size x size): min_heat is then a float or an array of shape (N, 1, 1)
+    and rng a list of one generator per map, each map is filled as if it was alone.
+    """
+    size = gen_heatmap.shape[-1]
+    # The maps are padded once with min_heat for the out of bound neighbours of the square steps
+    pad = step // 2
+    padded = np.full(gen_heatmap.shape[:-2] + (size + 2 * pad, size + 2 * pad), min_heat, dtype=gen_heatmap.dtype)
+    heatmap = padded[..., pad:pad + size, pad:pad + size]
+    heatmap[...] = gen_heatmap
+    if keep_edges:
+        edges = (heatmap[..., 0, :].copy(), heatmap[..., -1, :].copy(), heatmap[..., :, 0].copy(), heatmap[..., :, -1].copy())
+
+    def shifted(start_y: int, start_x: int, dy: int, dx: int) -> np.ndarray:
+        """Values at dy:dx of the points from start_y:start_x by step (padding for the out of bound ones)"""
+        return padded[..., pad + dy + start_y:pad + dy + size:step, pad + dx + start_x:pad + dx + size:step]
+
+    while step > 1:
+        half_step = step // 2
+        # Diamond step: centers of the squares get a value from their 4 corners
+        corners = (
+            shifted(half_step, half_step, -half_step, -half_step),
+            shifted(half_step, half_step, -half_step, half_step),
+            shifted(half_step, half_step, half_step, half_step),
+            shifted(half_step, half_step, half_step, -half_step)
+        )
+        heatmap[..., half_step::step, half_step::step] = rand_in_80_range(corners, rng)
+
+        # Square step: middles of the edges get a value from their 4 direct neighbours
+        for start_y, start_x in ((half_step, 0), (0, half_step)):
+            neighbours = (
+                shifted(start_y, start_x, 0, -half_step),
+                shifted(start_y, start_x, 0, half_step),
+                shifted(start_y, start_x, -half_step, 0),
+                shifted(start_y, start_x, half_step, 0)
+            )
+            heatmap[..., start_y::step, start_x::step] = rand_in_80_range(neighbours, rng)
+        if keep_edges:
+            heatmap[..., 0, :], heatmap[..., -1, :], heatmap[..., :, 0], heatmap[..., :, -1] = edges
+        step = half_step
+    gen_heatmap[...] = heatmap
+
+
+def rand_in_80_range(heats: "np.ndarray | tuple[np.ndarray, ...]", rng: "np.random.Generator | list[np.random.Generator]") -> np.ndarray:
+    """
+    Random values in the lower 80% of the range of heats, computed along the first axis (or across the tuple of arrays).
+    With a list of generators, the arrays are stacks of maps and each map draws from its own generator.
+    """
+    min_val = functools.reduce(np.minimum, heats)
+    max_val = functools.reduce(np.maximum, heats)
+    if isinstance(rng, list):
+        randoms = np.empty(min_val.shape)
+        for member_rng, member_randoms in zip(rng, randoms):
+            member_rng.random(out=member_randoms)
+    else:
+        randoms = rng.random(min_val.shape)
+    return min_val + 0.8 * (max_val - min_val) * randoms
+
+
+class HeatNoise:
+    """
+    HeatNoise
+
+    Heat as a function of the world coords, a point evaluable alternative to the diamond-square:
+    a base heat going from max_heat at center to min_heat at radius (x and y radius of an ellipse) and beyond,
+    plus a multi octaves value noise of amplitude (max_heat - min_heat) / 2 whose first octave has a period of wavelength tiles.
+    Without center, the base heat is the middle of min_heat and max_heat everywhere (unbounded worlds).
+
+    The noise only depends on the seed and the coords, any point or region is evaluated without state
+    and with the same result, so regions and chunks only cost the tiles they ask for. Values are clamped between 0 and 1.
+    """
+    def __init__(self, seed: int, min_heat: float, max_heat: float, center: "tuple[float, float]" = None,
+                 radius: "tuple[float, float]" = None, wavelength: float = 256.0, octaves: int = 5) -> None:
+        self.seed = seed
+        self.min_heat = min_heat
+        self.max_heat = max_heat
+        self.center = center
+        self.radius = radius
+        self.wavelength = wavelength
+        self.octaves = octaves
+
+    def evaluate(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns the heat at the world coords xs:ys (arrays, broadcasted together)"""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        return self._heat(xs, ys, self._fbm(xs, ys, self._value_noise))
+
+    def evaluate_grid(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns the heat at the world coords of the grid of columns xs and rows ys (1D arrays) as a matrix"""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        return self._heat(xs[np.newaxis, :], ys[:, np.newaxis], self._fbm(xs, ys, self._value_noise_grid))
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Returns the heat of the world rectangle from x0:y0 (included) to x1:y1 (excluded) as a matrix"""
+        return self.evaluate_grid(np.arange(x0, x1), np.arange(y0, y1))
+
+    def _heat(self, xs: np.ndarray, ys: np.ndarray, noise: np.ndarray) -> np.ndarray:
+        if self.center is None:
+            base = (self.min_heat + self.max_heat) / 2
+        else:
+            distance = np.sqrt(((xs - self.center[0]) / self.radius[0]) ** 2 + ((ys - self.center[1]) / self.radius[1]) ** 2)
+            base = self.max_heat + (self.min_heat - self.max_heat) * np.minimum(distance, 1)
+        return np.clip(base + (self.max_heat - self.min_heat) / 2 * noise, 0, 1)
+
+    def _fbm(self, xs: np.ndarray, ys: np.ndarray, value_noise: "Callable[[np.ndarray, np.ndarray, int], np.ndarray]") -> np.ndarray:
+        """Sum of the octaves of value noise, each one of half the period and half the amplitude of the previous, in -1:1"""
+        total = 0.0
+        amplitude = 1.0
+        frequency = 1 / self.wavelength
+        for octave in range(self.octaves):
+            total = total + amplitude * value_noise(xs * frequency, ys * frequency, octave)
+            amplitude *= 0.5
+            frequency *= 2
+        return total / (2 - 2 * amplitude)
+
+    def _value_noise_grid(self, xs: np.ndarray, ys: np.ndarray, octave: int) -> np.ndarray:
+        """Same as _value_noise on the grid of columns xs and rows ys, interpolated along x then along y"""
+        ix, fx = _fade(xs)
+        iy, fy = _fade(ys)
+        if ix.size == 0 or iy.size == 0:
+            return np.zeros((iy.size, ix.size))
+        # Lattice around the queried coords only, indexed relative to its top left corner
+        min_x, min_y = int(ix.min()), int(iy.min())
+        values = self._lattice(np.arange(min_x, int(ix.max()) + 2)[np.newaxis, :],
+                               np.arange(min_y, int(iy.max()) + 2)[:, np.newaxis], octave)
+        ix -= min_x
+        iy -= min_y
+        rows = values[:, ix] * (1 - fx) + values[:, ix + 1] * fx
+        return rows[iy] * (1 - fy)[:, np.newaxis] + rows[iy + 1] * fy[:, np.newaxis]
+
+    def _value_noise(self, xs: np.ndarray, ys: np.ndarray, octave: int) -> np.ndarray:
+        """Random values in -1:1 at the integer coords, smoothly interpolated between them"""
+        ix, fx = _fade(xs)
+        iy, fy = _fade(ys)
+        if ix.size == 0 or iy.size == 0:
+            return np.zeros(np.broadcast(ix, iy).shape)
+        min_x, min_y = int(ix.min()), int(iy.min())
+        span_x, span_y = int(ix.max()) - min_x + 2, int(iy.max()) - min_y + 2
+        if span_x * span_y <= 4 * np.broadcast(ix, iy).size:
+            # Few integer coords (regions): random values of all the coords around the points, then read for each corner
+            values = self._lattice(np.arange(min_x, min_x + span_x)[np.newaxis, :], np.arange(min_y, min_y + span_y)[:, np.newaxis], octave)
+            ix -= min_x
+            iy -= min_y
+
+            def corner(dx: int, dy: int) -> np.ndarray:
+                return values[iy + dy, ix + dx]
+        else:
+            def corner(dx: int, dy: int) -> np.ndarray:
+                return self._lattice(ix + dx, iy + dy, octave)
+        top = corner(0, 0) * (1 - fx) + corner(1, 0) * fx
+        bottom = corner(0, 1) * (1 - fx) + corner(1, 1) * fx
+        return top * (1 - fy) + bottom * fy
+
+    def _lattice(self, ix: np.ndarray, iy: np.ndarray, octave: int) -> np.ndarray:
+        # splitmix64 of the coords, the octave and the seed (multiplications wrap around on purpose)
+        with np.errstate(over="ignore"):
+            bits = ix.astype(np.int64).view(np.uint64) * np.uint64(0x9E3779B97F4A7C15) ^ iy.astype(np.int64).view(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+            bits ^= np.uint64((self.seed + octave * 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF)
+            bits ^= bits >> np.uint64(30)
+            bits *= np.uint64(0xBF58476D1CE4E5B9)
+            bits ^= bits >> np.uint64(27)
+            bits *= np.uint64(0x94D049BB133111EB)
+            bits ^= bits >> np.uint64(31)
+        return (bits >> np.uint64(11)) * (2.0 / (1 << 53)) - 1
+
+
+def _fade(coords: np.ndarray) -> "tuple[np.ndarray, np.ndarray]":
+    """Returns the integer part of coords and the quintic fade of their fractional part (continuous first and second derivatives)"""
+    integers = np.floor(coords)
+    fractions = coords - integers
+    return integers.astype(np.int64), fractions * fractions * fractions * (fractions * (fractions * 6 - 15) + 10)
+
+
+class HeatMapRows:
+    """
+    HeatMapRows
+
+    List of rows like access to a HeatMap: heatmap.heatmap[y][x].
+    Rows are not materialized, each value is read from the generated map when accessed.
+    """
+    def __init__(self, heat_map: HeatMap) -> None:
+        self.heat_map = heat_map
+
+    def __len__(self) -> int:
+        return self.heat_map.world_settings.height
+
+    def __getitem__(self, y: int) -> "HeatMapRow":
+        if y < 0 or y >= len(self):
+            raise IndexError(f"Heat map row out of bound {y}")
+        return HeatMapRow(self.heat_map, y)
+
+    def __iter__(self):
+        for y in range(len(self)):
+            yield HeatMapRow(self.heat_map, y)
+
+
+class HeatMapRow:
+    def __init__(self, heat_map: HeatMap, y: int) -> None:
+        self.heat_map = heat_map
+        self.y = y
+
+    def __len__(self) -> int:
+        return self.heat_map.world_settings.width
+
+    def __getitem__(self, x: int) -> float:
+        if x < 0 or x >= len(self):
+            raise IndexError(f"Heat map column out of bound {x}")
+        return self.heat_map.heat_at(x, self.y)
+
+    def __iter__(self):
+        yield from self.heat_map.region(0, self.y, len(self), self.y + 1)[0].tolist()
@@ -0,0 +1,146 @@
+import contextlib
+import cProfile
+from dataclasses import dataclass
+import pstats
+import time
+import tracemalloc
+from typing import Callable
+
+
+"""
+Instrumentation
+
+The generation reports what it does as events sent to an observer, a callable receiving each Event:
+    - info events replace the progress messages (world size, grid, heat map size...),
+    - stage events are sent at the end of each stage (heat, avenues, streets...) with its duration
+      and the counters incremented during the stage (build orders processed, intersections created...).
+
+The instrumentation is given to WorldSettings and read by every class of the world.
+Without observer, the instrumentation is disabled: stage returns a shared empty context, info and count return at once,
+and the counters that need some computation are only computed when enabled is True.
+
+Stages can also be profiled with cProfile and their memory peak measured with tracemalloc (only the outermost stages).
+
+Ex: print the events
+world_settings = WorldSettings(256, 256, instrumentation=Instrumentation(print_observer))
+"""
+
+
+EVENT_INFO = "info"
+EVENT_STAGE = "stage"
+
+
+@dataclass
+class Event:
+    kind: str
+    stage: str
+    message: str = ""
+    data: dict = None
+    duration: float = None
+    counters: "dict[str, int]" = None
+    peak_memory: int = None
+    profile: pstats.Stats = None
+
+
+class Instrumentation:
+    """
+    Instrumentation
+
+    Sends the events of the generation to observer, disabled without observer.
+    profile captures a cProfile of each outermost stage, trace_memory its tracemalloc peak (in the Event).
+    The counters of a stage are added to the counters of the enclosing stage, or to the counters property at the top level.
+    """
+    def __init__(self, observer: "Callable[[Event], None]" = None, profile: bool = False, trace_memory: bool = False) -> None:
+        self.observer = observer
+        self.enabled = observer is not None
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.counters: "dict[str, int]" = dict()
+        self._stages_counters: "list[dict[str, int]]" = []
+
+    def info(self, stage: str, message: str, **data) -> None:
+        if self.enabled:
+            self.observer(Event(EVENT_INFO, stage, message, data))
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            counters = self._stages_counters[-1] if self._stages_counters else self.counters
+            counters[name] = counters.get(name, 0) + value
+
+    def stage(self, name: str) -> "contextlib.AbstractContextManager":
+        """Returns a context measuring the stage name, sends its stage event when it exits"""
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name: str):
+        outermost = not self._stages_counters
+        counters: "dict[str, int]" = dict()
+        self._stages_counters.append(counters)
+        profiler = cProfile.Profile() if self.profile and outermost else None
+        tracing = self.trace_memory and outermost
+        if tracing:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_base = tracemalloc.get_traced_memory()[0]
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            if tracing:
+                peak_memory = tracemalloc.get_traced_memory()[1] - memory_base
+                if started_tracing:
+                    tracemalloc.stop()
+            self._stages_counters.pop()
+
+        parent = self._stages_counters[-1] if self._stages_counters else self.counters
+        for counter, value in counters.items():
+            parent[counter] = parent.get(counter, 0) + value
+        self.observer(Event(
+            EVENT_STAGE, name,
+            duration=duration,
+            counters=counters,
+            peak_memory=peak_memory if tracing else None,
+            profile=pstats.Stats(profiler) if profiler is not None else None))
+
+
+_DISABLED_STAGE = contextlib.nullcontext()
+DISABLED_INSTRUMENTATION = Instrumentation()
+
+
+def print_observer(event: Event) -> None:
+    """Observer printing the progress messages and the stages durations"""
+    if event.kind == EVENT_INFO:
+        print(event.message)
+    else:
+        counters = "".join(f", {counter}: {value}" for counter, value in event.counters.items())
+        print(f"Stage {event.stage}: {event.duration * 1000:.1f}ms{counters}")
+
+
+class EventLog:
+    """
+    EventLog
+
+    Observer keeping all the events, ex: Instrumentation(EventLog()).
+    """
+    def __init__(self) -> None:
+        self.events: "list[Event]" = []
+
+    def __call__(self, event: Event) -> None:
+        self.events.append(event)
+
+    def durations(self) -> "dict[str, float]":
+        """Returns the total duration of each stage"""
+        durations = dict()
+        for event in self.events:
+            if event.kind == EVENT_STAGE:
+                durations[event.stage] = durations.get(event.stage, 0.0) + event.duration
+        return durations
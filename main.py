@@ -3,10 +3,12 @@ from heatmap import HeatMap
 from streetsblocks import StreetsBlocks
 from worldsettings import WorldSettings
 from display import Printer
+from instrumentation import Instrumentation, print_observer
 
 
 if __name__ == "__main__":
-    world_settings = WorldSettings(256, 256)
+    instrumentation = Instrumentation(print_observer)
+    world_settings = WorldSettings(256, 256, instrumentation=instrumentation)
 
     heat_map = HeatMap(world_settings)
     heat_map.generate(7, -0.3, 1.3)
@@ -23,4 +25,6 @@ if __name__ == "__main__":
     printer.addavenues(avenues_grid)
     printer.addstreets(streets_blocks)
 
-    printer.image.show()
+    with instrumentation.stage("render"):
+        image = printer.image
+    image.show()
@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class CityParameters:
+    """
+    CityParameters
+
+    Parameters of the generation of a city, shared by the batch, the pipeline and the tile server:
+    world size, heat map scale (the generated map size is 2^scale+1), heat range and avenues heat factor.
+    """
+    width: int = 256
+    height: int = 256
+    scale: int = 7
+    min_heat: float = -0.3
+    max_heat: float = 1.3
+    heat_factor: float = 1.3
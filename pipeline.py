@@ -0,0 +1,239 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import random
+import threading
+
+import numpy as np
+
+from avenuesgrid import AvenuesGrid
+from display import Printer
+from heatmap import HeatMap
+from instrumentation import Instrumentation
+from parameters import CityParameters
+from streetsblocks import StreetsBlocks
+from worldsettings import WorldSettings
+
+
+"""
+Generation pipeline
+
+Runs the stages of a city (heat -> avenues -> streets -> render) and caches the output of each stage,
+keyed by a hash of its inputs: the parameters it reads and the keys of the stages it depends on.
+A stage only runs again when one of its inputs changed, ex: a new heat_factor runs avenues, streets and render again
+but keeps the heat map, a new set of layers only renders again.
+
+Each stage draws its random numbers from its own random.Random seeded from the city seed and the stage name,
+so a stage gives the same output whether its inputs were generated or read from the cache.
+
+Outputs are the raw arrays of the stages (heat grid, junctions, patterns, RGB pixels), kept in a LRU cache in memory
+and, with a cache directory, in .npy files. Both caches are bounded in bytes, the least recently used outputs are evicted.
+
+Ex:
+pipeline = Pipeline(42, CityParameters(width=1024, height=1024), cache_dir="cache")
+pixels = pipeline.render()
+pipeline.parameters.heat_factor = 1.5
+pixels = pipeline.render()  # heat read from the cache
+"""
+
+
+PIPELINE_LAYERS = ("heat", "grid", "avenues", "streets")
+
+
+def stage_key(*values: object) -> str:
+    """Returns the hash of the JSON serializable values, stable between runs and platforms"""
+    return hashlib.blake2b(json.dumps(values).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class StageCache:
+    """
+    StageCache
+
+    Arrays keyed by stage keys, in a LRU cache in memory bounded to memory_bytes and,
+    if directory is given, in .npy files of this directory bounded to disk_bytes.
+    The cached arrays are private: put stores a copy and get returns a copy, so the stages can modify them (ex: edits).
+    The cache can be shared by threads.
+    """
+    def __init__(self, directory: str = None, memory_bytes: int = 256 * 1024 * 1024, disk_bytes: int = 1024 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.arrays: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.cached_bytes = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> np.ndarray:
+        """Returns a copy of the array of key, None if it is not cached"""
+        with self._lock:
+            if key in self.arrays:
+                self.arrays.move_to_end(key)
+                return self.arrays[key].copy()
+            if self.directory is None:
+                return None
+            path = self._path(key)
+            try:
+                array = np.load(path)
+            except FileNotFoundError:
+                return None
+            try:
+                # The modification time orders the files for the eviction
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process since it was loaded
+                return None
+            self._cache(key, array)
+            return array.copy()
+
+    def put(self, key: str, array: np.ndarray) -> None:
+        """Caches a copy of array, the stage that computed it can keep modifying it"""
+        array = array.copy()
+        with self._lock:
+            self._cache(key, array)
+            if self.directory is not None:
+                # Write then rename so a reader never sees a partial file (the temporary name is unique to the process)
+                path = self._path(key)
+                temporary_path = f"{path}.{os.getpid()}.tmp"
+                with open(temporary_path, "wb") as array_file:
+                    np.save(array_file, array)
+                os.replace(temporary_path, path)
+                self._evict_files()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _cache(self, key: str, array: np.ndarray) -> None:
+        """Stores array in the memory LRU, the lock must be held"""
+        array.flags.writeable = False
+        if key in self.arrays:
+            self.cached_bytes -= self.arrays.pop(key).nbytes
+        self.arrays[key] = array
+        self.cached_bytes += array.nbytes
+        while self.cached_bytes > self.memory_bytes and len(self.arrays) > 1:
+            _, evicted = self.arrays.popitem(last=False)
+            self.cached_bytes -= evicted.nbytes
+
+    def _evict_files(self) -> None:
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process since the listing
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        disk_bytes = sum(size for _, size, _ in files)
+        # Oldest first, the last written file is always kept
+        for _, size, path in sorted(files)[:-1]:
+            if disk_bytes <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            disk_bytes -= size
+
+
+class Pipeline:
+    """
+    Pipeline
+
+    The stages of the city of seed generated with parameters, see the module description.
+    parameters can be modified between two calls, only the stages depending on the modified parameters run again.
+
+    world_settings, heat_map, avenues_grid and streets_blocks return the objects of each stage, render the RGB pixels.
+    """
+    def __init__(self, seed: int, parameters: CityParameters = None, cache_dir: str = None, cache: StageCache = None,
+                 instrumentation: Instrumentation = None) -> None:
+        self.seed = seed
+        self.parameters = parameters if parameters is not None else CityParameters()
+        self.cache = cache if cache is not None else StageCache(cache_dir)
+        self.instrumentation = instrumentation
+
+    def _stage_rng(self, stage: str) -> random.Random:
+        return random.Random(stage_key(self.seed, stage))
+
+    def world_key(self) -> str:
+        return stage_key("world", self.seed, self.parameters.width, self.parameters.height)
+
+    def heat_key(self) -> str:
+        return stage_key("heat", self.world_key(), self.parameters.scale, self.parameters.min_heat, self.parameters.max_heat)
+
+    def avenues_key(self) -> str:
+        return stage_key("avenues", self.heat_key(), self.parameters.heat_factor)
+
+    def streets_key(self) -> str:
+        return stage_key("streets", self.avenues_key())
+
+    def render_key(self, layers: "tuple[str, ...]") -> str:
+        return stage_key("render", self.streets_key(), list(layers))
+
+    def world_settings(self) -> WorldSettings:
+        # The grid settings only depend on the world stage rng, they are generated again each time
+        return WorldSettings(self.parameters.width, self.parameters.height, rng=self._stage_rng("world"), instrumentation=self.instrumentation)
+
+    def heat_map(self, world_settings: WorldSettings = None) -> HeatMap:
+        world_settings = world_settings if world_settings is not None else self.world_settings()
+        grid = self._cached("heat", self.heat_key())
+        if grid is not None:
+            return HeatMap.from_grid(world_settings, grid)
+        heat_map = HeatMap(world_settings, self._stage_rng("heat"))
+        heat_map.generate(self.parameters.scale, self.parameters.min_heat, self.parameters.max_heat)
+        self.cache.put(self.heat_key(), heat_map.grid)
+        return heat_map
+
+    def avenues_grid(self, heat_map: HeatMap = None) -> AvenuesGrid:
+        heat_map = heat_map if heat_map is not None else self.heat_map()
+        avenues_grid = AvenuesGrid(heat_map.world_settings, heat_map, self._stage_rng("avenues"))
+        avenues_grid.heat_factor = self.parameters.heat_factor
+        junctions = self._cached("avenues", self.avenues_key())
+        if junctions is not None:
+            avenues_grid.junctions = junctions
+            return avenues_grid
+        avenues_grid.generate()
+        self.cache.put(self.avenues_key(), avenues_grid.junctions)
+        return avenues_grid
+
+    def streets_blocks(self, avenues_grid: AvenuesGrid = None) -> StreetsBlocks:
+        avenues_grid = avenues_grid if avenues_grid is not None else self.avenues_grid()
+        streets_blocks = StreetsBlocks(avenues_grid.world_settings, avenues_grid)
+        patterns = self._cached("streets", self.streets_key())
+        if patterns is not None:
+            streets_blocks.patterns = patterns
+            return streets_blocks
+        streets_blocks.generate()
+        self.cache.put(self.streets_key(), streets_blocks.patterns)
+        return streets_blocks
+
+    def render(self, layers: "tuple[str, ...]" = PIPELINE_LAYERS) -> np.ndarray:
+        """Returns the RGB pixels of the city with the given layers (names of PIPELINE_LAYERS, in the drawing order)"""
+        layers = tuple(layers)
+        pixels = self._cached("render", self.render_key(layers))
+        if pixels is not None:
+            return pixels
+        streets_blocks = self.streets_blocks()
+        avenues_grid = streets_blocks.avenues_grid
+        printer = Printer(streets_blocks.world_settings)
+        for layer in layers:
+            if layer == "heat":
+                printer.addheat(avenues_grid.heatmap)
+            elif layer == "grid":
+                printer.addgrid()
+            elif layer == "avenues":
+                printer.addavenues(avenues_grid)
+            elif layer == "streets":
+                printer.addstreets(streets_blocks)
+            else:
+                raise ValueError(f"Unknown layer {layer}")
+        pixels = printer.render()
+        self.cache.put(self.render_key(layers), pixels)
+        return pixels
+
+    def _cached(self, stage: str, key: str) -> np.ndarray:
+        array = self.cache.get(key)
+        if self.instrumentation is not None:
+            self.instrumentation.count(f"{stage}_cache_{'hits' if array is not None else 'misses'}")
+        return array
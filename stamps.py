@@ -0,0 +1,83 @@
+import functools
+import math
+
+import numpy as np
+
+from avenuesgrid import INTERSECTION, JUNCTION_BOTTOM, JUNCTION_RIGHT
+from streetsblocks import NO_STREETS, StreetsPattern
+
+
+"""
+Stamps
+
+The tiles of avenues and streets only depend on the cell size, the junctions of a vertex and the pattern of a block.
+They are precomputed once as cellsize x cellsize templates of labels (0 for nothing) that can be stamped on the world.
+
+Avenue templates are indexed by the junctions bits of a vertex and start 1 tile up and left of the vertex:
+the intersection (2x2 tiles) then the right and bottom junctions up to the next intersection.
+Up and left junctions are drawn by the previous vertices, except on the grid edges.
+
+Street templates are indexed by StreetsPattern.StreetPattern (EMPTY_STREETS for a block without streets)
+and start at the top left vertex of the block.
+"""
+
+
+AVENUE_JUNCTION = 1
+AVENUE_INTERSECTION = 2
+
+STREET = 1
+EMPTY_STREETS = len(StreetsPattern.StreetPattern)
+
+# Street template of each value of a StreetsBlocks.patterns element (EMPTY_STREETS for NO_STREETS)
+STREET_TEMPLATE_OF_PATTERN = np.arange(256, dtype=np.uint8)
+STREET_TEMPLATE_OF_PATTERN[NO_STREETS] = EMPTY_STREETS
+
+
+def street_rectangles(street_pattern: StreetsPattern.StreetPattern, cellsize: int) -> "list[tuple[int, int, int, int]]":
+    """Returns the streets of a block as rectangles relative to the block: x0, y0, x1, y1 (corners included)"""
+    street_count = math.floor((cellsize - 1) / 3)
+    rectangles = []
+    for street_index in range(street_count - 1):
+        street = (street_index + 1) * 3
+        if street_pattern == StreetsPattern.StreetPattern.VERTICAL:
+            rectangles.append((street, 1, street, cellsize - 2))
+        elif street_pattern == StreetsPattern.StreetPattern.HORIZONTAL:
+            rectangles.append((1, street, cellsize - 2, street))
+        elif street_pattern == StreetsPattern.StreetPattern.L_TOP_RIGHT:
+            rectangles.append((street, 1, street, (cellsize - 1) - street))
+            rectangles.append((cellsize - street, street, cellsize - 2, street))
+        elif street_pattern == StreetsPattern.StreetPattern.L_RIGHT_BOTTOM:
+            rectangles.append((street, street, cellsize - 2, street))
+            rectangles.append((street, street + 1, street, cellsize - 2))
+        elif street_pattern == StreetsPattern.StreetPattern.L_BOTTOM_LEFT:
+            rectangles.append((street, (cellsize - 1) - street, street, cellsize - 2))
+            rectangles.append((1, street, (cellsize - 2) - street, street))
+        elif street_pattern == StreetsPattern.StreetPattern.L_LEFT_TOP:
+            rectangles.append((1, street, street, street))
+            rectangles.append((street, 1, street, street - 1))
+    return rectangles
+
+
+@functools.lru_cache(maxsize=None)
+def street_templates(cellsize: int) -> np.ndarray:
+    """Returns the templates of the streets patterns: a (EMPTY_STREETS+1) x cellsize x cellsize matrix of labels"""
+    templates = np.zeros((EMPTY_STREETS + 1, cellsize, cellsize), dtype=np.uint8)
+    for street_pattern in StreetsPattern.StreetPattern:
+        for x0, y0, x1, y1 in street_rectangles(street_pattern, cellsize):
+            templates[street_pattern, y0:y1 + 1, x0:x1 + 1] = STREET
+    return templates
+
+
+@functools.lru_cache(maxsize=None)
+def avenue_templates(cellsize: int) -> np.ndarray:
+    """Returns the templates of the avenues for each junctions bits: a 32 x cellsize x cellsize matrix of labels"""
+    templates = np.zeros((32, cellsize, cellsize), dtype=np.uint8)
+    for junctions in range(32):
+        if not junctions & INTERSECTION:
+            continue
+        templates[junctions, 0:2, 0:2] = AVENUE_INTERSECTION
+        if junctions & JUNCTION_RIGHT:
+            templates[junctions, 0:2, 2:cellsize] = AVENUE_JUNCTION
+        if junctions & JUNCTION_BOTTOM:
+            templates[junctions, 2:cellsize, 0:2] = AVENUE_JUNCTION
+    return templates
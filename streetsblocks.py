@@ -1,11 +1,19 @@
+from collections.abc import MutableMapping
 from dataclasses import dataclass
 from enum import IntEnum
+import functools
 
-from avenuesgrid import AvenuesGrid
+import numpy as np
+
+from avenuesgrid import JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP, AvenuesGrid
 from utils import Vec2
 from worldsettings import WorldSettings
 
 
+# Value of a cell without streets in StreetsBlocks.patterns
+NO_STREETS = 255
+
+
 class StreetsBlocks:
     """
     Streets Blocks
@@ -15,13 +23,20 @@ class StreetsBlocks:
     Each cell of the grid is a potential city block if it's next to at least one avenues.
     Id starts at 0 for the top left cell and is assigned following the left-right, top-bottom order.
 
-    The streets patterns are stored in the streets_patterns property, which is a dict of Id->StreetsPattern.
-    If the dict has a key for the id of a given block, there are streets at this block.
+    The streets patterns are stored in the patterns property, a matrix of uint8 of one element per cell (patterns[y][x]),
+    with the StreetsPattern.StreetPattern value of the block or NO_STREETS.
+
+    The streets_patterns property is a dict like view of Id->StreetsPattern over the patterns matrix.
+    If the view has a key for the id of a given block, there are streets at this block.
     """
     def __init__(self, world_settings: WorldSettings, avenues_grid: AvenuesGrid) -> None:
         self.world_settings = world_settings
         self.avenues_grid = avenues_grid
-        self.streets_patterns: dict[int, StreetsPattern] = dict()
+        self.patterns = np.full((world_settings.grid_settings.height, world_settings.grid_settings.width), NO_STREETS, dtype=np.uint8)
+
+    @property
+    def streets_patterns(self) -> "StreetsPatternsView":
+        return StreetsPatternsView(self.patterns)
 
     def from_grid_to_index(self, position: Vec2) -> int:
         """Returns the index in self.streets_patterns for the given position of a cell in the grid"""
@@ -33,44 +48,37 @@ class StreetsBlocks:
 
     def generate(self) -> None:
         """
-        Generates the streets patterns and fillup the streets_patterns dict.
+        Generates the streets patterns of all the cells at once from the avenues junctions and fillup the patterns matrix.
         """
-        grid_width = self.world_settings.grid_settings.width
-        grid_height = self.world_settings.grid_settings.height
-        for y in range(grid_height):
-            for x in range(grid_width):
-                grid_coord = Vec2(x, y)
-                avenues = self._get_avenues(grid_coord)
-                street_pattern = None
-                if avenues[0] and avenues[2]:
-                    street_pattern = StreetsPattern(StreetsPattern.StreetPattern.VERTICAL)
-                elif avenues[1] and avenues[3]:
-                    street_pattern = StreetsPattern(StreetsPattern.StreetPattern.HORIZONTAL)
-                elif avenues[0] and avenues[1]:
-                    street_pattern = StreetsPattern(StreetsPattern.StreetPattern.L_TOP_RIGHT)
-                elif avenues[1] and avenues[2]:
-                    street_pattern = StreetsPattern(StreetsPattern.StreetPattern.L_RIGHT_BOTTOM)
-                elif avenues[2] and avenues[3]:
-                    street_pattern = StreetsPattern(StreetsPattern.StreetPattern.L_BOTTOM_LEFT)
-                elif avenues[3] and avenues[0]:
-                    street_pattern = StreetsPattern(StreetsPattern.StreetPattern.L_LEFT_TOP)
-                if street_pattern is not None:
-                    self.streets_patterns[self.from_grid_to_index(grid_coord)] = street_pattern
-
-    def _get_avenues(self, grid_coord: Vec2) -> "tuple[bool, bool, bool, bool]":
-        """Returns a tuple of booleans if cell is surronded by avenues (up, right, bottom, left)"""
-        avenues = [False, False, False, False]
-        up_left_index = self.avenues_grid.from_grid_to_index(grid_coord)
-        if up_left_index in self.avenues_grid.intersections:
-            up_left_intersection = self.avenues_grid.intersections[up_left_index]
-            avenues[0] = up_left_intersection.rightjunction
-            avenues[3] = up_left_intersection.bottomjunction
-        bottom_right_index = self.avenues_grid.from_grid_to_index(grid_coord + Vec2(1, 1))
-        if bottom_right_index in self.avenues_grid.intersections:
-            bottom_right_intersection = self.avenues_grid.intersections[bottom_right_index]
-            avenues[1] = bottom_right_intersection.upjunction
-            avenues[2] = bottom_right_intersection.leftjunction
-        return tuple(avenues)
+        instrumentation = self.world_settings.instrumentation
+        with instrumentation.stage("streets"):
+            self.patterns = _patterns_of(self.avenues_grid.junctions)
+            if instrumentation.enabled:
+                instrumentation.count("blocks_patterned", int(np.count_nonzero(self.patterns != NO_STREETS)))
+
+    def update_region(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Generates again the streets patterns of the cells from x0:y0 to x1:y1 (included, clipped to the grid)"""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.world_settings.grid_settings.width - 1), min(y1, self.world_settings.grid_settings.height - 1)
+        if x0 <= x1 and y0 <= y1:
+            self.patterns[y0:y1 + 1, x0:x1 + 1] = _patterns_of(self.avenues_grid.junctions[y0:y1 + 2, x0:x1 + 2])
+
+    @classmethod
+    def pattern_of(cls, avenues: "tuple[bool, bool, bool, bool]") -> int:
+        """Returns the StreetsPattern.StreetPattern of a cell surronded by avenues (up, right, bottom, left) or NO_STREETS"""
+        if avenues[0] and avenues[2]:
+            return StreetsPattern.StreetPattern.VERTICAL
+        elif avenues[1] and avenues[3]:
+            return StreetsPattern.StreetPattern.HORIZONTAL
+        elif avenues[0] and avenues[1]:
+            return StreetsPattern.StreetPattern.L_TOP_RIGHT
+        elif avenues[1] and avenues[2]:
+            return StreetsPattern.StreetPattern.L_RIGHT_BOTTOM
+        elif avenues[2] and avenues[3]:
+            return StreetsPattern.StreetPattern.L_BOTTOM_LEFT
+        elif avenues[3] and avenues[0]:
+            return StreetsPattern.StreetPattern.L_LEFT_TOP
+        return NO_STREETS
 
 
 @dataclass
@@ -83,3 +91,55 @@ class StreetsPattern:
         L_BOTTOM_LEFT = 4
         L_LEFT_TOP = 5
     street_pattern: StreetPattern
+
+
+def _patterns_of(junctions: np.ndarray) -> np.ndarray:
+    """Returns the streets patterns of the cells between the vertices of a junctions matrix"""
+    up_left = junctions[:-1, :-1]
+    bottom_right = junctions[1:, 1:]
+    # Avenues surronding each cell as 4 bits (up, right, bottom, left)
+    avenues = ((up_left & JUNCTION_RIGHT) != 0).view(np.uint8)
+    avenues |= ((bottom_right & JUNCTION_UP) != 0).view(np.uint8) << 1
+    avenues |= ((bottom_right & JUNCTION_LEFT) != 0).view(np.uint8) << 2
+    avenues |= ((up_left & JUNCTION_BOTTOM) != 0).view(np.uint8) << 3
+    return _patterns_by_avenues()[avenues]
+
+
+@functools.lru_cache(maxsize=None)
+def _patterns_by_avenues() -> np.ndarray:
+    """Lookup table of the pattern for the 16 combinations of avenues bits (up, right, bottom, left)"""
+    return np.array([
+        StreetsBlocks.pattern_of(tuple(avenues & (1 << side) != 0 for side in range(4))) for avenues in range(16)
+    ], dtype=np.uint8)
+
+
+class StreetsPatternsView(MutableMapping):
+    """
+    StreetsPatternsView
+
+    Dict like access Id->StreetsPattern to a patterns matrix of a StreetsBlocks.
+    """
+    def __init__(self, patterns: np.ndarray) -> None:
+        self.patterns = patterns
+
+    def __contains__(self, index: object) -> bool:
+        return isinstance(index, (int, np.integer)) and 0 <= index < self.patterns.size and self.patterns.flat[index] != NO_STREETS
+
+    def __getitem__(self, index: int) -> StreetsPattern:
+        if index not in self:
+            raise KeyError(index)
+        return StreetsPattern(StreetsPattern.StreetPattern(self.patterns.flat[index]))
+
+    def __setitem__(self, index: int, streets_pattern: StreetsPattern) -> None:
+        self.patterns.flat[index] = streets_pattern.street_pattern
+
+    def __delitem__(self, index: int) -> None:
+        if index not in self:
+            raise KeyError(index)
+        self.patterns.flat[index] = NO_STREETS
+
+    def __iter__(self):
+        yield from np.flatnonzero(self.patterns != NO_STREETS).tolist()
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.patterns != NO_STREETS))
@@ -0,0 +1,45 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The modules of the package are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avenuesgrid import AvenuesGrid  # noqa: E402
+from display import Printer  # noqa: E402
+from heatmap import HeatMap  # noqa: E402
+from streetsblocks import StreetsBlocks  # noqa: E402
+from worldsettings import WorldSettings  # noqa: E402
+
+
+@pytest.fixture
+def make_city():
+    """Returns a function generating the world settings, heat map, avenues grid and streets blocks of a seed"""
+    def make(width: int, height: int, seed: int, scale: int = 8,
+             engine: AvenuesGrid.Engine = AvenuesGrid.Engine.QUEUE) -> "tuple[WorldSettings, HeatMap, AvenuesGrid, StreetsBlocks]":
+        rng = random.Random(seed)
+        world_settings = WorldSettings(width, height, rng=rng)
+        heat_map = HeatMap(world_settings, rng)
+        heat_map.generate(scale, -0.3, 1.3)
+        avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+        avenues_grid.generate(engine)
+        streets_blocks = StreetsBlocks(world_settings, avenues_grid)
+        streets_blocks.generate()
+        return world_settings, heat_map, avenues_grid, streets_blocks
+    return make
+
+
+@pytest.fixture
+def make_printer():
+    """Returns a function building the printer of all the layers of a city made by make_city"""
+    def make(city: tuple) -> Printer:
+        world_settings, heat_map, avenues_grid, streets_blocks = city
+        printer = Printer(world_settings)
+        printer.addheat(heat_map)
+        printer.addgrid()
+        printer.addavenues(avenues_grid)
+        printer.addstreets(streets_blocks)
+        return printer
+    return make
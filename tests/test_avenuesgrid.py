@@ -0,0 +1,260 @@
+import hashlib
+import math
+import random
+
+import numpy as np
+import pytest
+
+from avenuesgrid import (INTERSECTION, JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP, AvenueIntersection,
+                         AvenuesGrid, ObstacleIndex)
+from editor import CityEditor
+from heatmap import HeatMap
+from instrumentation import EventLog, Instrumentation
+from roadgraph import RoadGraph
+from utils import Vec2, Vec2Direction
+from worldsettings import WorldSettings
+
+
+def assert_consistent(junctions: np.ndarray) -> None:
+    """Every junction has its reverse on the neighbour vertex, and junctions are only set on intersections"""
+    np.testing.assert_array_equal((junctions[:, :-1] & JUNCTION_RIGHT) != 0, (junctions[:, 1:] & JUNCTION_LEFT) != 0)
+    np.testing.assert_array_equal((junctions[:-1, :] & JUNCTION_BOTTOM) != 0, (junctions[1:, :] & JUNCTION_UP) != 0)
+    assert not np.any((junctions & 15 != 0) & (junctions & INTERSECTION == 0))
+
+
+def flat_heat_grid(width: int, height: int, heat: float) -> AvenuesGrid:
+    world_settings = WorldSettings(width, height, rng=random.Random(0))
+    heat_map = HeatMap.from_grid(world_settings, np.full((33, 33), heat, dtype=np.float32))
+    return AvenuesGrid(world_settings, heat_map, random.Random(1))
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+@pytest.mark.parametrize("seed", range(3))
+def test_engines_invariants(make_city, engine, seed):
+    # Both engines follow the same rules with different random draws: the main avenues cross the whole grid,
+    # the junctions are consistent and the avenues grown from the main ones are all connected
+    _, _, avenues_grid, _ = make_city(1024, 768, seed, engine=engine)
+    junctions = avenues_grid.junctions
+    assert_consistent(junctions)
+    grid_settings = avenues_grid.world_settings.grid_settings
+    center_x, center_y = math.floor(grid_settings.width / 2), math.floor(grid_settings.height / 2)
+    assert np.all(junctions[:-1, center_x] & JUNCTION_BOTTOM)
+    assert np.all(junctions[center_y, :-1] & JUNCTION_RIGHT)
+    count, _ = RoadGraph.from_avenues(avenues_grid).connected_components()
+    assert count == 1
+
+
+def test_engines_equal_without_random_choice():
+    # Heat 1 everywhere: every intersection builds in the 3 directions, the random draws never change the result
+    queue_grid = flat_heat_grid(512, 384, 1)
+    queue_grid.generate(AvenuesGrid.Engine.QUEUE)
+    frontier_grid = flat_heat_grid(512, 384, 1)
+    frontier_grid.generate(AvenuesGrid.Engine.FRONTIER)
+    np.testing.assert_array_equal(queue_grid.junctions, frontier_grid.junctions)
+    assert np.all(queue_grid.junctions & INTERSECTION)
+    assert_consistent(queue_grid.junctions)
+
+
+def test_generate_output_is_unchanged():
+    # Junctions of both engines generated before the growth loops used direction tables and packed indices
+    digests = []
+    for engine in AvenuesGrid.Engine:
+        rng = random.Random(12)
+        world_settings = WorldSettings(1024, 1024, rng=rng)
+        heat_map = HeatMap(world_settings, rng)
+        heat_map.generate(8, -0.3, 1.3)
+        avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+        avenues_grid.generate(engine)
+        digests.append(hashlib.blake2b(avenues_grid.junctions.tobytes(), digest_size=8).hexdigest())
+    assert digests == ["60eb1daff2a1d52d", "883f2834b07db8dd"]
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+def test_generate_is_reproducible(make_city, engine):
+    _, _, first, _ = make_city(800, 800, 3, engine=engine)
+    _, _, second, _ = make_city(800, 800, 3, engine=engine)
+    np.testing.assert_array_equal(first.junctions, second.junctions)
+
+
+def test_intersections_view(make_city):
+    _, _, avenues_grid, _ = make_city(256, 256, 1)
+    intersections = avenues_grid.intersections
+    junctions = avenues_grid.junctions
+    assert len(intersections) == int(np.count_nonzero(junctions & INTERSECTION))
+    index = next(iter(intersections))
+    bits = int(junctions.flat[index])
+    expected = AvenueIntersection(bits & JUNCTION_UP != 0, bits & JUNCTION_RIGHT != 0, bits & JUNCTION_BOTTOM != 0, bits & JUNCTION_LEFT != 0)
+    assert intersections[index] == expected
+
+    free = int(np.flatnonzero((junctions & INTERSECTION) == 0)[0])
+    assert free not in intersections
+    intersections[free] = AvenueIntersection(leftjunction=True)
+    assert junctions.flat[free] == INTERSECTION | JUNCTION_LEFT
+    del intersections[free]
+    assert free not in intersections
+    with pytest.raises(KeyError):
+        intersections[free]
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+def test_generate_parallel_does_not_depend_on_workers(engine):
+    results = []
+    for workers in (1, 2):
+        rng = random.Random(11)
+        world_settings = WorldSettings(1024, 1024, rng=rng)
+        heat_map = HeatMap(world_settings, rng)
+        heat_map.generate(8, -0.3, 1.3)
+        avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+        avenues_grid.generate_parallel(workers, engine)
+        results.append(avenues_grid)
+    np.testing.assert_array_equal(results[0].junctions, results[1].junctions)
+    assert_consistent(results[0].junctions)
+    count, _ = RoadGraph.from_avenues(results[0]).connected_components()
+    assert count == 1
+
+
+def test_intersections_view_writes_back(make_city):
+    _, _, avenues_grid, _ = make_city(256, 256, 1)
+    intersections = avenues_grid.intersections
+    index = next(iter(intersections))
+    intersection = intersections[index]
+    expected = AvenueIntersection(intersection.upjunction, intersection.rightjunction, intersection.bottomjunction, intersection.leftjunction)
+    assert intersection == expected and expected == intersection
+
+    intersection.upjunction = not intersection.upjunction
+    assert bool(avenues_grid.junctions.flat[index] & JUNCTION_UP) == intersection.upjunction
+    assert intersections[index] != expected
+
+
+def ray_march_distance(hot: np.ndarray, intersections: np.ndarray, bounds: tuple, x: int, y: int, direction: Vec2Direction) -> tuple:
+    """Nearest obstacle found vertex by vertex, the reference of ObstacleIndex.distance"""
+    min_x, min_y, max_x, max_y = bounds
+    offset = Vec2.from_direction(direction)
+    distance = 1
+    while True:
+        position_x, position_y = x + offset.x * distance, y + offset.y * distance
+        if not (min_x <= position_x <= max_x and min_y <= position_y <= max_y):
+            return distance, ObstacleIndex.PRIORITY_EDGE
+        if hot[position_y, position_x]:
+            return distance, ObstacleIndex.PRIORITY_HEAT
+        if intersections[position_y, position_x]:
+            return distance, ObstacleIndex.PRIORITY_INTERSECTION
+        distance += 1
+
+
+@pytest.mark.parametrize("bounds", [(0, 0, 39, 29), (5, 7, 30, 22)])
+def test_obstacle_index_equals_ray_march(bounds):
+    rng = np.random.default_rng(3)
+    hot = rng.random((30, 40)) < 0.05
+    intersections = rng.random((30, 40)) < 0.05
+    min_x, min_y, max_x, max_y = bounds
+    index = ObstacleIndex(hot[min_y:max_y + 1, min_x:max_x + 1], intersections[min_y:max_y + 1, min_x:max_x + 1], bounds)
+    for x, y in zip(rng.integers(min_x, max_x + 1, 30).tolist(), rng.integers(min_y, max_y + 1, 30).tolist()):
+        if not intersections[y, x]:
+            index.add_intersection(x, y)
+            intersections[y, x] = True
+    for y in range(min_y, max_y + 1):
+        for x in range(min_x, max_x + 1):
+            for direction in Vec2Direction:
+                assert index.distance(x, y, direction) == ray_march_distance(hot, intersections, bounds, x, y, direction)
+
+
+def test_obstacle_index_of_a_region_equals_ray_march():
+    # Only the rows and columns of the region are indexed, the obstacles are searched up to the edges of the bounds
+    rng = np.random.default_rng(4)
+    hot = rng.random((30, 40)) < 0.05
+    intersections = rng.random((30, 40)) < 0.05
+    bounds = (0, 0, 39, 29)
+    min_x, min_y, max_x, max_y = region = (5, 7, 30, 22)
+    index = ObstacleIndex((hot[min_y:max_y + 1], hot[:, min_x:max_x + 1]), (intersections[min_y:max_y + 1], intersections[:, min_x:max_x + 1]), bounds, region)
+    for y in range(min_y, max_y + 1):
+        for x in range(min_x, max_x + 1):
+            for direction in Vec2Direction:
+                assert index.distance(x, y, direction) == ray_march_distance(hot, intersections, bounds, x, y, direction)
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+def test_regenerate_region_only_changes_the_region(make_city, engine):
+    _, heat_map, avenues_grid, _ = make_city(1024, 1024, 5, engine=engine)
+    rng = random.Random(5)
+    for _ in range(10):
+        x0, y0 = rng.randrange(-5, 64), rng.randrange(-5, 64)
+        x1, y1 = x0 + rng.randrange(20), y0 + rng.randrange(20)
+        heat_map.add_heat(x0 * 16, y0 * 16, x1 * 16 + 16, y1 * 16 + 16, rng.uniform(-0.6, 0.6))
+        before = avenues_grid.junctions.copy()
+        region = avenues_grid.regenerate_region(x0, y0, x1, y1, engine)
+        assert region == (max(x0, 0), max(y0, 0), min(x1, 63), min(y1, 63))
+        min_x, min_y, max_x, max_y = region
+        outside = np.ones(before.shape, dtype=bool)
+        outside[min_y:max_y + 1, min_x:max_x + 1] = False
+        # The vertices around the region only get the junctions of the avenues leaving it
+        added = avenues_grid.junctions & ~before
+        allowed = np.zeros(before.shape, dtype=np.uint8)
+        if min_x > 0:
+            allowed[min_y:max_y + 1, min_x - 1] |= JUNCTION_RIGHT
+        if max_x < 63:
+            allowed[min_y:max_y + 1, max_x + 1] |= JUNCTION_LEFT
+        if min_y > 0:
+            allowed[min_y - 1, min_x:max_x + 1] |= JUNCTION_BOTTOM
+        if max_y < 63:
+            allowed[max_y + 1, min_x:max_x + 1] |= JUNCTION_UP
+        assert not np.any(added[outside] & ~allowed[outside])
+        np.testing.assert_array_equal(avenues_grid.junctions[outside] & before[outside], before[outside])
+        assert np.all(before[outside][added[outside] != 0] & INTERSECTION)
+        assert_consistent(avenues_grid.junctions)
+
+
+def inner_dead_ends(junctions: np.ndarray) -> int:
+    """Number of intersections with a single junction out of the grid edges"""
+    junctions_count = sum(((junctions & junction) != 0).astype(np.int8) for junction in (JUNCTION_UP, JUNCTION_RIGHT, JUNCTION_BOTTOM, JUNCTION_LEFT))
+    return int(np.count_nonzero((junctions_count[1:-1, 1:-1] == 1) & (junctions[1:-1, 1:-1] & INTERSECTION != 0)))
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+def test_edits_keep_the_avenues_connected(make_city, engine):
+    # Cold vertices of the region see the obstacles outside of it, avenues leaving it join the intersections outside
+    # and the avenues grown from different ports are joined
+    for seed in range(6):
+        _, _, avenues_grid, streets_blocks = make_city(1024, 1024, seed, engine=engine)
+        dead_ends = inner_dead_ends(avenues_grid.junctions)
+        editor = CityEditor(avenues_grid, streets_blocks, engine=engine)
+        rng = random.Random(seed + 1000)
+        for _ in range(6):
+            x0, y0 = rng.randrange(900), rng.randrange(900)
+            x1, y1 = x0 + rng.randrange(20, 300), y0 + rng.randrange(20, 300)
+            if rng.random() < 0.5:
+                editor.set_heat(x0, y0, x1, y1, rng.uniform(-0.3, 1))
+            else:
+                editor.add_heat(x0, y0, x1, y1, rng.uniform(-0.8, 0.8))
+            assert_consistent(avenues_grid.junctions)
+            assert inner_dead_ends(avenues_grid.junctions) <= dead_ends
+            count, _ = RoadGraph.from_avenues(avenues_grid).connected_components()
+            assert count == 1
+
+
+def test_obstacle_queries_are_counted(monkeypatch):
+    calls = []
+    distance = ObstacleIndex.distance
+
+    def counted_distance(self, x, y, direction):
+        calls.append((x, y))
+        return distance(self, x, y, direction)
+    monkeypatch.setattr(ObstacleIndex, "distance", counted_distance)
+    instrumentation = Instrumentation(EventLog())
+    rng = random.Random(2)
+    world_settings = WorldSettings(1024, 1024, rng=rng, instrumentation=instrumentation)
+    heat_map = HeatMap(world_settings, rng)
+    heat_map.generate(8, -0.3, 1.3)
+    AvenuesGrid(world_settings, heat_map, rng).generate()
+    assert len(calls) > 0
+    assert instrumentation.counters["obstacle_queries"] == len(calls)
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+def test_growth_is_bounded_to_the_region(engine):
+    # The quadrants of generate_parallel and the regenerated regions never write out of their bounds
+    grid = flat_heat_grid(512, 512, 1)
+    grid._region = (3, 4, 12, 15)
+    grid._grow([AvenuesGrid.AvenueBuildOrder(Vec2(5, 6), Vec2Direction.RIGHT)], engine)
+    ys, xs = np.nonzero(grid.junctions)
+    assert xs.min() >= 3 and xs.max() <= 12 and ys.min() >= 4 and ys.max() <= 15
@@ -0,0 +1,27 @@
+import json
+
+import numpy as np
+from PIL import Image
+
+from batch import generate_city, main
+from parameters import CityParameters
+
+
+def test_cities_do_not_depend_on_the_workers(tmp_path):
+    arguments = ["3:6", "--width", "256", "--height", "200", "--scale", "6"]
+    main(arguments + ["--workers", "1", "--output", str(tmp_path / "one")])
+    main(arguments + ["--workers", "2", "--output", str(tmp_path / "two")])
+    with open(tmp_path / "two" / "manifest.json") as manifest_file:
+        assert [city["seed"] for city in json.load(manifest_file)["cities"]] == [3, 4, 5]
+    for seed in range(3, 6):
+        with Image.open(tmp_path / "one" / f"city_{seed}.png") as one, Image.open(tmp_path / "two" / f"city_{seed}.png") as two:
+            np.testing.assert_array_equal(np.array(one), np.array(two))
+
+
+def test_generate_city_is_reproducible(tmp_path):
+    parameters = CityParameters(256, 200, 6)
+    for output in ("first", "second"):
+        (tmp_path / output).mkdir()
+        generate_city(8, parameters, str(tmp_path / output), band_height=64)
+    with Image.open(tmp_path / "first" / "city_8.png") as first, Image.open(tmp_path / "second" / "city_8.png") as second:
+        np.testing.assert_array_equal(np.array(first), np.array(second))
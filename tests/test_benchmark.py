@@ -0,0 +1,27 @@
+import json
+
+from benchmark import BENCHMARK_STAGES, compare, main
+
+
+def test_results_compared_with_themselves(tmp_path):
+    output = str(tmp_path / "results.json")
+    assert main(["--sizes", "256", "--scales", "6", "--seeds", "2", "--output", output]) == 0
+    with open(output) as results_file:
+        results = json.load(results_file)
+    case, = results["cases"]
+    assert (case["size"], case["scale"], case["seeds"]) == (256, 6, 2)
+    assert set(case["stages"]) == set(BENCHMARK_STAGES)
+    assert all(stage["time"] > 0 and stage["peak_bytes"] >= 0 for stage in case["stages"].values())
+    # Same timings, no regression whatever the threshold
+    assert compare(results, results, 0) == []
+
+
+def test_compare_reports_the_slower_stages():
+    baseline = {"cases": [{"size": 256, "scale": 7, "stages": {"heat": {"time": 0.1}, "avenues": {"time": 0.001}, "streets": {"time": 0.1}}}]}
+    results = {"cases": [
+        {"size": 256, "scale": 7, "stages": {"heat": {"time": 0.11}, "avenues": {"time": 0.01}, "streets": {"time": 0.2}}},
+        {"size": 1024, "scale": 7, "stages": {"heat": {"time": 10}}}
+    ]}
+    # avenues is too fast in the baseline to be compared, the second case has no baseline
+    regressions = compare(results, baseline, 0.2)
+    assert len(regressions) == 1 and "streets" in regressions[0]
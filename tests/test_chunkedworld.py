@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from avenuesgrid import JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP
+from chunkedworld import ChunkedWorld
+from heatmap import HeatMap
+
+
+@pytest.mark.parametrize("heat_engine", [HeatMap.Engine.NUMPY, HeatMap.Engine.NOISE])
+def test_chunks_do_not_depend_on_the_order(heat_engine):
+    coords = [(0, 0), (1, -1), (-2, 3), (1, 0)]
+    first = ChunkedWorld(42, heat_engine=heat_engine)
+    first_chunks = [first.get_chunk(cx, cy) for cx, cy in coords]
+    second = ChunkedWorld(42, heat_engine=heat_engine)
+    second_chunks = [second.get_chunk(cx, cy) for cx, cy in reversed(coords)][::-1]
+    for first_chunk, second_chunk in zip(first_chunks, second_chunks):
+        np.testing.assert_array_equal(first_chunk.heat_map.grid, second_chunk.heat_map.grid)
+        np.testing.assert_array_equal(first_chunk.avenues_grid.junctions, second_chunk.avenues_grid.junctions)
+        np.testing.assert_array_equal(first_chunk.streets_blocks.patterns, second_chunk.streets_blocks.patterns)
+
+
+@pytest.mark.parametrize("heat_engine", [HeatMap.Engine.NUMPY, HeatMap.Engine.NOISE])
+def test_neighbour_chunks_agree_on_their_edges(heat_engine):
+    world = ChunkedWorld(7, heat_engine=heat_engine)
+    chunk = world.get_chunk(0, 0)
+    right = world.get_chunk(1, 0)
+    bottom = world.get_chunk(0, 1)
+    if heat_engine == HeatMap.Engine.NUMPY:
+        np.testing.assert_array_equal(chunk.heat_map.grid[:, -1], right.heat_map.grid[:, 0])
+        np.testing.assert_array_equal(chunk.heat_map.grid[-1, :], bottom.heat_map.grid[0, :])
+    halo = world.chunk_cells
+    junctions = chunk.avenues_grid.junctions
+    # The halo holds the first column and row of the neighbours, the avenues crossing the edges agree
+    np.testing.assert_array_equal(junctions[:halo, halo], right.avenues_grid.junctions[:halo, 0])
+    np.testing.assert_array_equal(junctions[halo, :halo], bottom.avenues_grid.junctions[0, :halo])
+    np.testing.assert_array_equal((junctions[:, :-1] & JUNCTION_RIGHT) != 0, (junctions[:, 1:] & JUNCTION_LEFT) != 0)
+    np.testing.assert_array_equal((junctions[:-1, :] & JUNCTION_BOTTOM) != 0, (junctions[1:, :] & JUNCTION_UP) != 0)
+
+
+def test_chunk_cache_is_bounded():
+    world = ChunkedWorld(1, cache_bytes=1)
+    world.get_chunk(0, 0)
+    world.get_chunk(5, 5)
+    assert len(world.chunks) == 1 and (5, 5) in world.chunks
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from cityfile import CityFile, save_city
+from editor import CityEditor
+
+
+@pytest.fixture
+def city_path(make_city, make_printer, tmp_path):
+    city = make_city(512, 384, 3, scale=7)
+    _, heat_map, avenues_grid, streets_blocks = city
+    path = str(tmp_path / "city.city")
+    save_city(path, heat_map, avenues_grid, streets_blocks, {"seed": 3}, make_printer(city).pyramid(2))
+    return city, path
+
+
+def test_save_and_load(city_path, make_printer):
+    city, path = city_path
+    world_settings, heat_map, avenues_grid, streets_blocks = city
+    city_file = CityFile(path)
+    assert city_file.metadata == {"seed": 3}
+    loaded_world_settings, loaded_heat_map, loaded_avenues_grid, loaded_streets_blocks = city_file.load()
+    assert (loaded_world_settings.width, loaded_world_settings.height) == (world_settings.width, world_settings.height)
+    assert loaded_world_settings.grid_settings.offset.x == world_settings.grid_settings.offset.x
+    assert loaded_world_settings.grid_settings.offset.y == world_settings.grid_settings.offset.y
+    np.testing.assert_array_equal(loaded_heat_map.grid, heat_map.grid)
+    np.testing.assert_array_equal(loaded_avenues_grid.junctions, avenues_grid.junctions)
+    np.testing.assert_array_equal(loaded_streets_blocks.patterns, streets_blocks.patterns)
+    assert loaded_avenues_grid.heat_factor == avenues_grid.heat_factor
+
+    printer = make_printer(city)
+    assert city_file.overview_levels == 2
+    for level in (1, 2):
+        np.testing.assert_array_equal(city_file.overview(level), printer.render_level(level))
+    with pytest.raises(ValueError):
+        city_file.overview(3)
+
+
+def test_loaded_city_can_be_edited(city_path):
+    _, path = city_path
+    with open(path, "rb") as city_file:
+        content = city_file.read()
+    city_file = CityFile(path)
+    _, heat_map, avenues_grid, streets_blocks = city_file.load()
+    _, _, other_avenues_grid, _ = city_file.load()
+    CityEditor(avenues_grid, streets_blocks).set_heat(100, 100, 300, 300, 0)
+    assert not np.array_equal(avenues_grid.junctions, other_avenues_grid.junctions)
+    with open(path, "rb") as city_file:
+        assert city_file.read() == content
+    # The arrays of the properties stay read only
+    assert not CityFile(path).junctions.flags.writeable
+
+
+def test_empty_arrays(city_path, tmp_path):
+    (_, heat_map, avenues_grid, streets_blocks), _ = city_path
+    path = str(tmp_path / "empty.city")
+    save_city(path, heat_map, avenues_grid, streets_blocks, overviews=[np.zeros((0, 5, 3), dtype=np.uint8)])
+    overview = CityFile(path).overview(1)
+    assert overview.shape == (0, 5, 3) and overview.dtype == np.uint8
+
+
+def test_not_a_city_file(tmp_path):
+    path = tmp_path / "other.city"
+    path.write_bytes(b"not a city file at all")
+    with pytest.raises(ValueError):
+        CityFile(str(path))
@@ -0,0 +1,206 @@
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import display
+from avenuesgrid import INTERSECTION, JUNCTION_BOTTOM, JUNCTION_RIGHT, AvenuesGrid
+from display import Printer
+from editor import CityEditor
+from export import export_png, export_tiles, render_tile, tile_max_zoom
+from heatmap import HeatMap
+from stamps import STREET_TEMPLATE_OF_PATTERN, street_rectangles
+from streetsblocks import NO_STREETS, StreetsBlocks, StreetsPattern
+from tilequery import TileQuery, TileType
+from utils import Vec2
+from worldsettings import WorldSettings
+
+
+@pytest.mark.parametrize("order", [(0, 1, 2, 3), (3, 0, 2, 1)])
+def test_render_blends_the_layers(make_city, order):
+    world_settings, heat_map, avenues_grid, streets_blocks = make_city(300, 200, 8)
+    printers = [Printer(world_settings) for _ in range(4)]
+    printers[0].addheat(heat_map)
+    printers[1].addgrid()
+    printers[2].addavenues(avenues_grid)
+    printers[3].addstreets(streets_blocks)
+    printer = Printer(world_settings)
+    for index in order:
+        printer.layers += printers[index].layers
+    # The non black pixels of each layer are mixed with the pixels below, 25% below and 75% layer
+    expected = printers[order[0]].render().astype(np.float64)
+    for index in order[1:]:
+        layer = printers[index].render()
+        mask = layer.any(axis=2)
+        expected[mask] = np.floor(expected[mask] * 0.25 + layer[mask] * 0.75)
+    np.testing.assert_array_equal(printer.render(), expected)
+    np.testing.assert_array_equal(printer.render_level(1), expected[::2, ::2])
+
+
+@pytest.mark.parametrize("size, seed", [(500, 1), (777, 2)])
+def test_render_level_equals_strided_render(make_city, make_printer, size, seed):
+    printer = make_printer(make_city(size, size + 33, seed))
+    full = printer.render()
+    for level in range(6):
+        step = 1 << level
+        np.testing.assert_array_equal(printer.render_level(level), full[::step, ::step])
+        np.testing.assert_array_equal(printer.render_level(level, 37, 101, 400, 513), full[101:513:step, 37:400:step])
+
+
+def test_pyramid_equals_render_level(make_city, make_printer):
+    printer = make_printer(make_city(600, 450, 3))
+    for level, image in enumerate(printer.pyramid(4, band_height=7), start=1):
+        np.testing.assert_array_equal(image, printer.render_level(level))
+
+
+def test_render_window_equals_render(make_city, make_printer):
+    printer = make_printer(make_city(400, 300, 4))
+    full = printer.render()
+    np.testing.assert_array_equal(printer.render(13, 250, 391, 300), full[250:300, 13:391])
+    np.testing.assert_array_equal(np.array(printer.image), full)
+
+
+def test_render_parallel_equals_render(make_city, make_printer):
+    printer = make_printer(make_city(400, 300, 5))
+    np.testing.assert_array_equal(printer.render_parallel(workers=2, band_height=37), printer.render())
+
+
+def test_export_png_equals_render(make_city, make_printer, tmp_path):
+    printer = make_printer(make_city(300, 211, 6))
+    path = str(tmp_path / "city.png")
+    export_png(printer, path, band_height=50)
+    with Image.open(path) as image:
+        np.testing.assert_array_equal(np.array(image.convert("RGB")), printer.render())
+
+
+def test_tiles_equal_strided_render(make_city, make_printer, tmp_path):
+    printer = make_printer(make_city(700, 300, 7))
+    full = printer.render()
+    max_zoom = tile_max_zoom(700, 300, 128)
+    assert max_zoom == 3
+    for z in range(max_zoom + 1):
+        step = 1 << (max_zoom - z)
+        # Second tile of the first row, the only tile of zoom 0
+        tile_x = 1 if z > 0 else 0
+        tile = render_tile(printer, z, tile_x, 0, max_zoom, 128)
+        x0 = tile_x * 128 * step
+        expected = full[0:128 * step:step, x0:x0 + 128 * step:step]
+        np.testing.assert_array_equal(tile[:expected.shape[0], :expected.shape[1]], expected)
+        assert not tile[expected.shape[0]:].any() and not tile[:, expected.shape[1]:].any()
+    assert export_tiles(printer, str(tmp_path), 2, 3, 128) == 3 * 2 + 6 * 3
+    with Image.open(tmp_path / "3" / "5" / "2.png") as image:
+        np.testing.assert_array_equal(np.array(image)[:300 - 256, :700 - 640], full[256:, 640:])
+
+
+def test_avenues_stamps_equal_rectangles(make_city):
+    world_settings, _, avenues_grid, _ = make_city(400, 300, 3)
+    printer = Printer(world_settings)
+    printer.addavenues(avenues_grid)
+    cellsize = world_settings.grid_settings.cellsize
+    junctions = avenues_grid.junctions
+    expected = np.zeros((300, 400, 3), dtype=np.uint8)
+    for y, x in zip(*np.nonzero(junctions & INTERSECTION)):
+        world = world_settings.from_grid_to_world(Vec2(int(x), int(y)))
+        if junctions[y, x] & JUNCTION_RIGHT:
+            expected[world.y - 1:world.y + 1, world.x + 1:world.x + cellsize - 1] = 200
+        if junctions[y, x] & JUNCTION_BOTTOM:
+            expected[world.y + 1:world.y + cellsize - 1, world.x - 1:world.x + 1] = 200
+        expected[world.y - 1:world.y + 1, world.x - 1:world.x + 1] = 255
+    # Inside the lattice of vertices, the junctions leaving the grid are drawn up to the world edges
+    first = world_settings.from_grid_to_world(Vec2(0, 0))
+    last = world_settings.from_grid_to_world(Vec2(junctions.shape[1] - 1, junctions.shape[0] - 1))
+    window = (slice(first.y - 1, last.y + 1), slice(first.x - 1, last.x + 1))
+    np.testing.assert_array_equal(printer.render()[window], expected[window])
+
+
+def test_streets_stamps_equal_rectangles(make_city):
+    world_settings, _, _, streets_blocks = make_city(400, 300, 3)
+    printer = Printer(world_settings)
+    printer.addstreets(streets_blocks)
+    expected = np.zeros((300, 400), dtype=bool)
+    patterns = streets_blocks.patterns
+    for y, x in zip(*np.nonzero(patterns != NO_STREETS)):
+        world = world_settings.from_grid_to_world(Vec2(int(x), int(y)))
+        for x0, y0, x1, y1 in street_rectangles(StreetsPattern.StreetPattern(patterns[y, x]), world_settings.grid_settings.cellsize):
+            expected[world.y + y0:world.y + y1 + 1, world.x + x0:world.x + x1 + 1] = True
+    np.testing.assert_array_equal(printer.render().any(axis=2), expected)
+
+
+def large_streets_printer(monkeypatch) -> "tuple[Printer, list]":
+    """Returns the streets printer of a 32768 x 32768 world and the shapes of the patterns blocks mapped to their templates"""
+    world_settings = WorldSettings(32768, 32768, rng=random.Random(0))
+    heat_map = HeatMap.from_grid(world_settings, np.zeros((33, 33), dtype=np.float32))
+    printer = Printer(world_settings)
+    printer.addstreets(StreetsBlocks(world_settings, AvenuesGrid(world_settings, heat_map)))
+    shapes = []
+
+    class RecordedTemplates:
+        def __getitem__(self, patterns: np.ndarray) -> np.ndarray:
+            shapes.append(patterns.shape)
+            return STREET_TEMPLATE_OF_PATTERN[patterns]
+    monkeypatch.setattr(display, "STREET_TEMPLATE_OF_PATTERN", RecordedTemplates())
+    return printer, shapes
+
+
+def test_streets_window_maps_its_blocks_only(monkeypatch):
+    # The patterns are mapped to their templates for the blocks of the window, not for the whole world
+    printer, shapes = large_streets_printer(monkeypatch)
+    assert printer.render(1000, 1000, 1256, 1256).shape == (256, 256, 3)
+    assert len(shapes) == 1 and shapes[0][0] <= 17 and shapes[0][1] <= 17
+
+
+def test_render_level_maps_its_samples_only(monkeypatch):
+    printer, shapes = large_streets_printer(monkeypatch)
+    assert printer.render_level(3, 8000, 8000, 10048, 10048).shape == (256, 256, 3)
+    assert shapes == [(256, 256)]
+
+
+def test_tiles_of_a_large_world_map_their_samples_only(monkeypatch, tmp_path):
+    printer, shapes = large_streets_printer(monkeypatch)
+    max_zoom = tile_max_zoom(32768, 32768)
+    for z in (max_zoom, max_zoom - 3):
+        assert render_tile(printer, z, 5, 7, max_zoom).shape == (256, 256, 3)
+    assert export_tiles(printer, str(tmp_path), 0, 1) == 5
+    assert len(shapes) == 7 and all(rows <= 256 and columns <= 256 for rows, columns in shapes)
+
+
+def test_tile_query_equals_rendered_layers(make_city):
+    world_settings, _, avenues_grid, streets_blocks = make_city(300, 277, 4, scale=7)
+    avenues_printer = Printer(world_settings)
+    avenues_printer.addavenues(avenues_grid)
+    avenues = avenues_printer.render().any(axis=2)
+    streets_printer = Printer(world_settings)
+    streets_printer.addstreets(streets_blocks)
+    streets = streets_printer.render().any(axis=2)
+
+    query = TileQuery(avenues_grid, streets_blocks)
+    ys, xs = np.mgrid[0:277, 0:300]
+    types = query.types(xs, ys)
+    np.testing.assert_array_equal(avenues, (types == TileType.AVENUE) | (types == TileType.INTERSECTION))
+    np.testing.assert_array_equal(streets, types == TileType.STREET)
+    rng = np.random.default_rng(0)
+    for x, y in zip(rng.integers(-5, 305, 300).tolist(), rng.integers(-5, 282, 300).tolist()):
+        expected = types[y, x] if 0 <= x < 300 and 0 <= y < 277 else TileType.BUILDING
+        assert query.tile_at(x, y) == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_edits_keep_the_city_consistent(make_city, make_printer, seed):
+    city = make_city(1024, 1024, seed)
+    world_settings, _, avenues_grid, streets_blocks = city
+    printer = make_printer(city)
+    printer.image
+    editor = CityEditor(avenues_grid, streets_blocks, printer)
+    rng = random.Random(seed + 100)
+    for edit in range(4):
+        x0, y0 = rng.randrange(1024), rng.randrange(1024)
+        x1, y1 = min(x0 + rng.randrange(10, 300), 1024), min(y0 + rng.randrange(10, 300), 1024)
+        if edit % 2:
+            editor.add_heat(x0, y0, x1, y1, rng.uniform(-0.8, 0.8))
+        else:
+            editor.set_heat(x0, y0, x1, y1, rng.choice([0, 0.5, 1]))
+        expected = StreetsBlocks(world_settings, avenues_grid)
+        expected.generate()
+        np.testing.assert_array_equal(streets_blocks.patterns, expected.patterns)
+        np.testing.assert_array_equal(np.array(printer.image), printer.render())
@@ -0,0 +1,131 @@
+import random
+
+import numpy as np
+import pytest
+
+import heatmap
+from heatmap import HeatMap, HeatNoise, diamond_square
+from worldsettings import WorldSettings
+
+
+class ConstantRandom(random.Random):
+    """random.Random drawing always value"""
+    def __init__(self, value: float) -> None:
+        super().__init__(0)
+        self.value = value
+
+    def random(self) -> float:
+        return self.value
+
+
+class ConstantGenerator:
+    """numpy generator drawing always value"""
+    def __init__(self, value: float) -> None:
+        self.value = value
+
+    def random(self, size: tuple = None, out: np.ndarray = None) -> np.ndarray:
+        if out is not None:
+            out[...] = self.value
+            return out
+        return np.full(size, self.value)
+
+
+@pytest.mark.parametrize("value", [0.0, 0.37, 0.99])
+def test_numpy_diamond_square_follows_the_python_rules(value):
+    # With the same random draws, the NUMPY engine computes the map of the PYTHON engine
+    world_settings = WorldSettings(256, 256, rng=random.Random(0))
+    python_map = HeatMap(world_settings, ConstantRandom(value))
+    python_map.generate(6, -0.3, 1.3, HeatMap.Engine.PYTHON)
+
+    grid = np.full((65, 65), -0.3)
+    grid[32, 32] = 1.3
+    diamond_square(grid, 32, -0.3, ConstantGenerator(value))
+    np.testing.assert_allclose(np.clip(grid, 0, 1), python_map.grid, atol=1e-6)
+
+
+@pytest.mark.parametrize("engine", list(HeatMap.Engine))
+def test_generate_is_reproducible(engine):
+    grids = []
+    for _ in range(2):
+        world_settings = WorldSettings(300, 200, rng=random.Random(5))
+        heat_map = HeatMap(world_settings, random.Random(5))
+        heat_map.generate(5, -0.3, 1.3, engine)
+        grids.append(heat_map.grid)
+    assert grids[0].shape == (33, 33)
+    assert grids[0].dtype == np.float32
+    assert grids[0].min() >= 0 and grids[0].max() <= 1
+    np.testing.assert_array_equal(grids[0], grids[1])
+
+
+def test_diamond_square_keeps_edges():
+    grid = np.zeros((33, 33))
+    rng = np.random.default_rng(1)
+    edges = rng.random((4, 33))
+    grid[0, :], grid[-1, :], grid[:, 0], grid[:, -1] = edges
+    grid[::32, ::32] = rng.random((2, 2))
+    expected_edges = (grid[0, :].copy(), grid[-1, :].copy(), grid[:, 0].copy(), grid[:, -1].copy())
+    diamond_square(grid, 32, -0.3, rng, keep_edges=True)
+    for edge, expected in zip((grid[0, :], grid[-1, :], grid[:, 0], grid[:, -1]), expected_edges):
+        np.testing.assert_array_equal(edge, expected)
+
+
+def test_generate_batch_equals_generate(monkeypatch):
+    # Small stacks so the maps are filled in several stacks
+    monkeypatch.setattr(heatmap, "HEAT_BATCH_BYTES", 3 * 33 * 33 * 8)
+    world_settings = WorldSettings(512, 512, rng=random.Random(0))
+    max_heats = np.linspace(1, 2, 7)
+    grids = HeatMap.generate_batch(world_settings, [random.Random(seed) for seed in range(7)], 5, -0.3, max_heats)
+    assert grids.shape == (7, 33, 33) and grids.dtype == np.float32
+    for seed, grid in enumerate(grids):
+        heat_map = HeatMap(world_settings, random.Random(seed))
+        heat_map.generate(5, -0.3, max_heats[seed])
+        np.testing.assert_array_equal(grid, heat_map.grid)
+
+
+def test_noise_far_region():
+    # The lattice only covers the queried coords, far from the origin as near it
+    noise = HeatNoise(7, -0.3, 1.3, wavelength=64)
+    x0, y0 = 400_000_000, -300_000_000
+    region = noise.region(x0, y0, x0 + 50, y0 + 40)
+    assert region.shape == (40, 50)
+    np.testing.assert_allclose(region, noise.evaluate(np.arange(x0, x0 + 50)[np.newaxis, :], np.arange(y0, y0 + 40)[:, np.newaxis]), atol=1e-12)
+    assert noise.region(x0, y0, x0, y0 + 10).shape == (10, 0)
+    assert noise.evaluate(np.array([]), np.array([])).shape == (0,)
+
+
+def test_reads_equal_the_nearest_values():
+    heat_map = HeatMap(WorldSettings(300, 200, rng=random.Random(0)), random.Random(0))
+    heat_map.generate(5, -0.3, 1.3)
+    # World sized map of the nearest values of the generated map, as stored before
+    nearest_x = np.floor(np.arange(300) / 300 * 33).astype(np.intp)
+    nearest_y = np.floor(np.arange(200) / 200 * 33).astype(np.intp)
+    expected = heat_map.grid[np.ix_(nearest_y, nearest_x)]
+    np.testing.assert_array_equal(heat_map.region(0, 0, 300, 200), expected)
+    np.testing.assert_array_equal(heat_map.region(37, 11, 150, 90), expected[11:90, 37:150])
+    assert [list(row) for row in heat_map.heatmap] == expected.tolist()
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(0, 300, 500), rng.integers(0, 200, 500)
+    np.testing.assert_array_equal(heat_map.sample(xs, ys), expected[ys, xs])
+    assert [heat_map.heat_at(x, y) for x, y in zip(xs.tolist(), ys.tolist())] == expected[ys, xs].tolist()
+
+
+def test_noise_grid_and_region_equal_points():
+    noise = HeatNoise(42, -0.3, 1.3, center=(500, 400), radius=(400, 300), wavelength=100)
+    xs = np.arange(37, 300, 7)
+    ys = np.arange(-50, 200, 11)
+    expected = noise.evaluate(xs[np.newaxis, :], ys[:, np.newaxis])
+    np.testing.assert_allclose(noise.evaluate_grid(xs, ys), expected, atol=1e-12)
+    np.testing.assert_allclose(noise.region(10, 20, 40, 35), noise.evaluate(np.arange(10, 40)[np.newaxis, :], np.arange(20, 35)[:, np.newaxis]), atol=1e-12)
+
+
+def test_heat_edit_returns_the_changed_tiles():
+    world_settings = WorldSettings(512, 512, rng=random.Random(0))
+    heat_map = HeatMap(world_settings, random.Random(0))
+    heat_map.generate(6, -0.3, 1.3)
+    before = heat_map.region(0, 0, 512, 512)
+    x0, y0, x1, y1 = heat_map.set_heat(100, 120, 180, 150, 0.5)
+    after = heat_map.region(0, 0, 512, 512)
+    assert np.all(after[120:150, 100:180] == 0.5)
+    changed_ys, changed_xs = np.nonzero(before != after)
+    assert changed_xs.min() >= x0 and changed_xs.max() < x1
+    assert changed_ys.min() >= y0 and changed_ys.max() < y1
@@ -0,0 +1,48 @@
+import random
+
+from avenuesgrid import AvenuesGrid
+from heatmap import HeatMap
+from instrumentation import EVENT_INFO, EVENT_STAGE, EventLog, Instrumentation
+from streetsblocks import StreetsBlocks
+from worldsettings import WorldSettings
+
+
+def test_stage_counters_are_added_to_the_enclosing_stage():
+    event_log = EventLog()
+    instrumentation = Instrumentation(event_log)
+    with instrumentation.stage("city"):
+        instrumentation.info("city", "Starting", size=3)
+        for cells in (5, 2):
+            with instrumentation.stage("heat"):
+                instrumentation.count("cells", cells)
+        instrumentation.count("tiles")
+    assert [(event.kind, event.stage, event.counters) for event in event_log.events] == [
+        (EVENT_INFO, "city", None),
+        (EVENT_STAGE, "heat", {"cells": 5}),
+        (EVENT_STAGE, "heat", {"cells": 2}),
+        (EVENT_STAGE, "city", {"cells": 7, "tiles": 1})
+    ]
+    assert event_log.events[0].data == {"size": 3}
+    assert instrumentation.counters == {"cells": 7, "tiles": 1}
+    assert set(event_log.durations()) == {"heat", "city"}
+
+
+def test_disabled_instrumentation_records_nothing():
+    instrumentation = Instrumentation()
+    with instrumentation.stage("heat"):
+        instrumentation.count("cells")
+    assert instrumentation.counters == {}
+
+
+def test_generation_reports_its_stages():
+    event_log = EventLog()
+    instrumentation = Instrumentation(event_log)
+    rng = random.Random(2)
+    world_settings = WorldSettings(512, 512, rng=rng, instrumentation=instrumentation)
+    heat_map = HeatMap(world_settings, rng)
+    heat_map.generate(7, -0.3, 1.3)
+    avenues_grid = AvenuesGrid(world_settings, heat_map, rng)
+    avenues_grid.generate()
+    StreetsBlocks(world_settings, avenues_grid).generate()
+    assert {"heat", "avenues", "streets"} <= set(event_log.durations())
+    assert instrumentation.counters["build_orders"] > 0 and instrumentation.counters["intersections_created"] > 0
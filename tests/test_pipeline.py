@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+
+from editor import CityEditor
+from instrumentation import EventLog, Instrumentation
+from parameters import CityParameters
+from pipeline import Pipeline, StageCache
+
+
+def test_cached_stages_equal_generated_stages(tmp_path):
+    parameters = CityParameters(320, 256, 6)
+    generated = Pipeline(4, parameters, cache_dir=str(tmp_path)).render()
+    # Memory cache of the same pipeline, then the files of a new cache
+    instrumentation = Instrumentation(EventLog())
+    pipeline = Pipeline(4, parameters, cache_dir=str(tmp_path), instrumentation=instrumentation)
+    np.testing.assert_array_equal(pipeline.render(), generated)
+    assert instrumentation.counters == {"render_cache_hits": 1}
+    streets_blocks = pipeline.streets_blocks()
+    expected = Pipeline(4, parameters, cache=StageCache()).streets_blocks()
+    np.testing.assert_array_equal(streets_blocks.patterns, expected.patterns)
+    np.testing.assert_array_equal(streets_blocks.avenues_grid.junctions, expected.avenues_grid.junctions)
+
+
+def test_only_the_modified_stages_run_again():
+    instrumentation = Instrumentation(EventLog())
+    pipeline = Pipeline(1, CityParameters(256, 256, 6), cache=StageCache(), instrumentation=instrumentation)
+    pipeline.streets_blocks()
+    pipeline.parameters.heat_factor = 1.1
+    pipeline.streets_blocks()
+    counters = instrumentation.counters
+    assert counters["heat_cache_misses"] == 1 and counters["heat_cache_hits"] == 1
+    assert counters["avenues_cache_misses"] == 2 and counters["streets_cache_misses"] == 2
+
+
+def test_cached_arrays_can_be_edited(tmp_path):
+    for cache in (StageCache(), StageCache(str(tmp_path))):
+        parameters = CityParameters(512, 512, 7)
+        original = Pipeline(3, parameters, cache=cache).streets_blocks()
+        junctions = original.avenues_grid.junctions.copy()
+        # A cache hit can be edited without modifying the cached arrays
+        streets_blocks = Pipeline(3, parameters, cache=cache).streets_blocks()
+        CityEditor(streets_blocks.avenues_grid, streets_blocks).set_heat(100, 100, 300, 300, 0)
+        assert not np.array_equal(streets_blocks.avenues_grid.junctions, junctions)
+        np.testing.assert_array_equal(Pipeline(3, parameters, cache=cache).avenues_grid().junctions, junctions)
+
+
+def test_stage_cache_is_bounded(tmp_path):
+    cache = StageCache(str(tmp_path), memory_bytes=3000, disk_bytes=3000)
+    for key in range(5):
+        cache.put(str(key), np.full(1000, key, dtype=np.uint8))
+    assert list(cache.arrays) == ["2", "3", "4"]
+    assert cache.get("0") is None
+    np.testing.assert_array_equal(cache.get("4"), np.full(1000, 4, dtype=np.uint8))
+
+
+def test_stage_cache_files_removed_by_another_process(tmp_path, monkeypatch):
+    cache = StageCache(str(tmp_path), disk_bytes=3000)
+    for key in range(2):
+        cache.put(str(key), np.full(1000, key, dtype=np.uint8))
+    scandir, remove = os.scandir, os.remove
+
+    def scandir_then_evict(path):
+        # 0.npy is removed after the listing, 1.npy between its stat and its eviction
+        entries = list(scandir(path))
+        remove(tmp_path / "0.npy")
+        return iter(entries)
+
+    def remove_twice(path):
+        remove(path)
+        remove(path)
+    monkeypatch.setattr(os, "scandir", scandir_then_evict)
+    monkeypatch.setattr(os, "remove", remove_twice)
+    cache.disk_bytes = 1500
+    cache.put("2", np.full(1000, 2, dtype=np.uint8))
+    assert sorted(os.listdir(tmp_path)) == ["2.npy"]
+
+    # A file removed between its load and its use is a miss
+    load = np.load
+
+    def load_then_evict(path):
+        array = load(path)
+        remove(path)
+        return array
+    monkeypatch.setattr(np, "load", load_then_evict)
+    cache = StageCache(str(tmp_path))
+    assert cache.get("2") is None
+    assert len(cache.arrays) == 0
+
+
+def test_stage_cache_shared_by_threads():
+    cache = StageCache(memory_bytes=64 * 1000)
+
+    def work(key: int) -> bool:
+        cache.put(str(key % 16), np.full(1000, key % 16, dtype=np.uint8))
+        array = cache.get(str((key * 7) % 16))
+        return array is None or np.all(array == (key * 7) % 16)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(work, range(2000)))
+    assert cache.cached_bytes == sum(array.nbytes for array in cache.arrays.values())
@@ -0,0 +1,109 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from avenuesgrid import INTERSECTION, JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP
+from roadgraph import RoadGraph
+
+
+def dict_adjacency(junctions: np.ndarray) -> "dict[tuple[int, int], set[tuple[int, int]]]":
+    """Neighbours of each intersection x:y as a dict of sets, the reference of RoadGraph"""
+    adjacency = {(x, y): set() for y, x in zip(*np.nonzero(junctions & INTERSECTION))}
+    for x, y in adjacency:
+        for junction, (dx, dy), back in ((JUNCTION_RIGHT, (1, 0), JUNCTION_LEFT), (JUNCTION_BOTTOM, (0, 1), JUNCTION_UP)):
+            neighbour = (x + dx, y + dy)
+            if neighbour in adjacency and (junctions[y, x] & junction or junctions[neighbour[1], neighbour[0]] & back):
+                adjacency[(x, y)].add(neighbour)
+                adjacency[neighbour].add((x, y))
+    return adjacency
+
+
+def bfs(adjacency: dict, sources: list) -> dict:
+    distances = {source: 0 for source in sources}
+    queue = deque(sources)
+    while queue:
+        node = queue.popleft()
+        for neighbour in adjacency[node]:
+            if neighbour not in distances:
+                distances[neighbour] = distances[node] + 1
+                queue.append(neighbour)
+    return distances
+
+
+@pytest.fixture
+def cut_avenues(make_city):
+    """Avenues grid of a city with a few avenues cut, so it has several connected components"""
+    _, _, avenues_grid, _ = make_city(900, 900, 2, scale=9)
+    height, width = avenues_grid.junctions.shape
+    avenues_grid.junctions[:, width // 3] = 0
+    avenues_grid.junctions[height // 2, :] = 0
+    avenues_grid.junctions[::9, ::4] &= ~np.uint8(INTERSECTION)
+    return avenues_grid
+
+
+def test_road_graph_equals_dict_adjacency(cut_avenues):
+    road_graph = RoadGraph.from_avenues(cut_avenues)
+    adjacency = dict_adjacency(cut_avenues.junctions)
+    nodes = [(vertex % road_graph.vertices_x_count, vertex // road_graph.vertices_x_count) for vertex in road_graph.vertices.tolist()]
+    assert sorted(nodes) == sorted(adjacency)
+    assert road_graph.edge_count == sum(len(neighbours) for neighbours in adjacency.values()) // 2
+    for node, (x, y) in enumerate(nodes):
+        assert sorted(nodes[target] for target in road_graph.neighbours(node).tolist()) == sorted(adjacency[(x, y)])
+        assert road_graph.node_at(x, y) == node
+    grid_settings = cut_avenues.world_settings.grid_settings
+    np.testing.assert_array_equal(road_graph.xs, [x * grid_settings.cellsize + grid_settings.offset.x for x, _ in nodes])
+    # The cut column has no intersection
+    assert road_graph.node_at(cut_avenues.junctions.shape[1] // 3, 0) == -1
+
+
+def test_connected_components_and_bfs_equal_dict_adjacency(cut_avenues):
+    road_graph = RoadGraph.from_avenues(cut_avenues)
+    adjacency = dict_adjacency(cut_avenues.junctions)
+    nodes = [(vertex % road_graph.vertices_x_count, vertex // road_graph.vertices_x_count) for vertex in road_graph.vertices.tolist()]
+
+    count, labels = road_graph.connected_components()
+    components = {}
+    reference_count = 0
+    for node in adjacency:
+        if node not in components:
+            components.update(dict.fromkeys(bfs(adjacency, [node]), reference_count))
+            reference_count += 1
+    assert count == reference_count > 1
+    # Same partition of the nodes
+    assert len(set(zip(labels.tolist(), [components[node] for node in nodes]))) == count
+
+    sources = [0, road_graph.node_count // 2]
+    distances = bfs(adjacency, [nodes[source] for source in sources])
+    expected = [distances.get(node, -1) for node in nodes]
+    np.testing.assert_array_equal(road_graph.bfs_distances(sources), expected)
+    np.testing.assert_array_equal(road_graph.bfs_distances(sources, max_distance=5), [d if d <= 5 else -1 for d in expected])
+
+
+def test_bfs_rejects_out_of_range_sources(cut_avenues):
+    road_graph = RoadGraph.from_avenues(cut_avenues)
+    for sources in ([-1], [road_graph.node_count], [0, road_graph.node_count + 5]):
+        with pytest.raises(ValueError):
+            road_graph.bfs_distances(sources)
+    np.testing.assert_array_equal(road_graph.bfs_distances([]), np.full(road_graph.node_count, -1))
+
+
+def test_node_at_rejects_out_of_range_vertices(cut_avenues):
+    road_graph = RoadGraph.from_avenues(cut_avenues)
+    height, width = cut_avenues.junctions.shape
+    y, x = divmod(int(road_graph.vertices[-1]), width)
+    assert road_graph.node_at(x, y) == road_graph.node_count - 1
+    # Out of range coords would alias other vertices of the flat junctions, ex: x + width:y - 1 is x:y
+    for out_x, out_y in ((x + width, y - 1), (-1, 1), (width, 0), (0, -1), (0, height)):
+        with pytest.raises(ValueError):
+            road_graph.node_at(out_x, out_y)
+
+
+def test_save_and_load(cut_avenues, tmp_path):
+    road_graph = RoadGraph.from_avenues(cut_avenues)
+    path = str(tmp_path / "graph.npz")
+    road_graph.save(path)
+    loaded = RoadGraph.load(path)
+    assert (loaded.vertices_x_count, loaded.vertices_y_count) == (road_graph.vertices_x_count, road_graph.vertices_y_count)
+    for name in ("vertices", "xs", "ys", "offsets", "targets"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(road_graph, name))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from avenuesgrid import AvenuesGrid
+from streetsblocks import NO_STREETS, StreetsBlocks, StreetsPattern
+from utils import Vec2
+
+
+def cell_by_cell_patterns(streets_blocks: StreetsBlocks) -> np.ndarray:
+    """Patterns of the cells one by one from the intersections view, the reference of StreetsBlocks.generate"""
+    avenues_grid = streets_blocks.avenues_grid
+    intersections = avenues_grid.intersections
+    patterns = np.full(streets_blocks.patterns.shape, NO_STREETS, dtype=np.uint8)
+    for y in range(patterns.shape[0]):
+        for x in range(patterns.shape[1]):
+            avenues = [False, False, False, False]
+            up_left_index = avenues_grid.from_grid_to_index(Vec2(x, y))
+            if up_left_index in intersections:
+                avenues[0] = intersections[up_left_index].rightjunction
+                avenues[3] = intersections[up_left_index].bottomjunction
+            bottom_right_index = avenues_grid.from_grid_to_index(Vec2(x + 1, y + 1))
+            if bottom_right_index in intersections:
+                avenues[1] = intersections[bottom_right_index].upjunction
+                avenues[2] = intersections[bottom_right_index].leftjunction
+            patterns[y, x] = StreetsBlocks.pattern_of(tuple(avenues))
+    return patterns
+
+
+@pytest.mark.parametrize("engine", list(AvenuesGrid.Engine))
+def test_patterns_equal_cell_by_cell(make_city, engine):
+    _, _, _, streets_blocks = make_city(640, 480, 2, engine=engine)
+    np.testing.assert_array_equal(streets_blocks.patterns, cell_by_cell_patterns(streets_blocks))
+
+
+def test_update_region_equals_generate(make_city):
+    world_settings, heat_map, avenues_grid, streets_blocks = make_city(640, 640, 4)
+    heat_map.set_heat(200, 200, 400, 400, 0)
+    avenues_grid.regenerate_region(10, 10, 25, 25)
+    streets_blocks.update_region(9, 9, 25, 25)
+    expected = StreetsBlocks(world_settings, avenues_grid)
+    expected.generate()
+    np.testing.assert_array_equal(streets_blocks.patterns, expected.patterns)
+
+
+def test_streets_patterns_view(make_city):
+    _, _, _, streets_blocks = make_city(256, 256, 1)
+    view = streets_blocks.streets_patterns
+    assert len(view) == int(np.count_nonzero(streets_blocks.patterns != NO_STREETS))
+    index = next(iter(view))
+    view[index] = StreetsPattern(StreetsPattern.StreetPattern.L_LEFT_TOP)
+    assert view[index].street_pattern == StreetsPattern.StreetPattern.L_LEFT_TOP
+    del view[index]
+    assert index not in view
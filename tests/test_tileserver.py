@@ -0,0 +1,54 @@
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+from export import render_tile
+from parameters import CityParameters
+from tileserver import TileServer
+
+
+async def request(port: int, line: str) -> bytes:
+    """Sends one request line, returns the whole response (until the server closes the connection)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{line}\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), 30)
+    writer.close()
+    return response
+
+
+def serve(tile_server: TileServer, *lines: str) -> "list[bytes]":
+    async def run() -> "list[bytes]":
+        server = await asyncio.start_server(tile_server.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [await request(port, line) for line in lines]
+    return asyncio.run(run())
+
+
+def test_tiles_equal_render_tile():
+    tile_server = TileServer(CityParameters(300, 200, 6), workers=2)
+    response, not_found = serve(tile_server, "GET /5/1/1/0.png HTTP/1.0", "GET /5/9/0/0.png HTTP/1.0")
+    headers, body = response.split(b"\r\n\r\n", 1)
+    assert headers.startswith(b"HTTP/1.1 200 OK") and b"Connection: close" in headers
+    with Image.open(io.BytesIO(body)) as image:
+        np.testing.assert_array_equal(np.array(image), render_tile(tile_server._generate_city(5), 1, 1, 0, tile_server.max_zoom))
+    assert not_found.startswith(b"HTTP/1.1 404 Not Found")
+
+
+def test_unknown_method_closes_the_connection():
+    response, = serve(TileServer(CityParameters(300, 200, 6)), "POST /5/0/0/0.png HTTP/1.0")
+    assert response.startswith(b"HTTP/1.1 405 Method Not Allowed") and b"Connection: close" in response
+
+
+def test_failure_answers_internal_server_error(monkeypatch, caplog):
+    tile_server = TileServer(CityParameters(300, 200, 6))
+
+    def fail(seed: int):
+        raise RuntimeError("generation failed")
+    monkeypatch.setattr(tile_server, "_generate_city", fail)
+    response, = serve(tile_server, "GET /5/0/0/0.png HTTP/1.1")
+    assert response.startswith(b"HTTP/1.1 500 Internal Server Error") and b"Connection: close" in response
+    assert "generation failed" in caplog.text
@@ -0,0 +1,15 @@
+from utils import DIRECTION_OFFSETS, LEFT_OF, REVERSE, RIGHT_OF, Vec2, Vec2Direction
+
+
+def test_direction_tables_follow_the_direction_order():
+    # Directions turn counterclockwise: UP, LEFT, DOWN, RIGHT
+    for direction in Vec2Direction:
+        assert LEFT_OF[direction] == Vec2.left_of(direction) == (direction + 1) % 4
+        assert RIGHT_OF[direction] == Vec2.right_of(direction) == (direction - 1) % 4
+        assert REVERSE[direction] == Vec2.reverse(direction) == (direction + 2) % 4
+        offset = Vec2.from_direction(direction)
+        reverse_offset = Vec2.from_direction(REVERSE[direction])
+        assert (offset.x, offset.y) == DIRECTION_OFFSETS[direction]
+        assert (offset.x + reverse_offset.x, offset.y + reverse_offset.y) == (0, 0)
+    assert DIRECTION_OFFSETS[Vec2Direction.UP] == (0, -1)
+    assert DIRECTION_OFFSETS[Vec2Direction.RIGHT] == (1, 0)
@@ -0,0 +1,112 @@
+from enum import IntEnum
+
+import numpy as np
+
+from avenuesgrid import JUNCTION_BOTTOM, JUNCTION_LEFT, JUNCTION_RIGHT, JUNCTION_UP, AvenuesGrid
+from stamps import AVENUE_INTERSECTION, AVENUE_JUNCTION, EMPTY_STREETS, STREET, avenue_templates, street_templates
+from streetsblocks import NO_STREETS, StreetsBlocks
+
+
+class TileType(IntEnum):
+    BUILDING = 0
+    STREET = 1
+    AVENUE = 2
+    INTERSECTION = 3
+
+
+class TileQuery:
+    """
+    TileQuery
+
+    Answers the type of world tiles (TileType) from the generated grid, without rendering the city:
+    the tile is located in the lattice of the avenues templates and of the streets templates (see stamps.py),
+    its type is read in the template of its vertex junctions or of its block pattern.
+    Avenues leaving the grid go up to the world edges, as drawn by the Printer.
+
+    tile_at answers one tile, types answers arrays of coords in one vectorized call.
+    Queries read the current junctions and patterns, they follow the edits of the city.
+    Tiles outside of the world are BUILDING.
+    """
+    def __init__(self, avenues_grid: AvenuesGrid, streets_blocks: StreetsBlocks) -> None:
+        self.world_settings = avenues_grid.world_settings
+        self.avenues_grid = avenues_grid
+        self.streets_blocks = streets_blocks
+        cellsize = self.world_settings.grid_settings.cellsize
+        labels_types = np.zeros(AVENUE_INTERSECTION + 1, dtype=np.uint8)
+        labels_types[AVENUE_JUNCTION] = TileType.AVENUE
+        labels_types[AVENUE_INTERSECTION] = TileType.INTERSECTION
+        self._avenue_types = labels_types[avenue_templates(cellsize)]
+        self._street_types = np.where(street_templates(cellsize) == STREET, TileType.STREET, TileType.BUILDING).astype(np.uint8)
+
+    def tile_at(self, x: int, y: int) -> TileType:
+        """Returns the type of the world tile x:y"""
+        grid_settings = self.world_settings.grid_settings
+        cellsize = grid_settings.cellsize
+        offset = grid_settings.offset
+        i, u = divmod(x - offset.x + 1, cellsize)
+        j, v = divmod(y - offset.y + 1, cellsize)
+        if not (0 <= i <= grid_settings.width and 0 <= j <= grid_settings.height) or not (0 <= x < self.world_settings.width and 0 <= y < self.world_settings.height):
+            # Around the grid: avenues leaving the grid or nothing
+            return TileType(int(self.types(np.array([x]), np.array([y]))[0]))
+        tile_type = int(self._avenue_types[self.avenues_grid.junctions[j, i], v, u])
+        if tile_type == TileType.BUILDING:
+            i, u = divmod(x - offset.x, cellsize)
+            j, v = divmod(y - offset.y, cellsize)
+            if 0 <= i < grid_settings.width and 0 <= j < grid_settings.height:
+                pattern = int(self.streets_blocks.patterns[j, i])
+                tile_type = int(self._street_types[EMPTY_STREETS if pattern == NO_STREETS else pattern, v, u])
+        return TileType(tile_type)
+
+    def types(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns the TileType of the world tiles of coords xs:ys (integer arrays of same shape) as a uint8 array"""
+        grid_settings = self.world_settings.grid_settings
+        cellsize = grid_settings.cellsize
+        offset = grid_settings.offset
+        junctions = self.avenues_grid.junctions
+        patterns = self.streets_blocks.patterns
+        xs = np.asarray(xs, dtype=np.intp)
+        ys = np.asarray(ys, dtype=np.intp)
+        types = np.zeros(np.broadcast(xs, ys).shape, dtype=np.uint8)
+        xs, ys = np.broadcast_arrays(xs, ys)
+
+        # Avenues: templates start 1 tile up and left of their vertex
+        i, u = np.divmod(xs - (offset.x - 1), cellsize)
+        j, v = np.divmod(ys - (offset.y - 1), cellsize)
+        inside = (i >= 0) & (i <= grid_settings.width) & (j >= 0) & (j <= grid_settings.height)
+        types[inside] = self._avenue_types[junctions[j[inside], i[inside]], v[inside], u[inside]]
+
+        # Streets: templates start at the top left vertex of their block
+        i, u = np.divmod(xs - offset.x, cellsize)
+        j, v = np.divmod(ys - offset.y, cellsize)
+        inside = (i >= 0) & (i < grid_settings.width) & (j >= 0) & (j < grid_settings.height)
+        cell_patterns = patterns[j[inside], i[inside]]
+        cell_patterns = np.where(cell_patterns == NO_STREETS, EMPTY_STREETS, cell_patterns)
+        types[inside] |= self._street_types[cell_patterns, v[inside], u[inside]]
+
+        self._edge_avenues(xs, ys, types)
+        types[(xs < 0) | (xs >= self.world_settings.width) | (ys < 0) | (ys >= self.world_settings.height)] = TileType.BUILDING
+        return types
+
+    def _edge_avenues(self, xs: np.ndarray, ys: np.ndarray, types: np.ndarray) -> None:
+        """Marks the tiles of the junctions leaving the grid, drawn from the edge vertices up to the world edges"""
+        grid_settings = self.world_settings.grid_settings
+        cellsize = grid_settings.cellsize
+        offset = grid_settings.offset
+        junctions = self.avenues_grid.junctions
+        last_x = grid_settings.width * cellsize + offset.x
+        last_y = grid_settings.height * cellsize + offset.y
+        # Rows (then columns) of vertices each tile can be next to: the avenue covers the vertex and the tile before it
+        j, v = np.divmod(ys - offset.y + 1, cellsize)
+        on_row = (v <= 1) & (j >= 0) & (j <= grid_settings.height)
+        j = np.clip(j, 0, grid_settings.height)
+        i, u = np.divmod(xs - offset.x + 1, cellsize)
+        on_column = (u <= 1) & (i >= 0) & (i <= grid_settings.width)
+        i = np.clip(i, 0, grid_settings.width)
+        edges = (
+            (on_row & (xs > last_x), junctions[j, -1] & JUNCTION_RIGHT),
+            (on_row & (xs < offset.x - 1), junctions[j, 0] & JUNCTION_LEFT),
+            (on_column & (ys > last_y), junctions[-1, i] & JUNCTION_BOTTOM),
+            (on_column & (ys < offset.y - 1), junctions[0, i] & JUNCTION_UP)
+        )
+        for outside, junction in edges:
+            types[outside & (junction != 0)] = TileType.AVENUE
@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import io
+import logging
+import re
+
+from PIL import Image
+
+from display import Printer
+from export import render_tile, tile_max_zoom
+from parameters import CityParameters
+from pipeline import Pipeline, StageCache
+
+
+"""
+Tile server
+
+A local HTTP server of PNG tiles of cities, for map viewers: GET /{seed}/{z}/{x}/{y}.png
+Every city is generated with the parameters of the server and the seed of the request.
+
+Tiles are TILE_SIZE pixels wide (export.py). At the deepest zoom (max_zoom), a pixel is a world tile,
+each zoom level above covers twice more world tiles per pixel (nearest sampling), zoom 0 is one tile.
+Zoomed out tiles are rendered from the city data at their pixels only (see export.render_tile).
+
+Cities are generated when a tile of their seed is first requested, their data (Pipeline stages) and the PNG of
+the rendered tiles are kept in LRU caches. Generation and rendering run in a thread pool so the event loop
+keeps accepting requests; concurrent requests of a city or of a tile wait for the same work.
+The generations of different cities share one StageCache, which locks its accesses (see pipeline.py).
+A request that fails is logged and answered with a 500 error.
+
+Ex: python tileserver.py --width 4096 --height 4096 --port 8080
+    curl http://127.0.0.1:8080/42/0/0/0.png
+"""
+
+
+TILE_PATH = re.compile(r"^/(-?\d+)/(\d+)/(\d+)/(\d+)\.png$")
+
+logger = logging.getLogger(__name__)
+
+
+class TileServer:
+    """
+    TileServer
+
+    Serves the tiles of the cities generated with parameters, see the module description.
+    max_cities cities are kept in memory, the rendered tiles are kept up to tiles_bytes.
+    """
+    def __init__(self, parameters: CityParameters = None, max_cities: int = 8, tiles_bytes: int = 64 * 1024 * 1024, workers: int = None) -> None:
+        self.parameters = parameters if parameters is not None else CityParameters()
+        self.max_zoom = tile_max_zoom(self.parameters.width, self.parameters.height)
+        self.max_cities = max_cities
+        self.tiles_bytes = tiles_bytes
+        self.cities: "OrderedDict[int, Printer]" = OrderedDict()
+        self.tiles: "OrderedDict[tuple[int, int, int, int], bytes]" = OrderedDict()
+        self.cached_bytes = 0
+        self.stage_cache = StageCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending: "dict[tuple, asyncio.Future]" = dict()
+
+    async def tile(self, seed: int, z: int, x: int, y: int) -> bytes:
+        """Returns the PNG of the tile x:y of zoom z of the city seed, None if there is no such tile"""
+        if z > self.max_zoom or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+            return None
+        key = (seed, z, x, y)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        png = await self._once(("tile",) + key, lambda: self._render_tile(seed, z, x, y))
+        self._cache_tile(key, png)
+        return png
+
+    async def city(self, seed: int) -> Printer:
+        if seed in self.cities:
+            self.cities.move_to_end(seed)
+            return self.cities[seed]
+        printer = await self._once(("city", seed), lambda: self._generate_city(seed), run=True)
+        self.cities[seed] = printer
+        while len(self.cities) > self.max_cities:
+            self.cities.popitem(last=False)
+        return printer
+
+    async def _once(self, key: tuple, work, run: bool = False):
+        """Awaits work (a coroutine function, or a function run in the executor if run), shared by the concurrent callers of key"""
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, work) if run else asyncio.ensure_future(work())
+        self._pending[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+
+    def _generate_city(self, seed: int) -> Printer:
+        pipeline = Pipeline(seed, self.parameters, cache=self.stage_cache)
+        streets_blocks = pipeline.streets_blocks()
+        avenues_grid = streets_blocks.avenues_grid
+        printer = Printer(streets_blocks.world_settings)
+        printer.addheat(avenues_grid.heatmap)
+        printer.addgrid()
+        printer.addavenues(avenues_grid)
+        printer.addstreets(streets_blocks)
+        return printer
+
+    async def _render_tile(self, seed: int, z: int, x: int, y: int) -> bytes:
+        printer = await self.city(seed)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.render_tile, printer, z, x, y)
+
+    def render_tile(self, printer: Printer, z: int, x: int, y: int) -> bytes:
+        """Renders the tile x:y of zoom z of the city of printer as PNG"""
+        png = io.BytesIO()
+        Image.fromarray(render_tile(printer, z, x, y, self.max_zoom)).save(png, format="PNG", compress_level=1)
+        return png.getvalue()
+
+    def _cache_tile(self, key: "tuple[int, int, int, int]", png: bytes) -> None:
+        if key in self.tiles:
+            return
+        self.tiles[key] = png
+        self.cached_bytes += len(png)
+        while self.cached_bytes > self.tiles_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves the HTTP/1.1 requests of a connection (keep alive)"""
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request.decode("latin-1").split()
+                keep_alive = len(parts) == 3 and parts[2] == "HTTP/1.1"
+                if len(parts) < 2 or parts[0] not in ("GET", "HEAD"):
+                    await self._respond(writer, 405, "Method Not Allowed", b"", keep_alive)
+                else:
+                    match = TILE_PATH.match(parts[1].split("?")[0])
+                    try:
+                        png = await self.tile(*(int(group) for group in match.groups())) if match else None
+                    except Exception:
+                        logger.exception("Failed to serve %s", parts[1])
+                        # The connection is closed after the error
+                        await self._respond(writer, 500, "Internal Server Error", b"", False)
+                        break
+                    if png is None:
+                        await self._respond(writer, 404, "Not Found", b"", keep_alive)
+                    else:
+                        await self._respond(writer, 200, "OK", png if parts[0] == "GET" else b"", keep_alive, "image/png", len(png))
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, reason: str, body: bytes, keep_alive: bool,
+                       content_type: str = "text/plain", length: int = None) -> None:
+        headers = [
+            f"HTTP/1.1 {status} {reason}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {length if length is not None else len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            "Cache-Control: max-age=3600",
+        ]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv: "list[str]" = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve PNG tiles of cities: GET /{seed}/{z}/{x}/{y}.png")
+    parser.add_argument("--width", type=int, default=CityParameters.width)
+    parser.add_argument("--height", type=int, default=CityParameters.height)
+    parser.add_argument("--scale", type=int, default=CityParameters.scale, help="heat map scale, the generated map size is 2^scale+1")
+    parser.add_argument("--min-heat", type=float, default=CityParameters.min_heat)
+    parser.add_argument("--max-heat", type=float, default=CityParameters.max_heat)
+    parser.add_argument("--heat-factor", type=float, default=CityParameters.heat_factor)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    parameters = CityParameters(args.width, args.height, args.scale, args.min_heat, args.max_heat, args.heat_factor)
+    tile_server = TileServer(parameters)
+    print(f"Serving tiles of zoom 0 to {tile_server.max_zoom} on http://{args.host}:{args.port}/{{seed}}/{{z}}/{{x}}/{{y}}.png")
+    asyncio.run(tile_server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
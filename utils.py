@@ -8,39 +8,35 @@ class Vec2Direction(IntEnum):
     RIGHT = 3
 
 
+# Lookup tables indexed by Vec2Direction: offsets of a step in the direction (x, y), and the directions on its left, right and back
+DIRECTION_OFFSETS = ((0, -1), (-1, 0), (0, 1), (1, 0))
+LEFT_OF = (Vec2Direction.LEFT, Vec2Direction.DOWN, Vec2Direction.RIGHT, Vec2Direction.UP)
+RIGHT_OF = (Vec2Direction.RIGHT, Vec2Direction.UP, Vec2Direction.LEFT, Vec2Direction.DOWN)
+REVERSE = (Vec2Direction.DOWN, Vec2Direction.RIGHT, Vec2Direction.UP, Vec2Direction.LEFT)
+
+
 class Vec2:
+    __slots__ = ("x", "y")
+
     def __init__(self, x: int = 0, y: int = 0) -> None:
         self.x = x
         self.y = y
 
     @classmethod
     def from_direction(cls, direction: Vec2Direction) -> "Vec2":
-        if direction == Vec2Direction.UP:
-            return Vec2(0, -1)
-        elif direction == Vec2Direction.DOWN:
-            return Vec2(0, 1)
-        elif direction == Vec2Direction.LEFT:
-            return Vec2(-1, 0)
-        else:
-            return Vec2(1, 0)
+        return Vec2(*DIRECTION_OFFSETS[direction])
 
     @classmethod
     def left_of(cls, direction: Vec2Direction) -> Vec2Direction:
-        new_dir = direction + 1
-        if new_dir > Vec2Direction.RIGHT:
-            new_dir = Vec2Direction.UP
-        return new_dir
+        return LEFT_OF[direction]
 
     @classmethod
     def right_of(cls, direction: Vec2Direction) -> Vec2Direction:
-        new_dir = direction - 1
-        if new_dir < Vec2Direction.UP:
-            new_dir = Vec2Direction.RIGHT
-        return new_dir
+        return RIGHT_OF[direction]
 
     @classmethod
     def reverse(cls, direction: Vec2Direction) -> Vec2Direction:
-        return (direction + 2) % (Vec2Direction.RIGHT + 1)
+        return REVERSE[direction]
 
     def __mul__(self, digit: int):
         return Vec2(self.x * digit, self.y * digit)
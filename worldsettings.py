@@ -2,6 +2,7 @@ import math
 import random
 from dataclasses import dataclass
 
+from instrumentation import DISABLED_INSTRUMENTATION, Instrumentation
 from utils import Vec2
 
 
@@ -30,22 +31,36 @@ GRID_MAX_OFFSET = 5
 
 
 class WorldSettings:
-    def __init__(self, width: int, height: int) -> None:
+    def __init__(self, width: int, height: int, grid_settings: "GridSettings" = None, rng: random.Random = None,
+                 instrumentation: Instrumentation = None) -> None:
+        """
+        Settings of a world of size width x height.
+        The grid is generated from the world size unless grid_settings is given.
+        rng is used for the random grid offset, the global random module by default.
+        instrumentation receives the events of the generation of this world, disabled by default.
+        """
         self.width = width
         self.height = height
-        print(f"World size: {self.width}x{self.height}")
+        self.rng = rng if rng is not None else random
+        self.instrumentation = instrumentation if instrumentation is not None else DISABLED_INSTRUMENTATION
+        self.instrumentation.info("world", f"World size: {self.width}x{self.height}", width=width, height=height)
 
+        if grid_settings is None:
+            grid_settings = self._generate_grid_settings()
+        self.grid_settings = grid_settings
+
+    def _generate_grid_settings(self) -> "GridSettings":
         grid_width = math.floor((self.width - GRID_CELL_SIZE * 2) / GRID_CELL_SIZE)
         grid_height = math.floor((self.height - GRID_CELL_SIZE * 2) / GRID_CELL_SIZE)
-        print(f"Grid generated: {grid_width}x{grid_height}")
+        self.instrumentation.info("world", f"Grid generated: {grid_width}x{grid_height}", grid_width=grid_width, grid_height=grid_height)
 
         grid_offset_x = math.floor((self.width - (grid_width * GRID_CELL_SIZE)) / 2)
         grid_offset_y = math.floor((self.height - (grid_height * GRID_CELL_SIZE)) / 2)
-        grid_offset_x = random.randint(grid_offset_x - GRID_MAX_OFFSET, grid_offset_x + GRID_MAX_OFFSET)
-        grid_offset_y = random.randint(grid_offset_y - GRID_MAX_OFFSET, grid_offset_y + GRID_MAX_OFFSET)
-        print(f"Grid offset: {grid_offset_x},{grid_offset_y}")
+        grid_offset_x = self.rng.randint(grid_offset_x - GRID_MAX_OFFSET, grid_offset_x + GRID_MAX_OFFSET)
+        grid_offset_y = self.rng.randint(grid_offset_y - GRID_MAX_OFFSET, grid_offset_y + GRID_MAX_OFFSET)
+        self.instrumentation.info("world", f"Grid offset: {grid_offset_x},{grid_offset_y}", offset_x=grid_offset_x, offset_y=grid_offset_y)
 
-        self.grid_settings = GridSettings(GRID_CELL_SIZE, grid_width, grid_height, Vec2(grid_offset_x, grid_offset_y))
+        return GridSettings(GRID_CELL_SIZE, grid_width, grid_height, Vec2(grid_offset_x, grid_offset_y))
 
     def from_grid_to_world(self, vertex: Vec2) -> Vec2:
         """Convert coords of a vertex in the grid into a coords in the world"""